@@ -2,7 +2,7 @@ import logging
 import chromadb
 # Import the base class for custom embedding functions from ChromaDB utils
 from chromadb.utils.embedding_functions import EmbeddingFunction
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from typing import List # Needed for type hinting in the wrapper
 
 # Import configuration constants from the local package config file
@@ -13,23 +13,43 @@ except ImportError:
     # Fallback import if running as a standalone script or not in a package
     import config
 
+try:
+    from .embedding_backends import EmbeddingBackend, create_embedding_backend, collection_name_for_backend
+except ImportError:
+    from embedding_backends import EmbeddingBackend, create_embedding_backend, collection_name_for_backend
+
+try:
+    from .vector_index import QuantizedVectorIndex
+    from .query_embedding_cache import QueryEmbeddingCache
+    from .result_cache import CollectionVersion, RetrievalResultCache
+except ImportError:
+    from vector_index import QuantizedVectorIndex
+    from query_embedding_cache import QueryEmbeddingCache
+    from result_cache import CollectionVersion, RetrievalResultCache
+
 
 logger = logging.getLogger(__name__)
 
+# Query embedding cache of the configured backend, created by initialize_rag_components
+_query_embedding_cache = None
+# Retrieval result cache of the configured collection, created by initialize_rag_components
+_result_cache = None
+
 # Define a custom wrapper class that inherits from ChromaDB's EmbeddingFunction
 # This ensures the __call__ method has the signature ChromaDB expects.
 class ChromaEmbeddingFunctionWrapper(EmbeddingFunction):
     """
-    A wrapper to make a LangChain Embedding model compatible with ChromaDB's
-    expected EmbeddingFunction signature.
+    A wrapper to make an embedding backend (Google or local, see embedding_backends.py)
+    or any LangChain Embedding model compatible with ChromaDB's expected
+    EmbeddingFunction signature.
 
     ChromaDB's EmbeddingFunction expects a __call__ method that takes
     'input: List[str]' and returns 'List[List[float]]'.
     """
-    def __init__(self, langchain_embeddings: GoogleGenerativeAIEmbeddings):
+    def __init__(self, langchain_embeddings: EmbeddingBackend):
         # Store the actual LangChain embeddings instance
         self._langchain_embeddings = langchain_embeddings
-        logger.info("ChromaEmbeddingFunctionWrapper initialized with LangChain embeddings.")
+        logger.info(f"ChromaEmbeddingFunctionWrapper initialized with {type(langchain_embeddings).__name__}.")
 
     def __call__(self, input: List[str]) -> List[List[float]]:
         """
@@ -38,25 +58,27 @@ class ChromaEmbeddingFunctionWrapper(EmbeddingFunction):
         instance's method that handles batch embedding (typically embed_documents).
         """
         # Call the LangChain embeddings model's method that handles a list of texts
-        # GoogleGenerativeAIEmbeddings has an embed_documents method for this.
+        # Both the LangChain models and the local backend have an embed_documents method for this.
         logger.debug(f"ChromaEmbeddingFunctionWrapper calling embed_documents for {len(input)} texts.")
         return self._langchain_embeddings.embed_documents(input)
 
 
 def initialize_rag_components():
     """
-    Initializes core RAG components: ChromaDB collection, Google Generative AI Embeddings,
-    and Google Generative AI Chat Model.
+    Initializes core RAG components: ChromaDB collection, the configured embedding
+    backend (Google Generative AI or local) and Google Generative AI Chat Model.
 
     Returns:
         tuple: (chroma_collection, rag_llm)
-               chroma_collection: The initialized ChromaDB collection object.
+               chroma_collection: The initialized ChromaDB collection object
+                                  (or QuantizedVectorIndex when VECTOR_BACKEND is 'quantized').
                rag_llm: The initialized LangChain ChatGoogleGenerativeAI LLM for RAG.
 
     Raises:
         ValueError: If GOOGLE_API_KEY is not found in configuration.
         Exception: Catches and re-raises any other errors during initialization.
     """
+    global _query_embedding_cache, _result_cache
     logger.info("Initializing RAG components...")
 
     # Check if the Google API key is available from the config module
@@ -65,32 +87,63 @@ def initialize_rag_components():
         raise ValueError("GOOGLE_API_KEY not found in configuration.")
 
     try:
-        # Initialize Embeddings model using LangChain
+        # Initialize the embedding backend selected in config (Google API or local LSA model)
         # This is the instance we will wrap to make it ChromaDB-compatible
-        langchain_embeddings_instance = GoogleGenerativeAIEmbeddings(
-            model=config.EMBEDDING_MODEL,
-            google_api_key=config.GOOGLE_API_KEY
+        embedding_backend = create_embedding_backend(
+            config.EMBEDDING_BACKEND,
+            model_name=config.EMBEDDING_MODEL,
+            api_key=config.GOOGLE_API_KEY,
+            local_model_path=config.LOCAL_EMBEDDING_MODEL_PATH
         )
-        logger.info(f"Initialized LangChain Embedding Model: {config.EMBEDDING_MODEL}")
+        logger.info(f"Initialized '{config.EMBEDDING_BACKEND}' embedding backend: {embedding_backend.name}")
 
-        # Wrap the LangChain embeddings instance with the custom ChromaDB wrapper
+        # Wrap the embedding backend with the custom ChromaDB wrapper
         # This wrapped instance conforms to the signature ChromaDB expects
-        chroma_embedding_function = ChromaEmbeddingFunctionWrapper(langchain_embeddings_instance)
-        logger.info("Wrapped LangChain embeddings for ChromaDB compatibility.")
-
+        chroma_embedding_function = ChromaEmbeddingFunctionWrapper(embedding_backend)
+        logger.info("Wrapped embeddings for ChromaDB compatibility.")
+
+        # Queries are embedded once here and passed to the collection as query_embeddings
+        _query_embedding_cache = QueryEmbeddingCache(
+            embedding_backend.embed_query,
+            model_name=embedding_backend.name,
+            max_size=config.QUERY_EMBEDDING_CACHE_SIZE,
+            ttl_seconds=config.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+            embed_queries=embedding_backend.embed_queries
+        )
 
-        # Initialize ChromaDB Persistent Client
-        client = chromadb.PersistentClient(path=config.PERSIST_DIRECTORY)
 
-        # Get or create the collection, passing the WRAPPED embedding function
-        # This is the crucial step to resolve the signature error.
-        collection = client.get_or_create_collection(
-             name=config.COLLECTION_NAME,
-             embedding_function=chroma_embedding_function # Use the wrapped function here
+        if config.VECTOR_BACKEND == 'quantized':
+            # In-process quantized index with the same query interface as a collection
+            collection = QuantizedVectorIndex(
+                config.VECTOR_INDEX_PATH,
+                embedding_function=chroma_embedding_function,
+                nprobe=config.VECTOR_INDEX_NPROBE
+            )
+            logger.info(f"Initialized quantized vector index: {config.VECTOR_INDEX_PATH} ({collection.count()} documents).")
+        else:
+            # Initialize ChromaDB Persistent Client
+            client = chromadb.PersistentClient(path=config.PERSIST_DIRECTORY)
+
+            # Get or create the collection, passing the WRAPPED embedding function
+            # This is the crucial step to resolve the signature error.
+            # Each embedding backend has its own collection (vector spaces are not compatible)
+            collection_name = collection_name_for_backend(config.COLLECTION_NAME, config.EMBEDDING_BACKEND)
+            collection = client.get_or_create_collection(
+                 name=collection_name,
+                 embedding_function=chroma_embedding_function # Use the wrapped function here
+            )
+            logger.info(f"Initialized ChromaDB Client: {config.PERSIST_DIRECTORY}, Collection: {collection_name}")
+            collection_count = collection.count()
+            logger.info(f"ChromaDB collection count: {collection_count} documents.")
+
+        # Retrieval results are reused until a writer bumps the collection version
+        collection_version = CollectionVersion(config.COLLECTION_VERSION_PATH)
+        _result_cache = RetrievalResultCache(
+            collection_version.current,
+            namespace=f"{config.VECTOR_BACKEND}:{collection_name_for_backend(config.COLLECTION_NAME, config.EMBEDDING_BACKEND)}:{embedding_backend.name}",
+            max_size=config.RESULT_CACHE_SIZE,
+            sqlite_path=config.RESULT_CACHE_SQLITE_PATH
         )
-        logger.info(f"Initialized ChromaDB Client: {config.PERSIST_DIRECTORY}, Collection: {config.COLLECTION_NAME}")
-        collection_count = collection.count()
-        logger.info(f"ChromaDB collection count: {collection_count} documents.")
 
         # Initialize the LLM used for generating the final report based on retrieved context
         llm = ChatGoogleGenerativeAI(
@@ -107,3 +160,13 @@ def initialize_rag_components():
         # Log any exceptions during initialization and re-raise
         logger.error(f"Failed to initialize RAG components: {e}", exc_info=True)
         raise # Re-raise the exception for the calling script to handle
+
+
+def get_query_embedding_cache():
+    """Returns the query embedding cache created by initialize_rag_components (None before initialization)."""
+    return _query_embedding_cache
+
+
+def get_result_cache():
+    """Returns the retrieval result cache created by initialize_rag_components (None before initialization)."""
+    return _result_cache
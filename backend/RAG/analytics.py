@@ -0,0 +1,195 @@
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .metadata_filters import FILTER_FIELDS, MetadataFilterIndex, build_where, read_collection_metadata
+except ImportError:
+    from metadata_filters import FILTER_FIELDS, MetadataFilterIndex, build_where, read_collection_metadata
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_LABELS = ['positive', 'neutral', 'negative']
+# Metadata fields kept in the columnar store (besides the filter fields)
+ANALYTICS_FIELDS = ['sentiment_label', 'sentiment_compound_score', 'aspect_sentiments', 'source_type']
+DEFAULT_TOP_ASPECTS = 15
+
+
+def _sentiment_code(label: Any) -> int:
+    return SENTIMENT_LABELS.index(label) if label in SENTIMENT_LABELS else -1
+
+
+def _number(value: Any) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+class MetadataAnalytics:
+    """
+    In-memory columnar copy of the sentiment and aspect metadata, for
+    deterministic aggregates over any set of documents: the retrieved ones
+    (summarize_ids) or a whole filter facet (summarize_filters).
+
+    Documents are rows of per-document arrays (sentiment label code, compound
+    score, source type code); every extracted aspect mention is a row of
+    per-mention arrays (document row, aspect code, sentiment code, score), so an
+    aggregate is a boolean mask and a few np.bincount calls.
+    """
+    def __init__(self, ids: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]],
+                 filter_index: Optional[MetadataFilterIndex] = None):
+        start_time = time.perf_counter()
+        self.ids = list(ids)
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        count = len(self.ids)
+        metadatas = [metadata or {} for metadata in metadatas]
+
+        self.sentiment_codes = np.fromiter((_sentiment_code(m.get('sentiment_label')) for m in metadatas),
+                                           dtype=np.int8, count=count)
+        self.sentiment_scores = np.fromiter((_number(m.get('sentiment_compound_score')) for m in metadatas),
+                                            dtype=np.float64, count=count)
+        source_code_by_name: Dict[str, int] = {}
+        self.source_codes = np.fromiter(
+            (source_code_by_name.setdefault(m.get('source_type') or 'unknown', len(source_code_by_name)) for m in metadatas),
+            dtype=np.int32, count=count)
+        self.source_types: List[str] = list(source_code_by_name)
+
+        aspect_code_by_name: Dict[str, int] = {}
+        mention_rows, mention_codes, mention_sentiments, mention_scores, first_mentions = [], [], [], [], []
+        for row, metadata in enumerate(metadatas):
+            seen_codes = set()
+            aspects = metadata.get('aspect_sentiments')
+            if isinstance(aspects, str):
+                try:
+                    aspects = json.loads(aspects)
+                except json.JSONDecodeError:
+                    aspects = None
+            for mention in aspects if isinstance(aspects, list) else []:
+                name = mention.get('aspect') if isinstance(mention, dict) else None
+                if not isinstance(name, str) or not name.strip():
+                    continue
+                code = aspect_code_by_name.setdefault(name.strip().lower(), len(aspect_code_by_name))
+                mention_rows.append(row)
+                mention_codes.append(code)
+                first_mentions.append(code not in seen_codes)
+                seen_codes.add(code)
+                mention_sentiments.append(_sentiment_code(mention.get('sentiment')))
+                mention_scores.append(_number(mention.get('sentiment_score')))
+        self.aspect_names = list(aspect_code_by_name)
+        self.mention_rows = np.asarray(mention_rows, dtype=np.int64)
+        self.mention_codes = np.asarray(mention_codes, dtype=np.int64)
+        self.mention_sentiments = np.asarray(mention_sentiments, dtype=np.int8)
+        self.mention_scores = np.asarray(mention_scores, dtype=np.float64)
+        # First mention of an aspect in its document: a document mentioning an aspect twice counts once in 'documents'
+        self.first_mentions = np.asarray(first_mentions, dtype=bool)
+
+        # Facet masks come from the filter index (cached per `where` clause)
+        self.filter_index = filter_index if filter_index is not None else MetadataFilterIndex(self.ids, metadatas)
+        logger.info(f"Metadata analytics: {count} documents, {len(mention_rows)} aspect mentions of "
+                    f"{len(self.aspect_names)} aspects, built in {time.perf_counter() - start_time:.2f}s.")
+
+    @classmethod
+    def from_collection(cls, collection) -> "MetadataAnalytics":
+        """Reads the analytics and filter fields of every document of a collection."""
+        return cls(*read_collection_metadata(collection, ANALYTICS_FIELDS + FILTER_FIELDS))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def summarize_ids(self, ids: Sequence[str], top_aspects: int = DEFAULT_TOP_ASPECTS) -> Dict[str, Any]:
+        """Aggregates over the given documents (e.g. the retrieved set); unknown IDs are counted in 'missing_ids'."""
+        mask = np.zeros(len(self.ids), dtype=bool)
+        rows = [self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id]
+        mask[rows] = True
+        summary = self.summarize_mask(mask, top_aspects)
+        summary['missing_ids'] = len(set(ids)) - int(mask.sum())
+        return summary
+
+    def summarize_filters(self, filters: Optional[Dict[str, Any]], top_aspects: int = DEFAULT_TOP_ASPECTS) -> Dict[str, Any]:
+        """Aggregates over every document matching normalized filters (see metadata_filters.parse_filters)."""
+        mask = self.filter_index.mask(build_where(filters))
+        return self.summarize_mask(np.ones(len(self.ids), dtype=bool) if mask is None else mask, top_aspects)
+
+    def summarize_mask(self, mask: np.ndarray, top_aspects: int = DEFAULT_TOP_ASPECTS) -> Dict[str, Any]:
+        """Sentiment distribution, source types and per-aspect mention / sentiment counts of the masked documents."""
+        start_time = time.perf_counter()
+        labels = self.sentiment_codes[mask]
+        sentiment_counts = np.bincount(labels[labels >= 0], minlength=len(SENTIMENT_LABELS))
+        scores = self.sentiment_scores[mask]
+        scores = scores[~np.isnan(scores)]
+        source_counts = np.bincount(self.source_codes[mask], minlength=len(self.source_types))
+
+        aspect_count = len(self.aspect_names)
+        selected = mask[self.mention_rows] if len(self.mention_rows) else np.zeros(0, dtype=bool)
+        codes = self.mention_codes[selected]
+        mentions = np.bincount(codes, minlength=aspect_count)
+        sentiments = self.mention_sentiments[selected]
+        labeled = sentiments >= 0
+        by_sentiment = np.bincount(codes[labeled] * len(SENTIMENT_LABELS) + sentiments[labeled],
+                                   minlength=aspect_count * len(SENTIMENT_LABELS)).reshape(aspect_count, len(SENTIMENT_LABELS))
+        mention_scores = self.mention_scores[selected]
+        scored = ~np.isnan(mention_scores)
+        score_sums = np.bincount(codes[scored], weights=mention_scores[scored], minlength=aspect_count)
+        score_counts = np.bincount(codes[scored], minlength=aspect_count)
+        documents = np.bincount(codes[self.first_mentions[selected]], minlength=aspect_count)
+
+        order = [int(code) for code in np.argsort(-mentions, kind='stable')[:top_aspects] if mentions[code] > 0]
+        return {
+            'document_count': int(mask.sum()),
+            'sentiments': {
+                **{label: int(count) for label, count in zip(SENTIMENT_LABELS, sentiment_counts)},
+                'unlabeled': int((labels < 0).sum()),
+                'mean_compound_score': round(float(scores.mean()), 4) if len(scores) else None,
+            },
+            'source_types': {name: int(count) for name, count in zip(self.source_types, source_counts) if count},
+            'aspects': [{
+                'aspect': self.aspect_names[code],
+                'mentions': int(mentions[code]),
+                'documents': int(documents[code]),
+                **{label: int(count) for label, count in zip(SENTIMENT_LABELS, by_sentiment[code])},
+                'mean_score': round(float(score_sums[code] / score_counts[code]), 4) if score_counts[code] else None,
+            } for code in order],
+            'compute_ms': round((time.perf_counter() - start_time) * 1000, 3),
+        }
+
+
+def to_report_fields(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """The report's 'sentiments' and 'aspect_sentiments_aggregated' fields, built from an analytics summary."""
+    sentiments = summary['sentiments']
+    labeled = sum(sentiments[label] for label in SENTIMENT_LABELS)
+    if labeled:
+        shares = ", ".join(f"{sentiments[label] / labeled:.0%} {label}" for label in SENTIMENT_LABELS)
+        description = f"{labeled} documents with a sentiment label: {shares}."
+    else:
+        description = "N/A"
+    aspects = []
+    for aspect in summary['aspects']:
+        mean_score = f", mean score {aspect['mean_score']:+.2f}" if aspect['mean_score'] is not None else ""
+        aspects.append({
+            'aspect': aspect['aspect'],
+            'positive_count': aspect['positive'],
+            'neutral_count': aspect['neutral'],
+            'negative_count': aspect['negative'],
+            'total_mentions': aspect['mentions'],
+            'summary': f"Mentioned {aspect['mentions']} times in {aspect['documents']} documents{mean_score}.",
+        })
+    return {
+        'sentiments': {'description': description, **{label: sentiments[label] for label in SENTIMENT_LABELS}},
+        'aspect_sentiments_aggregated': aspects,
+    }
+
+
+def load_analytics(collection) -> Optional[MetadataAnalytics]:
+    """
+    Analytics store for a collection: the quantized vector index already holds
+    the metadata (and its filter index) in memory, a ChromaDB collection is
+    read once. Returns None if the metadata cannot be read.
+    """
+    try:
+        if isinstance(getattr(collection, 'filter_index', None), MetadataFilterIndex):
+            return MetadataAnalytics(collection.ids, collection.metadatas, filter_index=collection.filter_index)
+        return MetadataAnalytics.from_collection(collection)
+    except Exception as e:
+        logger.warning(f"Could not build the metadata analytics store: {e}")
+        return None
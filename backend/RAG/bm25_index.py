@@ -0,0 +1,352 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 3
+# Still loaded: format 1 kept the postings in one postings.npz, read whole into memory; format 2
+# wrote the files below in place, next to the manifest
+LEGACY_FORMAT_VERSIONS = (1, 2)
+# Posting arrays, one .npy file each, memory-mapped on load
+POSTING_ARRAYS = ['term_offsets', 'posting_rows', 'posting_tfs']
+# Every save writes a new segment directory; the manifest names the current one
+SEGMENT_PREFIX = 'segment-'
+_LEGACY_FILES = ['docs.json', 'vocab.json', 'doc_lengths.npy', 'postings.npz'] + [f'{name}.npy' for name in POSTING_ARRAYS]
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+DEFAULT_K1 = 1.5
+DEFAULT_B = 0.75
+
+try:
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS as STOP_WORDS
+except ImportError:
+    STOP_WORDS = frozenset()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens (2+ characters) without English stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class BM25Index:
+    """
+    Inverted index over document texts with BM25 ranking.
+
+    Postings are kept in CSR form (numpy arrays: per-term offsets into
+    document-row and term-frequency arrays), loaded memory-mapped from disk.
+    Documents added after loading go to an in-memory delta; replaced and
+    removed documents are masked out. save() merges the delta, drops dead
+    rows and rewrites the files, so incremental updates only tokenize the
+    documents that changed.
+
+    Files in the index directory: manifest.json, naming the current segment
+    directory, which holds docs.json (ids and text hashes), vocab.json
+    (term -> term row), doc_lengths.npy and one .npy file per posting array
+    (POSTING_ARRAYS). A save writes a new segment and then replaces the
+    manifest, so a crash during a save leaves the previous index complete.
+    """
+    def __init__(self, directory: str, k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        # Documents (rows)
+        self.doc_ids: List[str] = []
+        self.text_hashes: List[str] = []
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self._row_by_id: Dict[str, int] = {}
+        # Base postings (CSR)
+        self.vocab: Dict[str, int] = {}
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.posting_rows = np.zeros(0, dtype=np.int32)
+        self.posting_tfs = np.zeros(0, dtype=np.float32)
+        # Postings of documents added since the index was loaded
+        self._delta: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        self._pending_lengths: List[float] = []
+
+    # --- Persistence ---
+
+    @classmethod
+    def load(cls, directory: str, **params) -> "BM25Index":
+        index = cls(directory, **params)
+        with open(os.path.join(directory, 'manifest.json'), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        format_version = manifest.get('format_version')
+        if format_version != INDEX_FORMAT_VERSION and format_version not in LEGACY_FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported BM25 index format {format_version} in {directory}")
+        data_dir = os.path.join(directory, manifest['segment']) if format_version == INDEX_FORMAT_VERSION else directory
+        with open(os.path.join(data_dir, 'docs.json'), 'r', encoding='utf-8') as f:
+            docs = json.load(f)
+        with open(os.path.join(data_dir, 'vocab.json'), 'r', encoding='utf-8') as f:
+            index.vocab = json.load(f)
+        if format_version == 1:
+            arrays = np.load(os.path.join(data_dir, 'postings.npz'))
+        else:
+            arrays = {name: np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r') for name in POSTING_ARRAYS}
+            arrays['doc_lengths'] = np.load(os.path.join(data_dir, 'doc_lengths.npy'))
+        index.doc_ids = docs['ids']
+        index.text_hashes = docs['text_hashes']
+        index.doc_lengths = arrays['doc_lengths']
+        index.term_offsets = arrays['term_offsets']
+        index.posting_rows = arrays['posting_rows']
+        index.posting_tfs = arrays['posting_tfs']
+        index.alive = np.ones(len(index.doc_ids), dtype=bool)
+        index._row_by_id = {doc_id: row for row, doc_id in enumerate(index.doc_ids)}
+        logger.info(f"Loaded BM25 index from {directory}: {len(index.doc_ids)} documents, {len(index.vocab)} terms.")
+        return index
+
+    @classmethod
+    def load_or_create(cls, directory: str, **params) -> "BM25Index":
+        if os.path.exists(os.path.join(directory, 'manifest.json')):
+            return cls.load(directory, **params)
+        return cls(directory, **params)
+
+    def save(self):
+        """
+        Compacts (merges the delta, drops removed documents) and writes the
+        index to a new segment, which the manifest then points to in one
+        atomic replace. Segments of earlier saves are removed afterwards.
+        """
+        self._compact()
+        segment = f"{SEGMENT_PREFIX}{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        segment_dir = os.path.join(self.directory, segment)
+        os.makedirs(segment_dir)
+
+        def write_json(path, obj):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(obj, f)
+                f.flush()
+                os.fsync(f.fileno())
+
+        def write_array(name, array):
+            with open(os.path.join(segment_dir, name), 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+                f.flush()
+                os.fsync(f.fileno())
+
+        write_json(os.path.join(segment_dir, 'docs.json'), {'ids': self.doc_ids, 'text_hashes': self.text_hashes})
+        write_json(os.path.join(segment_dir, 'vocab.json'), self.vocab)
+        write_array('doc_lengths.npy', self.doc_lengths)
+        for name in POSTING_ARRAYS:
+            write_array(f'{name}.npy', getattr(self, name))
+        manifest_path = os.path.join(self.directory, 'manifest.json')
+        write_json(manifest_path + '.tmp', {'format_version': INDEX_FORMAT_VERSION, 'segment': segment,
+                                            'documents': len(self.doc_ids), 'terms': len(self.vocab),
+                                            'saved_at': time.time()})
+        os.replace(manifest_path + '.tmp', manifest_path)
+        self._remove_stale_files(segment)
+        logger.info(f"Saved BM25 index to {segment_dir}: {len(self.doc_ids)} documents, {len(self.vocab)} terms.")
+
+    def _remove_stale_files(self, current_segment: str):
+        """
+        Removes the segments of earlier (or interrupted) saves and the files
+        of legacy formats. Indexes already loaded from an old segment keep
+        their memory maps on POSIX; where a file is still in use, it is left
+        for the next save.
+        """
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith(SEGMENT_PREFIX) and name != current_segment:
+                    shutil.rmtree(path)
+                elif name in _LEGACY_FILES:
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove stale BM25 index file {path}: {e}")
+
+    def _compact(self):
+        """Rebuilds the CSR postings from the live base rows plus the delta."""
+        if self._pending_lengths:
+            self.doc_lengths = np.concatenate([self.doc_lengths, np.asarray(self._pending_lengths, dtype=np.float32)])
+            self._pending_lengths = []
+        old_to_new = np.full(len(self.doc_ids), -1, dtype=np.int64)
+        live_rows = np.flatnonzero(self.alive)
+        old_to_new[live_rows] = np.arange(len(live_rows))
+
+        terms = list(self.vocab) + [term for term in self._delta if term not in self.vocab]
+        new_vocab, offsets, rows_parts, tfs_parts = {}, [0], [], []
+        for term in terms:
+            rows, tfs = self._postings(term)
+            keep = old_to_new[rows] >= 0
+            if not keep.any():
+                continue
+            new_vocab[term] = len(new_vocab)
+            rows_parts.append(old_to_new[rows[keep]].astype(np.int32))
+            tfs_parts.append(tfs[keep])
+            offsets.append(offsets[-1] + int(keep.sum()))
+
+        self.vocab = new_vocab
+        self.term_offsets = np.asarray(offsets, dtype=np.int64)
+        self.posting_rows = np.concatenate(rows_parts) if rows_parts else np.zeros(0, dtype=np.int32)
+        self.posting_tfs = np.concatenate(tfs_parts) if tfs_parts else np.zeros(0, dtype=np.float32)
+        self.doc_ids = [self.doc_ids[row] for row in live_rows]
+        self.text_hashes = [self.text_hashes[row] for row in live_rows]
+        self.doc_lengths = self.doc_lengths[live_rows]
+        self.alive = np.ones(len(self.doc_ids), dtype=bool)
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.doc_ids)}
+        self._delta.clear()
+
+    # --- Updates ---
+
+    def add_documents(self, ids: Sequence[str], texts: Sequence[str]) -> int:
+        """
+        Adds or replaces documents. Documents whose text is unchanged are skipped.
+
+        Returns:
+            The number of documents (re)indexed.
+        """
+        indexed = 0
+        replaced_rows = set()
+        for doc_id, text in zip(ids, texts):
+            text_hash = _text_hash(text)
+            row = self._row_by_id.get(doc_id)
+            if row is not None and row not in replaced_rows and self.text_hashes[row] == text_hash \
+                    and (row >= len(self.alive) or self.alive[row]):
+                continue
+            if row is not None:
+                replaced_rows.add(row)
+            tokens = tokenize(text)
+            new_row = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.text_hashes.append(text_hash)
+            self._row_by_id[doc_id] = new_row
+            self._pending_lengths.append(float(len(tokens)))
+            for term, tf in Counter(tokens).items():
+                rows, tfs = self._delta[term]
+                rows.append(new_row)
+                tfs.append(tf)
+            indexed += 1
+        # Grow the live mask once per call, then mask out the replaced rows
+        self.alive = np.concatenate([self.alive, np.ones(len(self.doc_ids) - len(self.alive), dtype=bool)])
+        self.alive[list(replaced_rows)] = False
+        return indexed
+
+    def remove(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for doc_id in ids:
+            row = self._row_by_id.pop(doc_id, None)
+            if row is not None and self.alive[row]:
+                self.alive[row] = False
+                removed += 1
+        return removed
+
+    # --- Search ---
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        rows, tfs = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        term_row = self.vocab.get(term)
+        if term_row is not None:
+            start, end = self.term_offsets[term_row], self.term_offsets[term_row + 1]
+            rows, tfs = self.posting_rows[start:end].astype(np.int64), self.posting_tfs[start:end]
+        if term in self._delta:
+            delta_rows, delta_tfs = self._delta[term]
+            rows = np.concatenate([rows, np.asarray(delta_rows, dtype=np.int64)])
+            tfs = np.concatenate([tfs, np.asarray(delta_tfs, dtype=np.float32)])
+        return rows, tfs
+
+    def search(self, query: str, k: int = 10, allowed_ids: Optional[AbstractSet[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Args:
+            allowed_ids: optional candidate IDs (e.g. from a metadata filter); other documents are skipped.
+
+        Returns:
+            Up to k (doc_id, BM25 score) pairs, best first. Documents matching no query term are not returned.
+        """
+        terms = Counter(tokenize(query))
+        if not terms or not len(self.doc_ids):
+            return []
+        doc_lengths = self.doc_lengths
+        if self._pending_lengths:
+            doc_lengths = np.concatenate([doc_lengths, np.asarray(self._pending_lengths, dtype=np.float32)])
+        live_count = int(self.alive.sum())
+        if not live_count:
+            return []
+        avg_length = float(doc_lengths[self.alive].mean()) or 1.0
+
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term, query_tf in terms.items():
+            rows, tfs = self._postings(term)
+            live = self.alive[rows]
+            rows, tfs = rows[live], tfs[live]
+            if not len(rows):
+                continue
+            idf = np.log(1.0 + (live_count - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[rows] / avg_length)
+            scores[rows] += query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return []
+        if allowed_ids is not None:
+            # Walk the matches best first until k of them pass the filter
+            ranked = []
+            for row in matched[np.argsort(-scores[matched], kind='stable')]:
+                if self.doc_ids[row] in allowed_ids:
+                    ranked.append((self.doc_ids[row], float(scores[row])))
+                    if len(ranked) == k:
+                        break
+            return ranked
+        top = matched[np.argsort(-scores[matched], kind='stable')[:k]] if len(matched) <= k else \
+            matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.doc_ids[row], float(scores[row])) for row in top]
+
+
+def load_keyword_index(directory: str) -> Optional[BM25Index]:
+    """Loads the BM25 index, or returns None (with a warning) if it has not been built yet."""
+    if not os.path.exists(os.path.join(directory, 'manifest.json')):
+        logger.warning(f"No BM25 index at {directory}. Keyword retrieval falls back to substring matching.")
+        return None
+    return BM25Index.load(directory)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    try:
+        from . import config
+    except ImportError:
+        import config
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build or query the BM25 keyword index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Index the document_text column of the processed CSV.")
+    build_parser.add_argument("csv_path", nargs="?", default=config.PREPARED_CSV_PATH)
+    build_parser.add_argument("--index", default=config.BM25_INDEX_PATH)
+    search_parser = subparsers.add_parser("search")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--index", default=config.BM25_INDEX_PATH)
+    search_parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        data = pd.read_csv(args.csv_path, header=0, keep_default_na=False, dtype=str)
+        bm25_index = BM25Index.load_or_create(args.index)
+        bm25_index.remove(set(bm25_index.doc_ids) - set(data["chroma_id"]))
+        logger.info(f"Indexed {bm25_index.add_documents(data['chroma_id'].tolist(), data['document_text'].tolist())} documents.")
+        bm25_index.save()
+    else:
+        start_time = time.perf_counter()
+        hits = BM25Index.load(args.index).search(args.query, args.k)
+        for doc_id, score in hits:
+            print(f"{score:8.3f}  {doc_id}")
+        logger.info(f"Search took {(time.perf_counter() - start_time) * 1000:.2f} ms (including load).")
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Metadata key holding the hash of a document's text and metadata
+CONTENT_HASH_KEY = "content_hash"
+DEFAULT_PAGE_SIZE = 1000
+
+
+def row_content_hash(document: str, metadata: Dict[str, Any]) -> str:
+    """Hash of a document text and its metadata (without the hash field itself)."""
+    payload = {
+        'document': document,
+        'metadata': {key: value for key, value in metadata.items() if key != CONTENT_HASH_KEY},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def add_content_hashes(documents: Sequence[str], metadatas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Stores the content hash of every row in its metadata (in place) and returns the metadatas."""
+    for document, metadata in zip(documents, metadatas):
+        metadata[CONTENT_HASH_KEY] = row_content_hash(document, metadata)
+    return metadatas
+
+
+def fetch_collection_hashes(collection, page_size: int = DEFAULT_PAGE_SIZE) -> Dict[str, Optional[str]]:
+    """
+    Reads the ID and stored content hash of every document in the collection,
+    one page at a time. Documents loaded before hashes existed map to None.
+    """
+    hashes: Dict[str, Optional[str]] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+        page_ids = page.get('ids') or []
+        page_metadatas = page.get('metadatas') or [None] * len(page_ids)
+        for doc_id, metadata in zip(page_ids, page_metadatas):
+            hashes[doc_id] = (metadata or {}).get(CONTENT_HASH_KEY)
+        if len(page_ids) < page_size:
+            break
+        offset += page_size
+    return hashes
+
+
+class SyncPlan:
+    """Rows to upsert (by position in the incoming data), IDs to delete, and the unchanged count"""
+    def __init__(self, upsert_indices: List[int], delete_ids: List[str], unchanged: int):
+        self.upsert_indices = upsert_indices
+        self.delete_ids = delete_ids
+        self.unchanged = unchanged
+
+    def summary(self) -> Dict[str, int]:
+        return {'upsert': len(self.upsert_indices), 'delete': len(self.delete_ids), 'unchanged': self.unchanged}
+
+
+def plan_sync(ids: Sequence[str], metadatas: Sequence[Dict[str, Any]], existing_hashes: Dict[str, Optional[str]]) -> SyncPlan:
+    """
+    Compares the incoming rows (whose metadatas already carry their content hash)
+    with the hashes stored in the collection.
+    """
+    upsert_indices = []
+    unchanged = 0
+    for index, (doc_id, metadata) in enumerate(zip(ids, metadatas)):
+        stored_hash = existing_hashes.get(doc_id)
+        if stored_hash is not None and stored_hash == metadata.get(CONTENT_HASH_KEY):
+            unchanged += 1
+        else:
+            upsert_indices.append(index)
+    incoming_ids = set(ids)
+    delete_ids = [doc_id for doc_id in existing_hashes if doc_id not in incoming_ids]
+    return SyncPlan(upsert_indices, delete_ids, unchanged)
+
+
+def delete_stale_documents(collection, delete_ids: Sequence[str], batch_size: int = DEFAULT_PAGE_SIZE):
+    for start in range(0, len(delete_ids), batch_size):
+        collection.delete(ids=list(delete_ids[start:start + batch_size]))
+    if delete_ids:
+        logger.info(f"Deleted {len(delete_ids)} documents that are no longer in the processed data.")
@@ -10,14 +10,30 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 # --- ChromaDB Configuration ---
-# Directory where ChromaDB will store its data
-PERSIST_DIRECTORY = "./chroma_db_market_research"
+# Directory where ChromaDB will store its data (backend/chroma_db_market_research, independent of the working directory)
+PERSIST_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chroma_db_market_research")
 # Name of the collection within ChromaDB
 COLLECTION_NAME = "market_data_main"
+# Vector search backend: 'chroma' (HNSW collection) or 'quantized' (in-process int8/float16 index,
+# built from the collection with: python RAG/vector_index.py build)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vector_index")
+# IVF lists scanned per query when the index is partitioned (ignored for exact indexes)
+VECTOR_INDEX_NPROBE = 8
+# SQLite side store with raw document texts and product attributes (written by data_processing/main.py)
+SIDE_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "processed_output", "side_store.sqlite3")
+# CSV written by the processing pipeline (data_processing/main.py) and loaded by RAG/rag_data_loader.py
+PREPARED_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "processed_output", "chroma_prepared_final.csv")
 
 # --- Model Configuration ---
+# Embedding backend: 'google' (Generative AI API) or 'local' (TF-IDF + LSA trained on the corpus, CPU only)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
 # Google Generative AI Embedding Model
 EMBEDDING_MODEL = "models/embedding-001"
+# Directory of the local embedding model (train it with: python RAG/embedding_backends.py train)
+LOCAL_EMBEDDING_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "local_embedding_model")
+# Persistent document embedding cache of the loader (one sub-directory per embedding model)
+EMBEDDING_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "embedding_cache")
 # Google Generative AI Chat Model for RAG response generation
 CHAT_MODEL = "gemini-2.0-flash" # Or your preferred model
 # Temperature for the chat model (controls randomness)
@@ -27,6 +43,53 @@ TEMPERATURE = 0.1
 # Number of documents to retrieve for each method
 RETRIEVER_K = 7
 
+# BM25 keyword index over document_text, updated by rag_data_loader.py
+BM25_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bm25_index")
+# Hybrid retrieval fusion: 'rrf' (reciprocal rank fusion) or 'weighted' (min-max normalized scores)
+HYBRID_FUSION = "rrf"
+# Weight of the similarity leg in hybrid fusion (the keyword leg gets 1 - weight)
+HYBRID_SIMILARITY_WEIGHT = 0.5
+# Rank constant of reciprocal rank fusion
+RRF_K = 60
+# Query embeddings are cached (LRU with expiry) so repeated queries skip the embedding call
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = 3600
+# Post-retrieval diversification: over-fetch, collapse near-duplicates, pick k with MMR
+DIVERSIFY_RESULTS = False
+MMR_FETCH_MULTIPLIER = 4 # Candidates retrieved per requested document
+MMR_LAMBDA = 0.7 # 1.0 = pure relevance, 0.0 = pure diversity
+DUPLICATE_SIMILARITY_THRESHOLD = 0.97 # Cosine similarity above which documents are collapsed
+# Second-stage reranking: over-fetch, rescore candidates on CPU, keep the best k
+RERANK_RESULTS = False
+RERANK_FETCH_MULTIPLIER = 4 # Candidates retrieved per requested document
+# Trained weights (python reranker.py <judged candidates>.jsonl); the default weights are used when missing
+RERANKER_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reranker_model.json")
+# Sentiment / aspect aggregates of reports computed from the metadata (analytics.py) instead of by the LLM
+DETERMINISTIC_ANALYTICS = True
+ANALYTICS_TOP_ASPECTS = 15 # Aspects listed per analytics summary
+# Queries naming catalog products (see product_resolver.py) are scoped to those products' documents
+AUTO_PRODUCT_SCOPE = True
+# Product-line keywords matched in queries; same list as GLOBAL_PRODUCT_KEYWORDS in data_processing/main.py
+PRODUCT_KEYWORDS = [
+    "Home Security", "Smart Home", "Nest cam", "Wyze", "Ring",
+    "eufyCam", "Arlo", "ADT", "Simplisafe",
+    "security camera", "alarm system", "motion detection", "night vision",
+    "wireless camera", "video doorbell", "smart lock"
+]
+# Prompt context size: documents share this many (estimated) tokens by rank, long texts are cut at
+# sentence ends and metadata is rendered compactly (context_builder.py); 0 = every document in full
+CONTEXT_TOKEN_BUDGET = 3000
+CONTEXT_RANK_DECAY = 0.85 # Budget share of rank r is proportional to CONTEXT_RANK_DECAY ** r
+CONTEXT_MIN_TEXT_TOKENS = 40 # Documents that cannot get this much text are left out
+CONTEXT_MAX_ASPECTS = 8 # Aspects listed per document
+# Largest number of queries accepted by /api/research/batch in one request
+MAX_BATCH_QUERIES = 50
+# Retrieval results are cached per collection version (bumped by every write to the collection)
+COLLECTION_VERSION_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "collection_version.json")
+RESULT_CACHE_SIZE = 512
+# Optional SQLite file shared by all app processes as a second cache tier (unset = in-process only)
+RESULT_CACHE_SQLITE_PATH = os.getenv("RESULT_CACHE_SQLITE_PATH")
+
 # --- Supported Retrieval Methods ---
 # List of names for the different retrieval strategies available
 SUPPORTED_RETRIEVAL_METHODS = [
@@ -0,0 +1,2 @@
+# rag_test.py is the manual retrieval-method comparison script (needs ChromaDB and the LLM), not a test module
+collect_ignore = ['rag_test.py']
@@ -0,0 +1,290 @@
+import json
+import logging
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from .prompt_formatter import format_chroma_results_for_prompt
+    from .product_resolver import product_name
+    from .side_store import SideStore, write_snippets
+except ImportError:
+    from prompt_formatter import format_chroma_results_for_prompt
+    from product_resolver import product_name
+    from side_store import SideStore, write_snippets
+
+logger = logging.getLogger(__name__)
+
+# Characters per token of English text for Gemini / GPT-style tokenizers; no tokenizer is needed offline
+CHARS_PER_TOKEN = 4
+DEFAULT_RANK_DECAY = 0.85
+# A document is only included when at least this many tokens of its text fit (or the whole text, if shorter)
+DEFAULT_MIN_TEXT_TOKENS = 40
+DEFAULT_MAX_ASPECTS = 8
+# Bump when render_header changes, so snippets stored by an older loader are no longer used
+SNIPPET_FORMAT_VERSION = 1
+TRUNCATION_MARK = " [...]"
+# Sentence ends, including those the scraped reviews run together ("features.First")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])(?:\s+|(?=[A-Z]))")
+_SENTIMENT_MARKS = {'positive': '+', 'negative': '-', 'neutral': '~'}
+# Readable text of a document in the side store, preferred over the preprocessed (lemmatized) document text
+_TEXT_FIELDS = ['review_comment_orig', 'original_text']
+_TITLE_FIELDS = ['review_title_orig', 'title_orig', 'post_title_orig']
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def truncate_text(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """
+    Cuts text to about max_tokens at the last sentence end that fits; at a word
+    boundary when not even the first sentence fits (or the text has no
+    punctuation). Returns (text, truncated).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+    cut = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        if match.start() > max_chars:
+            break
+        cut = match.start()
+    if not cut:
+        cut = text.rfind(' ', 0, max_chars + 1)
+        cut = cut if cut > 0 else max_chars
+    return text[:cut].rstrip() + TRUNCATION_MARK, True
+
+
+def allocate_budget(costs: Sequence[int], budget: int, rank_decay: float = DEFAULT_RANK_DECAY) -> List[int]:
+    """
+    Splits a token budget across documents in rank order. Each document's
+    share is proportional to rank_decay ** rank; documents needing less than
+    their share get exactly their cost, and what they leave is shared again
+    among the others.
+
+    Returns:
+        Token allowance per document, never more than its cost.
+    """
+    allowances = [0] * len(costs)
+    weights = [rank_decay ** rank for rank in range(len(costs))]
+    remaining = float(budget)
+    open_ranks = list(range(len(costs)))
+    while open_ranks and remaining > 0:
+        total_weight = sum(weights[rank] for rank in open_ranks)
+        shares = {rank: remaining * weights[rank] / total_weight for rank in open_ranks}
+        satisfied = [rank for rank in open_ranks if costs[rank] <= shares[rank]]
+        if not satisfied:
+            for rank in open_ranks:
+                allowances[rank] = int(shares[rank])
+            break
+        for rank in satisfied:
+            allowances[rank] = costs[rank]
+            remaining -= costs[rank]
+        open_ranks = [rank for rank in open_ranks if rank not in satisfied]
+    return allowances
+
+
+def _aspect_summary(aspect_sentiments: Any, max_aspects: int) -> str:
+    """'battery life+, app-' from the aspect_sentiments JSON, each aspect once, in order of mention."""
+    if isinstance(aspect_sentiments, str):
+        try:
+            aspect_sentiments = json.loads(aspect_sentiments)
+        except json.JSONDecodeError:
+            return ""
+    marks: Dict[str, str] = {}
+    for mention in aspect_sentiments if isinstance(aspect_sentiments, list) else []:
+        aspect = mention.get('aspect') if isinstance(mention, dict) else None
+        if isinstance(aspect, str) and aspect.strip() and aspect.strip().lower() not in marks:
+            marks[aspect.strip().lower()] = _SENTIMENT_MARKS.get(mention.get('sentiment'), '')
+            if len(marks) >= max_aspects:
+                break
+    return ", ".join(f"{aspect}{mark}" for aspect, mark in marks.items())
+
+
+def render_header(doc_id: str, meta: Dict[str, Any], product: Optional[Dict[str, Any]] = None,
+                  title: Optional[str] = None, max_aspects: int = DEFAULT_MAX_ASPECTS) -> str:
+    """
+    One compact metadata line per document (the context prefixes its rank), e.g.
+    'amazon_review_B0BTBP5T15_3 | amazon_review | eufy Security eufyCam S300 | rating 4.0 | 2023-05-23 | positive | aspects: app+, purchase- | title: ...'
+    """
+    parts = [doc_id, meta.get('source_type') or 'unknown']
+    product = product or meta
+    if product.get('product_title'):
+        parts.append(product_name(str(product['product_title'])))
+    if meta.get('subreddit'):
+        parts.append(f"r/{meta['subreddit']}")
+    if meta.get('review_rating') not in (None, ''):
+        parts.append(f"rating {meta['review_rating']}")
+    date = meta.get('created_iso') or meta.get('review_created_iso')
+    if date:
+        parts.append(str(date)[:10])
+    if meta.get('sentiment_label'):
+        parts.append(meta['sentiment_label'])
+    aspects = _aspect_summary(meta.get('aspect_sentiments'), max_aspects)
+    if aspects:
+        parts.append(f"aspects: {aspects}")
+    if title:
+        parts.append(f"title: {title}")
+    return " | ".join(parts)
+
+
+def _render_entry(doc_id: str, meta: Dict[str, Any], doc_texts: Dict[str, Any], product: Optional[Dict[str, Any]],
+                  max_aspects: int) -> Tuple[str, Optional[str]]:
+    """(header, readable text or None) of a document, from its metadata and side-store rows."""
+    title = next((doc_texts[field] for field in _TITLE_FIELDS if doc_texts.get(field)), None)
+    text = next((doc_texts[field] for field in _TEXT_FIELDS if doc_texts.get(field)), None)
+    return render_header(doc_id, meta, product, title, max_aspects), text
+
+
+def snippet_format(max_aspects: int = DEFAULT_MAX_ASPECTS) -> str:
+    """Identifies how stored snippets were rendered; snippets of another format are re-rendered at query time."""
+    return f"v{SNIPPET_FORMAT_VERSION}/aspects={max_aspects}"
+
+
+def build_context(chroma_results: Dict[str, List[Any]], side_store: Optional[Any] = None, token_budget: int = 3000,
+                  rank_decay: float = DEFAULT_RANK_DECAY, min_text_tokens: int = DEFAULT_MIN_TEXT_TOKENS,
+                  max_aspects: int = DEFAULT_MAX_ASPECTS) -> Tuple[str, Dict[str, Any]]:
+    """
+    Token-budgeted version of format_chroma_results_for_prompt: every document
+    is a compact header line (see render_header) and its text, the budget is
+    split by rank (allocate_budget) and long texts are cut at sentence ends.
+    Documents that cannot get min_text_tokens of text are left out, lowest
+    ranked first. Texts come from the side store (original wording) when
+    available, otherwise the document text is used.
+
+    Headers are read from the snippets pre-rendered at ingestion (see
+    write_document_snippets) in the same query as the texts; documents without
+    a snippet of the current format are rendered from their metadata.
+
+    Returns:
+        (context string, stats): stats holds token_budget, tokens_used (estimated,
+        CHARS_PER_TOKEN), documents_included, documents_truncated, documents_dropped,
+        the tokens of each included document (document_tokens) and how many
+        headers were rendered at query time (headers_rendered).
+    """
+    ids, documents, metadatas = (chroma_results.get(key) or [] for key in ('ids', 'documents', 'metadatas'))
+    if ids and isinstance(ids[0], list): ids = ids[0]
+    if documents and isinstance(documents[0], list): documents = documents[0]
+    if metadatas and isinstance(metadatas[0], list): metadatas = metadatas[0]
+    count = min(len(ids), len(documents), len(metadatas))
+    ids, documents, metadatas = ids[:count], documents[:count], [meta or {} for meta in metadatas[:count]]
+
+    snippets = side_store.get_snippets(ids, snippet_format(max_aspects)) if side_store is not None and count else {}
+    missing = [i for i, doc_id in enumerate(ids) if doc_id not in snippets]
+    side_texts, products = {}, {}
+    if side_store is not None and missing:
+        side_texts = side_store.get_texts(ids[i] for i in missing)
+        products = side_store.get_products(metadatas[i].get('product_id') for i in missing)
+
+    entries = []  # (doc_id, header, text) of the documents that have text
+    for doc_id, document, meta in zip(ids, documents, metadatas):
+        snippet = snippets.get(doc_id)
+        if snippet is not None:
+            header = snippet['header']
+            text = next((snippet[field] for field in _TEXT_FIELDS if snippet.get(field)), None)
+        else:
+            header, text = _render_entry(doc_id, meta, side_texts.get(doc_id) or meta,
+                                         products.get(meta.get('product_id')), max_aspects)
+        text = " ".join(str(text or document or "").split())
+        if text:
+            entries.append((doc_id, header, text))
+
+    # Ranks are assigned after dropping, so the context always numbers its documents 1..n
+    kept = list(range(len(entries)))
+    while True:
+        headers = [f"[{rank}] {entries[i][1]}" for rank, i in enumerate(kept, start=1)]
+        # +1: the newline after the header; the blank line between documents is counted in tokens_used only
+        header_costs = [estimate_tokens(header) + 1 for header in headers]
+        costs = [header_cost + estimate_tokens(entries[i][2]) for header_cost, i in zip(header_costs, kept)]
+        allowances = allocate_budget(costs, token_budget, rank_decay)
+        short = [position for position, i in enumerate(kept)
+                 if allowances[position] < min(costs[position], header_costs[position] + min_text_tokens)]
+        if not short:
+            break
+        kept.pop(short[-1])
+
+    blocks, document_tokens, truncated_count = [], [], 0
+    for header, header_cost, allowance, i in zip(headers, header_costs, allowances, kept):
+        text, truncated = truncate_text(entries[i][2], allowance - header_cost)
+        truncated_count += truncated
+        block = f"{header}\n{text}"
+        blocks.append(block)
+        document_tokens.append({'id': entries[i][0], 'tokens': estimate_tokens(block), 'truncated': truncated})
+
+    context = "\n\n".join(blocks)
+    stats = {
+        'token_budget': token_budget,
+        'tokens_used': estimate_tokens(context),
+        'documents_included': len(blocks),
+        'documents_truncated': truncated_count,
+        'documents_dropped': count - len(blocks),
+        'document_tokens': document_tokens,
+        'headers_rendered': len(missing),
+    }
+    if stats['documents_dropped']:
+        logger.info(f"Context budget of {token_budget} tokens: {stats['documents_dropped']} of {count} documents left out.")
+    return context, stats
+
+
+def build_prompt_context(chroma_results: Dict[str, List[Any]], side_store: Optional[Any] = None,
+                         token_budget: Optional[int] = None, **options) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Context for the RAG prompt: build_context when a token budget is set, the
+    unbounded format_chroma_results_for_prompt (stats None) otherwise.
+    """
+    if not token_budget:
+        return format_chroma_results_for_prompt(chroma_results, side_store), None
+    return build_context(chroma_results, side_store, token_budget, **options)
+
+
+def write_document_snippets(db_path: str, ids: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]],
+                            max_aspects: int = DEFAULT_MAX_ASPECTS, batch_size: int = 500) -> int:
+    """
+    Pre-renders the context header of every document (source, product name,
+    rating, date, sentiment, aspects, title) and stores it in the side store's
+    doc_snippets table, replacing the previous snippets. Run after the
+    collection is loaded (rag_data_loader.py does), so the snippets match its
+    metadata; the processing pipeline carries the previous snippets over when
+    it rewrites the side store. Returns the number of snippets written (0 without a side store).
+    """
+    if not os.path.exists(db_path):
+        logger.warning(f"Side store not found at {db_path}. Document snippets not written.")
+        return 0
+    side_store = SideStore(db_path)
+    rows = []
+    try:
+        for start in range(0, len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            batch_metadatas = [meta or {} for meta in metadatas[start:start + batch_size]]
+            side_texts = side_store.get_texts(batch_ids)
+            products = side_store.get_products(meta.get('product_id') for meta in batch_metadatas)
+            for doc_id, meta in zip(batch_ids, batch_metadatas):
+                header, _ = _render_entry(doc_id, meta, side_texts.get(doc_id) or meta, products.get(meta.get('product_id')),
+                                          max_aspects)
+                rows.append((doc_id, header))
+    finally:
+        side_store.close()
+    return write_snippets(db_path, rows, snippet_format(max_aspects))
+
+
+if __name__ == "__main__":
+    import argparse
+    import pandas as pd
+
+    try:
+        from .metadata_conversion import build_metadatas_columnar
+    except ImportError:
+        from metadata_conversion import build_metadatas_columnar
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Pre-render the prompt context snippets of a processed CSV into the side store.")
+    parser.add_argument("--csv", default=os.path.join("processed_output", "chroma_prepared_final.csv"))
+    parser.add_argument("--db", default=os.path.join("processed_output", "side_store.sqlite3"))
+    parser.add_argument("--max-aspects", type=int, default=DEFAULT_MAX_ASPECTS)
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.csv, header=0, keep_default_na=False, dtype=str)
+    csv_metadatas = build_metadatas_columnar(data, [col for col in data.columns if col not in ('chroma_id', 'document_text')])
+    write_document_snippets(args.db, data['chroma_id'].tolist(), csv_metadatas, args.max_aspects)
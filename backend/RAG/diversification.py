@@ -0,0 +1,109 @@
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MMR_LAMBDA = 0.7
+# Cosine similarity above which two documents count as the same evidence
+DEFAULT_DUPLICATE_THRESHOLD = 0.97
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def collapse_near_duplicates(embeddings: np.ndarray, texts: Sequence[Optional[str]],
+                             threshold: float = DEFAULT_DUPLICATE_THRESHOLD) -> Tuple[List[int], Dict[int, List[int]]]:
+    """
+    Walks the candidates best first and drops every one that repeats a kept
+    document: the same text (case and whitespace ignored) or a cosine
+    similarity of at least `threshold`.
+
+    Args:
+        embeddings: (n, dim) candidate embeddings, best candidate first (zero rows are never duplicates).
+        texts: candidate texts, same order.
+
+    Returns:
+        (kept indices, kept index -> indices collapsed into it).
+    """
+    unit = _unit_rows(np.asarray(embeddings, dtype=np.float32))
+    kept: List[int] = []
+    duplicates: Dict[int, List[int]] = {}
+    kept_by_text: Dict[str, int] = {}
+    for i in range(len(unit)):
+        text_key = " ".join((texts[i] or "").casefold().split())
+        original = kept_by_text.get(text_key) if text_key else None
+        if original is None and kept and unit[i].any():
+            similarities = unit[kept] @ unit[i]
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                original = kept[best]
+        if original is None:
+            kept.append(i)
+            if text_key:
+                kept_by_text[text_key] = i
+        else:
+            duplicates.setdefault(original, []).append(i)
+    return kept, duplicates
+
+
+def maximal_marginal_relevance(relevance: np.ndarray, embeddings: np.ndarray, k: int,
+                               lambda_mult: float = DEFAULT_MMR_LAMBDA) -> List[int]:
+    """
+    Greedy MMR: repeatedly picks the candidate maximizing
+    lambda * relevance - (1 - lambda) * (max cosine similarity to the picked ones).
+
+    Args:
+        relevance: (n,) relevance of each candidate to the query (higher is better).
+        embeddings: (n, dim) candidate embeddings.
+
+    Returns:
+        Indices of the k picked candidates, in pick order.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    unit = _unit_rows(np.asarray(embeddings, dtype=np.float32))
+    similarity = unit @ unit.T
+    relevance = np.asarray(relevance, dtype=np.float32)
+    picked = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything picked so far
+    redundancy = similarity[picked[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, n):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        choice = int(np.argmax(scores))
+        picked.append(choice)
+        available[choice] = False
+        np.maximum(redundancy, similarity[choice], out=redundancy)
+    return picked
+
+
+def diversify(embeddings: np.ndarray, texts: Sequence[Optional[str]], k: int,
+              query_embedding: Optional[Sequence[float]] = None, lambda_mult: float = DEFAULT_MMR_LAMBDA,
+              duplicate_threshold: float = DEFAULT_DUPLICATE_THRESHOLD) -> Tuple[List[int], Dict[int, List[int]]]:
+    """
+    Collapses near-duplicates, then picks k candidates with MMR.
+
+    Relevance is the cosine similarity to the query embedding; without one,
+    the candidates' rank order (best first) is used.
+
+    Returns:
+        (selected candidate indices in order, selected index -> collapsed duplicate indices).
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    kept, duplicates = collapse_near_duplicates(embeddings, texts, duplicate_threshold)
+    if query_embedding is not None:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        relevance = _unit_rows(embeddings[kept]) @ (query / (np.linalg.norm(query) or 1.0))
+    else:
+        relevance = 1.0 - np.asarray(kept, dtype=np.float32) / max(len(embeddings), 1)
+    picked = maximal_marginal_relevance(relevance, embeddings[kept], k, lambda_mult)
+    selected = [kept[i] for i in picked]
+    return selected, {index: duplicates[index] for index in selected if index in duplicates}
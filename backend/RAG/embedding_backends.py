@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_BACKEND = "google"
+LOCAL_BACKEND = "local"
+SUPPORTED_EMBEDDING_BACKENDS = [GOOGLE_BACKEND, LOCAL_BACKEND]
+
+# TF-IDF settings of the local model; stored with the model so queries are tokenized the same way
+DEFAULT_VECTORIZER_PARAMS = {
+    'lowercase': True,
+    'stop_words': 'english',
+    'token_pattern': r'(?u)\b\w\w+\b',
+    'ngram_range': [1, 2],
+    'min_df': 2,
+    'max_df': 0.95,
+    'sublinear_tf': True,
+}
+DEFAULT_LSA_COMPONENTS = 256
+
+
+class EmbeddingBackend:
+    """
+    Interface shared by the embedding backends.
+
+    Backends are callable with a list of texts, so they can be passed directly
+    as a ChromaDB embedding function or to EmbeddingCache.embed, and they
+    expose embed_documents / embed_query like LangChain embeddings.
+    `name` identifies the model (and its version) for the embedding cache.
+    """
+    name: str = ""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several queries; backends override this with a single batched call."""
+        return [self.embed_query(text) for text in texts]
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed_documents(list(input))
+
+
+class GoogleEmbeddingBackend(EmbeddingBackend):
+    """Google Generative AI embeddings (one API round-trip per call)."""
+    def __init__(self, model_name: str, api_key: str):
+        # Imported here so the local backend works without the Google packages
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        self.name = model_name
+        self._embeddings = GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=api_key)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # One batch request, with the same query task type embed_query uses
+        return self._embeddings.embed_documents(texts, task_type="retrieval_query")
+
+
+class LocalLsaEmbeddingBackend(EmbeddingBackend):
+    """
+    CPU-only embeddings: TF-IDF followed by a TruncatedSVD (LSA) projection,
+    trained on the processed corpus and L2-normalized.
+
+    Texts are embedded with plain numpy (analyzer -> sparse TF-IDF weights ->
+    sum of the matching rows of the projection matrix), so a query takes well
+    under a millisecond. The model is saved as model.json (vocabulary,
+    vectorizer settings) plus model.npz (idf weights, projection matrix).
+    """
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, projection: np.ndarray, vectorizer_params: Dict):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vocabulary = vocabulary
+        self.idf = idf.astype(np.float32)
+        # Shape (vocabulary size, dimension): row i is the LSA direction of term i
+        self.projection = np.ascontiguousarray(projection, dtype=np.float32)
+        self.vectorizer_params = vectorizer_params
+        self.dim = self.projection.shape[1]
+        self._analyzer = TfidfVectorizer(**self._sklearn_params(vectorizer_params)).build_analyzer()
+        fingerprint = hashlib.sha256(self.projection.tobytes()).hexdigest()[:12]
+        self.name = f"local-lsa-{self.dim}-{fingerprint}"
+
+    @staticmethod
+    def _sklearn_params(vectorizer_params: Dict) -> Dict:
+        params = dict(vectorizer_params)
+        params['ngram_range'] = tuple(params['ngram_range'])
+        return params
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], n_components: int = DEFAULT_LSA_COMPONENTS,
+            vectorizer_params: Optional[Dict] = None, random_state: int = 42) -> "LocalLsaEmbeddingBackend":
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer_params = {**DEFAULT_VECTORIZER_PARAMS, **(vectorizer_params or {})}
+        vectorizer = TfidfVectorizer(**cls._sklearn_params(vectorizer_params))
+        tfidf = vectorizer.fit_transform(texts)
+        # SVD needs fewer components than both documents and terms
+        n_components = max(1, min(n_components, tfidf.shape[0] - 1, tfidf.shape[1] - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+        svd.fit(tfidf)
+        logger.info(f"Trained local LSA embeddings on {tfidf.shape[0]} texts: {tfidf.shape[1]} terms, "
+                    f"{n_components} dimensions, {svd.explained_variance_ratio_.sum():.1%} variance explained.")
+        vocabulary = {term: int(index) for term, index in vectorizer.vocabulary_.items()}
+        return cls(vocabulary, vectorizer.idf_, svd.components_.T, vectorizer_params)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'model.json'), 'w', encoding='utf-8') as f:
+            json.dump({'vectorizer_params': self.vectorizer_params, 'vocabulary': self.vocabulary}, f)
+        np.savez(os.path.join(directory, 'model.npz'), idf=self.idf, projection=self.projection)
+        logger.info(f"Saved local embedding model '{self.name}' to {directory}")
+
+    @classmethod
+    def load(cls, directory: str) -> "LocalLsaEmbeddingBackend":
+        with open(os.path.join(directory, 'model.json'), 'r', encoding='utf-8') as f:
+            model = json.load(f)
+        arrays = np.load(os.path.join(directory, 'model.npz'))
+        return cls(model['vocabulary'], arrays['idf'], arrays['projection'], model['vectorizer_params'])
+
+    def embed_vector(self, text: str) -> np.ndarray:
+        counts = Counter(term for term in self._analyzer(text) if term in self.vocabulary)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not counts:
+            return vector
+        indices = np.fromiter((self.vocabulary[term] for term in counts), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        if self.vectorizer_params.get('sublinear_tf'):
+            tf = 1.0 + np.log(tf)
+        weights = tf * self.idf[indices]
+        weights /= np.linalg.norm(weights)
+        vector = weights @ self.projection[indices]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_vector(text).tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+
+def create_embedding_backend(backend_name: str, model_name: Optional[str] = None, api_key: Optional[str] = None,
+                             local_model_path: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Builds the embedding backend selected in the configuration.
+
+    Raises:
+        ValueError: unknown backend name or missing Google API key.
+        FileNotFoundError: the local model has not been trained yet.
+    """
+    if backend_name == GOOGLE_BACKEND:
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY is required for the 'google' embedding backend.")
+        return GoogleEmbeddingBackend(model_name, api_key)
+    if backend_name == LOCAL_BACKEND:
+        if not local_model_path or not os.path.exists(os.path.join(local_model_path, 'model.npz')):
+            raise FileNotFoundError(
+                f"No local embedding model at '{local_model_path}'. Train it with: python embedding_backends.py train"
+            )
+        return LocalLsaEmbeddingBackend.load(local_model_path)
+    raise ValueError(f"Unknown embedding backend '{backend_name}'. Supported: {SUPPORTED_EMBEDDING_BACKENDS}")
+
+
+def collection_name_for_backend(base_name: str, backend_name: str) -> str:
+    """Each backend has its own vector space and dimension, so non-default backends get their own collection."""
+    return base_name if backend_name == GOOGLE_BACKEND else f"{base_name}_{backend_name}"
+
+
+def benchmark_query_latency(backend: EmbeddingBackend, queries: Sequence[str], repeat: int = 20) -> Dict[str, float]:
+    """Per-query embedding latency of a backend, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            backend.embed_query(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'queries': len(timings),
+        'mean_ms': sum(timings) / len(timings),
+        'p50_ms': timings[len(timings) // 2],
+        'p95_ms': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    try:
+        from . import config
+    except ImportError:
+        import config
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Train or benchmark the local embedding backend.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Train the TF-IDF + LSA model on the processed corpus.")
+    train_parser.add_argument("csv_path", nargs="?", default=config.PREPARED_CSV_PATH)
+    train_parser.add_argument("--output", default=config.LOCAL_EMBEDDING_MODEL_PATH)
+    train_parser.add_argument("--components", type=int, default=DEFAULT_LSA_COMPONENTS)
+    benchmark_parser = subparsers.add_parser("benchmark", help="Measure query embedding latency.")
+    benchmark_parser.add_argument("--model", default=config.LOCAL_EMBEDDING_MODEL_PATH)
+    benchmark_parser.add_argument("queries", nargs="*", default=[
+        "battery life of wireless earbuds", "is the phone screen durable", "best budget laptop for students"])
+    args = parser.parse_args()
+
+    if args.command == "train":
+        corpus = pd.read_csv(args.csv_path, header=0, keep_default_na=False, dtype=str)["document_text"].tolist()
+        LocalLsaEmbeddingBackend.fit(corpus, n_components=args.components).save(args.output)
+    else:
+        local_backend = LocalLsaEmbeddingBackend.load(args.model)
+        results = benchmark_query_latency(local_backend, args.queries)
+        logger.info(f"{local_backend.name}: {results['queries']} query embeddings, mean {results['mean_ms']:.3f} ms, "
+                    f"p50 {results['p50_ms']:.3f} ms, p95 {results['p95_ms']:.3f} ms")
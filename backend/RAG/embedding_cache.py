@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 32 # sha256 digest length in bytes
+
+
+def text_hash(text: str) -> bytes:
+    """Content hash used as the cache key of a document text."""
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, sha256 of the text).
+
+    Each model gets its own directory holding three files:
+      - vectors.f32: float32 embeddings, one row per cached text, memory-mapped for reads
+      - keys.bin:    32-byte sha256 digests, aligned with the rows of vectors.f32
+      - meta.json:   model name, dimension and committed row count
+
+    Both data files are append-only. meta.json is rewritten (atomically) after
+    each append, and only rows it counts are trusted, so a crash mid-append
+    never yields a misaligned key/vector pair.
+    """
+    def __init__(self, cache_dir: str, model_name: str):
+        self.model_name = model_name
+        safe_model_name = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+        self.directory = os.path.join(cache_dir, safe_model_name)
+        os.makedirs(self.directory, exist_ok=True)
+        self._vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self._keys_path = os.path.join(self.directory, 'keys.bin')
+        self._meta_path = os.path.join(self.directory, 'meta.json')
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.dim: Optional[int] = None
+        self.count = 0
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('model_name') != self.model_name:
+            logger.warning(f"Embedding cache at {self.directory} belongs to model '{meta.get('model_name')}'. Ignoring it.")
+            return
+        self.dim = meta['dim']
+        self.count = meta['count']
+        with open(self._keys_path, 'rb') as f:
+            keys = f.read(self.count * KEY_SIZE)
+        self._rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(self.count)}
+        self._map_vectors()
+        logger.info(f"Loaded embedding cache for '{self.model_name}': {self.count} vectors of dim {self.dim}.")
+
+    def _map_vectors(self):
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(self.count, self.dim)) if self.count else None
+
+    def _write_meta(self):
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'model_name': self.model_name, 'dim': self.dim, 'count': self.count}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def __len__(self):
+        return self.count
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        row = self._rows.get(key)
+        return None if row is None else self._vectors[row]
+
+    def put_many(self, keys: Sequence[bytes], vectors: Sequence[Sequence[float]]):
+        """Appends new (key, vector) pairs; keys already cached are skipped. Thread-safe."""
+        with self._lock:
+            new_keys, new_vectors, seen = [], [], set()
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in seen:
+                    seen.add(key)
+                    new_keys.append(key)
+                    new_vectors.append(vector)
+            if not new_keys:
+                return
+            matrix = np.asarray(new_vectors, dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match cache dimension {self.dim}.")
+
+            # Truncate to the committed size first, in case a previous run died mid-append
+            for path, size in ((self._vectors_path, self.count * self.dim * 4), (self._keys_path, self.count * KEY_SIZE)):
+                with open(path, 'ab') as f:
+                    f.truncate(size)
+            with open(self._vectors_path, 'ab') as f:
+                f.write(matrix.tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.write(b''.join(new_keys))
+            first_row = self.count
+            self.count += len(new_keys)
+            self._write_meta()
+            # Remap before publishing the keys, so readers never see a row the map does not cover
+            self._map_vectors()
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = first_row + offset
+
+    def embed(self, texts: Sequence[str], embed_fn: Callable[[List[str]], List[List[float]]], batch_size: int = 100) -> List[List[float]]:
+        """
+        Returns one embedding per text, calling `embed_fn` only for texts that
+        are not cached yet (each distinct missing text is embedded once).
+        """
+        keys = [text_hash(text) for text in texts]
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), batch_size):
+            batch_keys = missing_keys[start:start + batch_size]
+            batch_vectors = embed_fn([missing[key] for key in batch_keys])
+            self.put_many(batch_keys, batch_vectors)
+
+        return [self.get(key).tolist() for key in keys]
+
+    def stats(self) -> Dict[str, int]:
+        return {'cached_vectors': self.count, 'hits': self.hits, 'misses': self.misses}
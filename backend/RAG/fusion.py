@@ -0,0 +1,56 @@
+from typing import Dict, List, Sequence, Tuple
+
+# Rank constant of reciprocal rank fusion (60 is the value from the original RRF paper)
+DEFAULT_RRF_K = 60
+SUPPORTED_FUSION_METHODS = ['rrf', 'weighted']
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, Sequence[str]], weights: Dict[str, float] = None,
+                           rrf_k: int = DEFAULT_RRF_K) -> List[Tuple[str, float]]:
+    """
+    Fuses ranked ID lists: each list contributes weight / (rrf_k + rank) to
+    every ID it contains (rank starts at 1).
+
+    Args:
+        rankings: leg name -> IDs, best first.
+        weights: leg name -> weight (default 1.0 for every leg).
+
+    Returns:
+        (id, fused score) pairs, best first.
+    """
+    fused: Dict[str, float] = {}
+    for leg, ids in rankings.items():
+        weight = (weights or {}).get(leg, 1.0)
+        for rank, doc_id in enumerate(ids, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def _min_max(scores: Dict[str, float]) -> Dict[str, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {doc_id: 1.0 for doc_id in scores}
+    return {doc_id: (score - low) / (high - low) for doc_id, score in scores.items()}
+
+
+def weighted_score_fusion(scores: Dict[str, Dict[str, float]], weights: Dict[str, float] = None) -> List[Tuple[str, float]]:
+    """
+    Fuses per-leg scores (higher is better): each leg is min-max normalized to
+    [0, 1] and the normalized scores are summed with the leg weights. An ID a
+    leg did not return gets 0 from that leg.
+
+    Args:
+        scores: leg name -> {id: score}.
+        weights: leg name -> weight (default 1.0 for every leg).
+
+    Returns:
+        (id, fused score) pairs, best first.
+    """
+    fused: Dict[str, float] = {}
+    for leg, leg_scores in scores.items():
+        weight = (weights or {}).get(leg, 1.0)
+        for doc_id, normalized in _min_max(leg_scores).items():
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
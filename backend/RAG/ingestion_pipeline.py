@@ -0,0 +1,263 @@
+import hashlib
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 1.0
+
+# Signals the writer thread that no more batches will come
+_END_OF_BATCHES = object()
+
+
+def embed_with_retry(embed_fn: Callable[[List[str]], List[List[float]]], texts: List[str],
+                     max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE) -> List[List[float]]:
+    """
+    Calls `embed_fn`, retrying failures with exponential backoff and jitter
+    (backoff_base * 2^attempt seconds). The last error is raised once all retries are used.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return embed_fn(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_base * 2 ** attempt
+            delay += random.uniform(0, delay / 2)
+            logger.warning(f"Embedding request failed ({e}). Retry {attempt + 1}/{max_retries} in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+class IngestionStats:
+    """Progress counters shared by the embedding workers and the writer"""
+    def __init__(self, total_items: int, total_batches: int):
+        self.total_items = total_items
+        self.total_batches = total_batches
+        self.written_items = 0
+        self.written_batches = 0
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            'items': self.written_items,
+            'batches': self.written_batches,
+            'elapsed_seconds': round(elapsed, 3),
+            'items_per_second': round(self.written_items / elapsed, 2) if elapsed > 0 else None,
+            'embed_seconds': round(self.embed_seconds, 3),
+            'write_seconds': round(self.write_seconds, 3),
+        }
+
+
+class IngestionPipeline:
+    """
+    Producer/consumer ingestion: embeds batches concurrently and writes them with a single writer.
+
+    Up to `max_in_flight` embedding requests run at once on a thread pool.
+    Embedded batches go to a writer thread that calls `write_fn` (usually
+    collection.upsert) one batch at a time, so embedding network time overlaps
+    with the disk writes. At most 2 * max_in_flight batches are embedded or
+    waiting to be written at any time, which bounds memory use. The first
+    error (after retries) stops the pipeline and is raised from run().
+
+    Args:
+        embed_fn: callable(list of texts) -> list of vectors.
+        write_fn: callable(ids=..., documents=..., metadatas=..., embeddings=...).
+    """
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], write_fn: Callable[..., Any],
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 progress_interval: float = 5.0):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.progress_interval = progress_interval
+
+    def run(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Embeds and writes every item.
+
+        Returns:
+            The final IngestionStats snapshot.
+        """
+        total_items = len(ids)
+        batch_starts = list(range(0, total_items, self.batch_size))
+        stats = IngestionStats(total_items, len(batch_starts))
+        stats_lock = threading.Lock()
+        slots = threading.BoundedSemaphore(2 * self.max_in_flight)
+        write_queue: "queue.Queue[Any]" = queue.Queue()
+        failed = threading.Event()
+        errors: List[BaseException] = []
+
+        def fail(error: BaseException):
+            errors.append(error)
+            failed.set()
+
+        def embed_batch(start: int):
+            queued = False
+            try:
+                if failed.is_set():
+                    return
+                end = min(start + self.batch_size, total_items)
+                texts = list(documents[start:end])
+                embed_start = time.perf_counter()
+                embeddings = embed_with_retry(self.embed_fn, texts, self.max_retries, self.backoff_base)
+                with stats_lock:
+                    stats.embed_seconds += time.perf_counter() - embed_start
+                write_queue.put((start, end, embeddings))
+                queued = True
+            except Exception as e:
+                fail(e)
+            finally:
+                # The writer releases the slot of a queued batch
+                if not queued:
+                    slots.release()
+
+        def write_batches():
+            last_report = time.monotonic()
+            while True:
+                item = write_queue.get()
+                if item is _END_OF_BATCHES:
+                    return
+                start, end, embeddings = item
+                try:
+                    if not failed.is_set():
+                        write_start = time.perf_counter()
+                        self.write_fn(ids=list(ids[start:end]), documents=list(documents[start:end]),
+                                      metadatas=list(metadatas[start:end]), embeddings=embeddings)
+                        with stats_lock:
+                            stats.write_seconds += time.perf_counter() - write_start
+                            stats.written_items += end - start
+                            stats.written_batches += 1
+                except Exception as e:
+                    fail(e)
+                finally:
+                    slots.release()
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    self._log_progress(stats)
+
+        writer = threading.Thread(target=write_batches, name="chroma-writer", daemon=True)
+        writer.start()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embedder") as executor:
+            for start in batch_starts:
+                slots.acquire()
+                if failed.is_set():
+                    slots.release()
+                    break
+                executor.submit(embed_batch, start)
+        write_queue.put(_END_OF_BATCHES)
+        writer.join()
+
+        stats.finished_at = time.monotonic()
+        if errors:
+            raise errors[0]
+        self._log_progress(stats)
+        return stats.snapshot()
+
+    @staticmethod
+    def _log_progress(stats: IngestionStats):
+        snapshot = stats.snapshot()
+        logger.info(
+            f"Ingested {stats.written_batches}/{stats.total_batches} batches "
+            f"({stats.written_items}/{stats.total_items} items) in {snapshot['elapsed_seconds']}s, "
+            f"{snapshot['items_per_second']} items/s."
+        )
+
+
+class FakeEmbeddingFunction:
+    """
+    Deterministic local stand-in for the embedding API, for tests and benchmarks.
+    Each call sleeps `latency` seconds; `fail_every` makes every n-th call raise.
+    """
+    def __init__(self, dim: int = 8, latency: float = 0.0, fail_every: int = 0):
+        self.dim = dim
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and call_number % self.fail_every == 0:
+            raise RuntimeError(f"Simulated embedding failure on call {call_number}")
+        return [self._vector(text) for text in input]
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode('utf-8')).digest()
+        return [byte / 255.0 for byte in digest[:self.dim]]
+
+
+def benchmark_pipeline(num_items: int = 2000, batch_size: int = DEFAULT_BATCH_SIZE, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                       embed_latency: float = 0.2, write_latency: float = 0.05) -> Dict[str, float]:
+    """Compares the serial embed-then-write loop with the pipeline, using fake embedding and write latencies."""
+    ids = [f"doc_{i}" for i in range(num_items)]
+    documents = [f"document number {i}" for i in range(num_items)]
+    metadatas = [{'n': i} for i in range(num_items)]
+    written: Dict[str, List[float]] = {}
+
+    def fake_write(ids, documents, metadatas, embeddings):
+        time.sleep(write_latency)
+        written.update(zip(ids, embeddings))
+
+    embed_fn = FakeEmbeddingFunction(latency=embed_latency)
+    start = time.perf_counter()
+    for i in range(0, num_items, batch_size):
+        fake_write(ids=ids[i:i + batch_size], documents=documents[i:i + batch_size],
+                   metadatas=metadatas[i:i + batch_size], embeddings=embed_fn(documents[i:i + batch_size]))
+    serial_seconds = time.perf_counter() - start
+    serial_result = dict(written)
+
+    written.clear()
+    pipeline = IngestionPipeline(FakeEmbeddingFunction(latency=embed_latency), fake_write,
+                                 batch_size=batch_size, max_in_flight=max_in_flight)
+    start = time.perf_counter()
+    pipeline.run(ids, documents, metadatas)
+    pipelined_seconds = time.perf_counter() - start
+
+    if written != serial_result:
+        raise AssertionError("Pipelined ingestion wrote different data than the serial loop.")
+    return {
+        'items': num_items,
+        'serial_seconds': serial_seconds,
+        'pipelined_seconds': pipelined_seconds,
+        'speedup': serial_seconds / pipelined_seconds if pipelined_seconds else float('inf'),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline with a fake embedding function.")
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="Seconds per fake embedding request.")
+    parser.add_argument("--write-latency", type=float, default=0.05, help="Seconds per fake upsert.")
+    args = parser.parse_args()
+
+    results = benchmark_pipeline(args.items, args.batch_size, args.max_in_flight, args.embed_latency, args.write_latency)
+    logger.info(
+        f"{results['items']} items: serial {results['serial_seconds']:.2f}s, "
+        f"pipelined {results['pipelined_seconds']:.2f}s ({results['speedup']:.1f}x faster), outputs identical."
+    )
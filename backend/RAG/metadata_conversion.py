@@ -0,0 +1,193 @@
+import json
+import logging
+import re
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INT_PATTERN = r'-?\d+'
+FLOAT_PATTERN = r'-?\d+\.\d+(?:e-?\d+)?'
+
+# Marker for cells that are left out of the metadata dict (empty strings, NaN)
+_SKIP = object()
+
+
+def convert_metadata_value(value: Any) -> Any:
+    """
+    Converts a single CSV cell back to the native type stored in ChromaDB metadata.
+    Reference (per-cell) implementation; returns _SKIP for cells that must be left out.
+    """
+    # Skip empty strings or pandas NaN representations
+    if isinstance(value, str) and not value.strip():
+        return _SKIP
+    if pd.isna(value):
+        return _SKIP
+
+    if not isinstance(value, str):
+        # Fallback for any other unexpected types - convert to string
+        return str(value)
+
+    lower_value = value.lower()
+    if lower_value == 'true':
+        return True
+    if lower_value == 'false':
+        return False
+    if re.fullmatch(INT_PATTERN, value):
+        try: return int(value)
+        except (ValueError, OverflowError): return value # Keep as string if conversion fails
+    if re.fullmatch(FLOAT_PATTERN, value):
+        try: return float(value)
+        except ValueError: return value # Keep as string if conversion fails
+    # Lists/dicts are parsed and dumped again so ChromaDB gets a normalized JSON string
+    if value.startswith('[') or value.startswith('{'):
+        try:
+            parsed_value = json.loads(value)
+        except json.JSONDecodeError:
+            return value
+        return json.dumps(parsed_value) if isinstance(parsed_value, (list, dict)) else parsed_value
+    return value
+
+
+def build_metadatas_rowwise(data: pd.DataFrame, metadata_columns: List[str]) -> List[Dict[str, Any]]:
+    """Original row-by-row conversion, kept as the reference for benchmarks."""
+    metadatas = []
+    for _, row in data.iterrows():
+        meta = {}
+        for col in metadata_columns:
+            converted = convert_metadata_value(row[col])
+            if converted is not _SKIP:
+                meta[col] = converted
+        metadatas.append(meta)
+    return metadatas
+
+
+_INT_RE = re.compile(INT_PATTERN)
+_FLOAT_RE = re.compile(FLOAT_PATTERN)
+
+
+def _infer_column_kind(values: List[str]) -> str:
+    """Infers the kind shared by all non-empty values of a column: bool, int, float, json, string or mixed."""
+    kinds = set()
+    for value in values:
+        if not value.strip():
+            continue
+        lower_value = value.lower()
+        if lower_value == 'true' or lower_value == 'false':
+            kinds.add('bool')
+        elif _INT_RE.fullmatch(value):
+            kinds.add('int')
+        elif _FLOAT_RE.fullmatch(value):
+            kinds.add('float')
+        elif value.startswith('[') or value.startswith('{'):
+            kinds.add('json')
+        else:
+            kinds.add('string')
+        if len(kinds) > 1:
+            return 'mixed'
+    return kinds.pop() if kinds else 'string'
+
+
+_KIND_CONVERTERS = {
+    'bool': lambda value: value.lower() == 'true',
+    'int': int,
+    'float': float,
+    'string': lambda value: value,
+}
+
+
+def convert_metadata_column(column: pd.Series) -> List[Any]:
+    """
+    Converts one whole column at once.
+
+    The column is factorized (vectorized) into its distinct values, the column
+    kind (bool, int, float, JSON or string) is inferred once from them, each
+    distinct value is converted once with the converter for that kind, and
+    the converted values are broadcast back with a single vectorized take.
+    JSON and mixed columns use the per-cell reference conversion, but still
+    only once per distinct value.
+
+    Returns:
+        A list aligned with the column, holding _SKIP for cells to leave out.
+    """
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    uniques = list(uniques)
+
+    if all(isinstance(value, str) for value in uniques):
+        kind = _infer_column_kind(uniques)
+        converter = _KIND_CONVERTERS.get(kind, convert_metadata_value)
+        converted = [_SKIP if not value.strip() else converter(value) for value in uniques]
+    else:
+        converted = [convert_metadata_value(value) for value in uniques]
+
+    # The extra trailing slot receives the NaN cells (factorize code -1)
+    lookup = np.empty(len(converted) + 1, dtype=object)
+    lookup[:len(converted)] = converted
+    lookup[-1] = _SKIP
+    return lookup[codes].tolist()
+
+
+def build_metadatas_columnar(data: pd.DataFrame, metadata_columns: List[str]) -> List[Dict[str, Any]]:
+    """
+    Builds the ChromaDB metadata dicts column by column.
+    Produces exactly the same dicts as build_metadatas_rowwise.
+    """
+    converted_columns = [convert_metadata_column(data[col]) for col in metadata_columns]
+    return [
+        {col: value for col, value in zip(metadata_columns, row_values) if value is not _SKIP}
+        for row_values in zip(*converted_columns)
+    ] if converted_columns else [{} for _ in range(len(data))]
+
+
+def benchmark_metadata_conversion(csv_path: str, id_column: str = "chroma_id", document_column: str = "document_text", scale: int = 1) -> Dict[str, float]:
+    """
+    Times the row-wise and columnar conversions on a CSV and checks that they agree.
+
+    Args:
+        csv_path: CSV produced by the processing pipeline.
+        scale: repeat the rows this many times to simulate a larger corpus.
+
+    Returns:
+        Timings in seconds and the number of rows converted.
+    """
+    data = pd.read_csv(csv_path, header=0, keep_default_na=False, dtype=str)
+    if scale > 1:
+        data = pd.concat([data] * scale, ignore_index=True)
+    metadata_columns = [col for col in data.columns if col not in [id_column, document_column]]
+
+    start = time.perf_counter()
+    rowwise = build_metadatas_rowwise(data, metadata_columns)
+    rowwise_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columnar = build_metadatas_columnar(data, metadata_columns)
+    columnar_seconds = time.perf_counter() - start
+
+    if rowwise != columnar:
+        raise AssertionError("Columnar metadata conversion does not match the row-wise conversion.")
+
+    return {
+        'rows': len(data),
+        'rowwise_seconds': rowwise_seconds,
+        'columnar_seconds': columnar_seconds,
+        'speedup': rowwise_seconds / columnar_seconds if columnar_seconds else float('inf'),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark metadata conversion for the ChromaDB loader.")
+    parser.add_argument("csv_path", nargs="?", default="processed_output/chroma_prepared_final.csv")
+    parser.add_argument("--scale", type=int, default=100, help="Repeat the CSV rows this many times.")
+    args = parser.parse_args()
+
+    results = benchmark_metadata_conversion(args.csv_path, scale=args.scale)
+    logger.info(
+        f"{results['rows']} rows: row-wise {results['rowwise_seconds']:.2f}s, "
+        f"columnar {results['columnar_seconds']:.2f}s ({results['speedup']:.1f}x faster), outputs identical."
+    )
@@ -0,0 +1,316 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Research API filter name -> metadata field it applies to
+EQUALITY_FILTERS = {
+    'product_asin': 'product_id', # The product_id of a product with an ASIN is the ASIN (see data_processing/side_store.py)
+    'source_type': 'source_type',
+    'subreddit': 'subreddit',
+}
+RATING_FIELD = 'review_rating'
+# Unix seconds, written at processing time for every source (see data_processing/data_processor.py)
+DATE_FIELD = 'created_epoch'
+SUPPORTED_FILTERS = list(EQUALITY_FILTERS) + ['rating_min', 'rating_max', 'date_from', 'date_to']
+# Metadata fields kept by MetadataFilterIndex.from_collection
+FILTER_FIELDS = list(EQUALITY_FILTERS.values()) + [RATING_FIELD, DATE_FIELD, 'sentiment_label']
+# Research API filter name -> metadata field it needs
+FIELD_BY_FILTER = {**EQUALITY_FILTERS, 'rating_min': RATING_FIELD, 'rating_max': RATING_FIELD,
+                   'date_from': DATE_FIELD, 'date_to': DATE_FIELD}
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MASK_CACHE_SIZE = 1024
+
+
+def _parse_date(value: Any, end_of_day: bool) -> int:
+    """ISO date or datetime (or Unix seconds) -> Unix seconds. A bare date_to date covers the whole day."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date: {value!r}")
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}'. Use ISO 8601, e.g. 2024-05-31.")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    seconds = int(parsed.timestamp())
+    if end_of_day and len(value.strip()) == 10:
+        seconds += 86399
+    return seconds
+
+
+def parse_filters(raw_filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Validates the filters of a research request and normalizes them (sorted
+    value lists, dates as Unix seconds), so equal filters produce equal cache keys.
+
+    Accepted keys: product_asin, source_type, subreddit (a string or a list of
+    strings), rating_min, rating_max (numbers), date_from, date_to (ISO dates).
+
+    Returns:
+        The normalized filters, or None when no filter is set.
+
+    Raises:
+        ValueError: unknown filter or invalid value.
+    """
+    if not raw_filters:
+        return None
+    if not isinstance(raw_filters, dict):
+        raise ValueError("'filters' must be an object.")
+    unknown = set(raw_filters) - set(SUPPORTED_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}. Supported filters: {', '.join(SUPPORTED_FILTERS)}")
+
+    filters: Dict[str, Any] = {}
+    for name in EQUALITY_FILTERS:
+        value = raw_filters.get(name)
+        if value is None or value == [] or value == '':
+            continue
+        values = [value] if isinstance(value, str) else value
+        if not isinstance(values, list) or not all(isinstance(v, str) and v for v in values):
+            raise ValueError(f"Filter '{name}' must be a string or a list of strings.")
+        filters[name] = sorted(set(values))
+    for name in ('rating_min', 'rating_max'):
+        value = raw_filters.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Filter '{name}' must be a number.")
+        filters[name] = float(value)
+    for name in ('date_from', 'date_to'):
+        value = raw_filters.get(name)
+        if value is not None and value != '':
+            filters[name] = _parse_date(value, end_of_day=(name == 'date_to'))
+    return filters or None
+
+
+def build_where(filters: Optional[Dict[str, Any]], extra: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Chroma `where` clause for normalized filters (see parse_filters), combined
+    with an optional extra condition (e.g. the sentiment of a filtered method).
+    """
+    conditions: List[Dict[str, Any]] = [extra] if extra else []
+    for name, field in EQUALITY_FILTERS.items():
+        values = (filters or {}).get(name)
+        if values:
+            conditions.append({field: values[0]} if len(values) == 1 else {field: {'$in': values}})
+    for name, field, operator in (('rating_min', RATING_FIELD, '$gte'), ('rating_max', RATING_FIELD, '$lte'),
+                                  ('date_from', DATE_FIELD, '$gte'), ('date_to', DATE_FIELD, '$lte')):
+        if (filters or {}).get(name) is not None:
+            conditions.append({field: {operator: filters[name]}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+
+def check_filter_fields(filters: Optional[Dict[str, Any]], filter_index: Optional["MetadataFilterIndex"]):
+    """
+    Rejects normalized filters on a metadata field that no document of the
+    collection has, instead of silently returning no results.
+    Nothing is checked without a filter index.
+
+    Raises:
+        ValueError: a filter needs a missing field; the collection must be reloaded.
+    """
+    if not filters or filter_index is None or not len(filter_index):
+        return
+    missing = set(filter_index.missing_fields())
+    unsupported = [name for name in filters if FIELD_BY_FILTER[name] in missing]
+    if unsupported:
+        fields = sorted({FIELD_BY_FILTER[name] for name in unsupported})
+        raise ValueError(
+            f"Filters {', '.join(unsupported)} are not available: the loaded collection has no "
+            f"{', '.join(fields)} metadata. Reload it with backend/RAG/rag_data_loader.py."
+        )
+
+
+def read_collection_metadata(collection, fields: Sequence[str], page_size: int = DEFAULT_PAGE_SIZE):
+    """Returns (ids, metadatas) of every document of a collection, keeping only `fields`; read one page at a time."""
+    start_time = time.perf_counter()
+    ids, metadatas = [], []
+    offset = 0
+    while True:
+        page = collection.get(include=['metadatas'], limit=page_size, offset=offset)
+        page_ids = page.get('ids') or []
+        ids.extend(page_ids)
+        for metadata in page.get('metadatas') or [None] * len(page_ids):
+            metadatas.append({field: metadata[field] for field in fields if metadata and field in metadata})
+        if len(page_ids) < page_size:
+            break
+        offset += page_size
+    logger.info(f"Read the metadata of {len(ids)} documents in {time.perf_counter() - start_time:.2f}s.")
+    return ids, metadatas
+
+
+class MetadataFilterIndex:
+    """
+    Columnar, indexed copy of the filterable metadata, used to pre-select the
+    candidates of a `where` clause without looking at every record.
+
+    Each field gets (on first use) an inverted index value -> rows for equality
+    and $in conditions, and a float array for range conditions. The mask of
+    every condition and of every whole `where` clause is cached, so a repeated
+    filter costs a dictionary lookup. Semantics match vector_index.matches_where.
+    """
+    def __init__(self, ids: Sequence[str], metadatas: Sequence[Optional[Dict[str, Any]]],
+                 mask_cache_size: int = DEFAULT_MASK_CACHE_SIZE):
+        self.ids = list(ids)
+        self._metadatas = metadatas
+        self._values: Dict[str, Dict[Any, np.ndarray]] = {}
+        self._numbers: Dict[str, np.ndarray] = {}
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._id_sets: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+        self.mask_cache_size = mask_cache_size
+        # Re-entrant: a clause's mask is computed from the (cached) masks of its sub-clauses
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_collection(cls, collection, fields: Sequence[str] = FILTER_FIELDS,
+                        page_size: int = DEFAULT_PAGE_SIZE) -> "MetadataFilterIndex":
+        """Reads the filterable fields of every document of a collection, one page at a time."""
+        return cls(*read_collection_metadata(collection, fields, page_size))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def missing_fields(self, fields: Sequence[str] = FILTER_FIELDS) -> List[str]:
+        """
+        Fields that no document has, e.g. created_epoch in a collection loaded
+        before data processing wrote it. A filter on such a field matches nothing.
+        """
+        with self._lock:
+            return [field for field in fields if not self._field_values(field)]
+
+    def _field_values(self, field: str) -> Dict[Any, np.ndarray]:
+        """Inverted index of a field: value -> rows holding it (built on first use)."""
+        index = self._values.get(field)
+        if index is None:
+            codes = np.full(len(self.ids), -1, dtype=np.int64)
+            code_by_value: Dict[Any, int] = {}
+            for row, metadata in enumerate(self._metadatas):
+                value = (metadata or {}).get(field)
+                if value is not None:
+                    codes[row] = code_by_value.setdefault(value, len(code_by_value))
+            # Rows grouped by value code: each value's rows are one slice of `order`
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(code_by_value) + 1))
+            index = {value: order[bounds[code]:bounds[code + 1]] for value, code in code_by_value.items()}
+            self._values[field] = index
+        return index
+
+    def _field_numbers(self, field: str) -> np.ndarray:
+        """Numeric values of a field (NaN where missing or not a number), for range conditions."""
+        numbers = self._numbers.get(field)
+        if numbers is None:
+            numbers = np.fromiter(
+                (value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                 for value in ((metadata or {}).get(field) for metadata in self._metadatas)),
+                dtype=np.float64, count=len(self.ids)
+            )
+            self._numbers[field] = numbers
+        return numbers
+
+    def _rows_mask(self, field: str, values) -> np.ndarray:
+        mask = np.zeros(len(self.ids), dtype=bool)
+        index = self._field_values(field)
+        for value in values:
+            rows = index.get(value)
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def _condition_mask(self, field: str, operator: str, operand: Any) -> np.ndarray:
+        if operator == '$eq':
+            return self._rows_mask(field, [operand])
+        if operator == '$ne':
+            return ~self._rows_mask(field, [operand])
+        if operator == '$in':
+            return self._rows_mask(field, operand)
+        if operator == '$nin':
+            return ~self._rows_mask(field, operand)
+        if operator in ('$gt', '$gte', '$lt', '$lte'):
+            if isinstance(operand, bool) or not isinstance(operand, (int, float)):
+                raise ValueError(f"Operator {operator} needs a number, got {operand!r}")
+            numbers = self._field_numbers(field)
+            with np.errstate(invalid='ignore'):
+                if operator == '$gt': return numbers > operand
+                if operator == '$gte': return numbers >= operand
+                if operator == '$lt': return numbers < operand
+                return numbers <= operand
+        raise ValueError(f"Unsupported where operator: {operator}")
+
+    def _cached(self, key: str, compute) -> np.ndarray:
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is None:
+                mask = compute()
+                self._masks[key] = mask
+                while len(self._masks) > self.mask_cache_size:
+                    self._masks.popitem(last=False)
+            else:
+                self._masks.move_to_end(key)
+            return mask
+
+    def mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Boolean mask (one entry per ID) of the records matching `where`; None when there is no filter."""
+        if not where:
+            return None
+        return self._cached(json.dumps(where, sort_keys=True, default=str), lambda: self._evaluate(where))
+
+    def _evaluate(self, where: Dict[str, Any]) -> np.ndarray:
+        result = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == '$and':
+                for sub in condition:
+                    result &= self.mask(sub)
+            elif key == '$or':
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for sub in condition:
+                    any_mask |= self.mask(sub)
+                result &= any_mask
+            else:
+                operators = condition if isinstance(condition, dict) else {'$eq': condition}
+                for operator, operand in operators.items():
+                    leaf_key = json.dumps([key, operator, operand], sort_keys=True, default=str)
+                    result &= self._cached(leaf_key, lambda: self._condition_mask(key, operator, operand))
+        return result
+
+    def candidate_ids(self, where: Optional[Dict[str, Any]]) -> Optional[FrozenSet[str]]:
+        """IDs matching `where` (cached per clause), or None when there is no filter."""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True, default=str)
+        with self._lock:
+            ids = self._id_sets.get(key)
+            if ids is None:
+                ids = frozenset(self.ids[row] for row in np.flatnonzero(self.mask(where)))
+                self._id_sets[key] = ids
+                while len(self._id_sets) > self.mask_cache_size:
+                    self._id_sets.popitem(last=False)
+            else:
+                self._id_sets.move_to_end(key)
+            return ids
+
+
+def load_filter_index(collection) -> Optional[MetadataFilterIndex]:
+    """
+    Filter index for a collection: the quantized vector index already keeps
+    one, a ChromaDB collection is read once. Returns None (keyword retrieval
+    then filters by over-fetching) if the metadata cannot be read.
+    """
+    existing = getattr(collection, 'filter_index', None)
+    if isinstance(existing, MetadataFilterIndex):
+        return existing
+    try:
+        return MetadataFilterIndex.from_collection(collection)
+    except Exception as e:
+        logger.warning(f"Could not build the metadata filter index: {e}")
+        return None
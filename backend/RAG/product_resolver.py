@@ -0,0 +1,225 @@
+import json
+import logging
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+try:
+    from .metadata_filters import read_collection_metadata
+    from .retrieval_methods import RetrievalMethods
+except ImportError:
+    from metadata_filters import read_collection_metadata
+    from retrieval_methods import RetrievalMethods
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# The product name is the part of a listing title before its feature list
+_NAME_END_RE = re.compile(r"\s(?:-|\|)\s|[,|(]")
+_ASIN_RE = re.compile(r"\bB0[A-Z0-9]{8}\b")
+# Title words that never identify a product
+_NAME_STOPWORDS = frozenset(['a', 'an', 'and', 'for', 'in', 'of', 'or', 'the', 'to', 'with'])
+# A keyword naming more than this share of the catalog is a feature ("night vision"), not a product line
+MAX_KEYWORD_SHARE = 0.5
+# Weight of a matched title word outside the product name (e.g. the "2C" of "eufy Security, eufyCam 2C ...")
+FEATURE_WORD_WEIGHT = 0.5
+
+
+def _tokens(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _contains_phrase(tokens: Sequence[str], phrase: Sequence[str]) -> bool:
+    n = len(phrase)
+    return n > 0 and any(list(tokens[i:i + n]) == list(phrase) for i in range(len(tokens) - n + 1))
+
+
+def product_name(title: str) -> str:
+    """Product name of a listing title: 'eufy Security eufyCam S300(eufyCam 3C) 2-Cam Kit, ...' -> 'eufy Security eufyCam S300'."""
+    return _NAME_END_RE.split(title, maxsplit=1)[0].strip() or title
+
+
+class CatalogProduct:
+    def __init__(self, product_id: str, title: str, asin: Optional[str] = None):
+        self.product_id = product_id
+        self.asin = asin or None
+        self.title = title
+        self.name = product_name(title)
+        self.name_tokens = [token for token in _tokens(self.name) if token not in _NAME_STOPWORDS]
+        self.title_tokens = _tokens(title)
+        # Words the listing uses to describe features (a model name repeated there is not one)
+        self.feature_tokens = set(_tokens(title[len(self.name):])) - set(self.name_tokens)
+        # Phrases that must appear in a query before the product is considered (brand, product-line keywords)
+        self.aliases: List[List[str]] = [self.name_tokens[:1]] if self.name_tokens else []
+
+
+class ProductResolver:
+    """
+    Resolves the products a query names against an in-memory catalog
+    (product IDs, ASINs and listing titles, plus product-line keywords such as
+    GLOBAL_PRODUCT_KEYWORDS of the processing pipeline).
+
+    A product is a candidate when the query contains its ASIN, or one of its
+    aliases: the brand (first word of the product name) or a keyword found in
+    its title that names only part of the catalog. Keywords made only of words
+    that several listings use to describe features ("night vision") are not
+    aliases. Candidates are scored by the IDF (across titles) of the title
+    words found in the query, product-name words counting fully and the rest
+    of the title at FEATURE_WORD_WEIGHT; the best-scoring products are
+    returned, or every candidate when only the brand was named ("Arlo" -> all
+    Arlo products).
+    """
+    def __init__(self, products: Iterable[CatalogProduct], keywords: Sequence[str] = ()):
+        self.products = [product for product in products if product.name_tokens]
+        self._by_asin = {product.asin.upper(): product for product in self.products if product.asin}
+        feature_frequency: Dict[str, int] = {}
+        for product in self.products:
+            for token in product.feature_tokens:
+                feature_frequency[token] = feature_frequency.get(token, 0) + 1
+        for keyword in keywords:
+            phrase = _tokens(keyword)
+            if not phrase or all(feature_frequency.get(token, 0) >= 2 for token in phrase):
+                continue
+            named = [product for product in self.products if _contains_phrase(product.title_tokens, phrase)]
+            if named and len(named) <= MAX_KEYWORD_SHARE * len(self.products):
+                for product in named:
+                    if phrase not in product.aliases:
+                        product.aliases.append(phrase)
+        document_frequency: Dict[str, int] = {}
+        for product in self.products:
+            for token in set(product.title_tokens):
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        self._idf = {token: math.log(1.0 + len(self.products) / count) for token, count in document_frequency.items()}
+        logger.info(f"Product resolver: {len(self.products)} catalog products, {len(keywords)} keywords.")
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def resolve(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Products named in a query, best first; an empty list when the query
+        names none (retrieval then stays unscoped).
+
+        Returns:
+            List of {'product_id', 'product_title', 'matched'} (matched: the query words or ASIN that matched).
+        """
+        asins = [self._by_asin[asin] for asin in dict.fromkeys(_ASIN_RE.findall(query.upper())) if asin in self._by_asin]
+        if asins:
+            return [self._describe(product, [product.asin]) for product in asins]
+
+        query_tokens = _tokens(query)
+        query_token_set = set(query_tokens)
+        scored = []
+        for product in self.products:
+            matched_aliases = [alias for alias in product.aliases if _contains_phrase(query_tokens, alias)]
+            if not matched_aliases:
+                continue
+            alias_tokens: Set[str] = {token for alias in matched_aliases for token in alias}
+            # Title words beyond the brand / keyword itself are what tell products of one line apart
+            name_words = [token for token in dict.fromkeys(product.name_tokens)
+                          if token in query_token_set and token not in alias_tokens]
+            feature_words = [token for token in product.feature_tokens
+                             if token in query_token_set and token not in alias_tokens and token not in _NAME_STOPWORDS]
+            score = sum(self._idf[token] for token in name_words) + \
+                FEATURE_WORD_WEIGHT * sum(self._idf[token] for token in feature_words)
+            scored.append((score, product, [" ".join(alias) for alias in matched_aliases] + name_words + sorted(feature_words)))
+        if not scored:
+            return []
+        best = max(score for score, _, _ in scored)
+        # Ties (and brand-only queries, where every score is 0) keep all of the best products
+        return [self._describe(product, matched) for score, product, matched in scored if score >= best - 1e-9]
+
+    @staticmethod
+    def _describe(product: CatalogProduct, matched: List[str]) -> Dict[str, Any]:
+        return {'product_id': product.product_id, 'product_title': product.title, 'matched': matched}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]], keywords: Sequence[str] = ()) -> "ProductResolver":
+        """Catalog from product rows / metadata dicts with product_id, product_title and optional product_asin."""
+        products: Dict[str, CatalogProduct] = {}
+        for record in records:
+            product_id, title = (record or {}).get('product_id'), (record or {}).get('product_title')
+            if product_id and title and product_id not in products:
+                products[product_id] = CatalogProduct(str(product_id), str(title), record.get('product_asin'))
+        return cls(products.values(), keywords)
+
+
+def load_product_resolver(side_store=None, collection=None, keywords: Sequence[str] = ()) -> Optional[ProductResolver]:
+    """
+    Product resolver over the side store's products table; collections
+    loaded before the side store existed still carry product_title in their
+    metadata, which is read instead. Returns None when no catalog is available.
+    """
+    records: List[Dict[str, Any]] = side_store.get_all_products() if side_store is not None else []
+    if not records and collection is not None:
+        try:
+            _, records = read_collection_metadata(collection, ['product_id', 'product_asin', 'product_title'])
+        except Exception as e:
+            logger.warning(f"Could not read the product catalog from the collection: {e}")
+    resolver = ProductResolver.from_records(records, keywords)
+    if not len(resolver):
+        logger.warning("No product catalog available; queries will not be scoped to products.")
+        return None
+    return resolver
+
+
+def scope_filters(resolver: Optional[ProductResolver], query: str, filters: Optional[Dict[str, Any]],
+                  auto_scope: bool = True):
+    """
+    Returns (filters, resolved products): the filters extended with the products
+    the query names, unless scoping is off or the request already filters by product.
+    """
+    if not auto_scope or resolver is None or (filters or {}).get('product_asin'):
+        return filters, []
+    resolved_products = resolver.resolve(query)
+    if not resolved_products:
+        return filters, []
+    logger.info(f"Query scoped to products: {', '.join(product['product_id'] for product in resolved_products)}")
+    return {**(filters or {}), 'product_asin': sorted(product['product_id'] for product in resolved_products)}, resolved_products
+
+
+def _is_empty(retrieved: Dict[str, Any]) -> bool:
+    """True when a result (nested collection.query shape or flat) holds no documents."""
+    return not RetrievalMethods._flatten_results(retrieved)[0]
+
+
+def retrieve_scoped(retriever, resolver: Optional[ProductResolver], query: str, method_name: str,
+                    filters: Optional[Dict[str, Any]], auto_scope: bool = True):
+    """
+    Retrieves within the products named in the query; falls back to the
+    request's own filters when the scoped search finds nothing (e.g. a
+    product discussed only in forum posts, which carry no product_id).
+    Returns (retrieved, resolved products).
+    """
+    scoped_filters, resolved_products = scope_filters(resolver, query, filters, auto_scope)
+    retrieved = retriever.retrieve(query, method_name, scoped_filters)
+    if resolved_products and _is_empty(retrieved):
+        logger.info("No documents within the resolved products; retrieving without the product scope.")
+        return retriever.retrieve(query, method_name, filters), []
+    return retrieved, resolved_products
+
+
+def retrieve_many_scoped(retriever, resolver: Optional[ProductResolver], queries: Sequence[str], method_name: str,
+                         filters: Optional[Dict[str, Any]], auto_scope: bool = True):
+    """
+    Batch version of retrieve_scoped: queries sharing the same scope are
+    retrieved together with one retrieve_many call.
+    Returns (retrieved per query, resolved products per query).
+    """
+    queries = list(queries)
+    scopes = [scope_filters(resolver, query, filters, auto_scope) for query in queries]
+    resolved = [resolved_products for _, resolved_products in scopes]
+    groups: Dict[str, List[int]] = {}
+    for i, (scoped_filters, _) in enumerate(scopes):
+        groups.setdefault(json.dumps(scoped_filters, sort_keys=True), []).append(i)
+    retrieved_batch: List[Any] = [None] * len(queries)
+    for indices in groups.values():
+        group_results = retriever.retrieve_many([queries[i] for i in indices], method_name, scopes[indices[0]][0])
+        for i, retrieved in zip(indices, group_results):
+            retrieved_batch[i] = retrieved
+    unscoped = [i for i, retrieved in enumerate(retrieved_batch) if resolved[i] and _is_empty(retrieved)]
+    if unscoped:
+        logger.info(f"No documents within the resolved products for {len(unscoped)} queries; retrieving them without the product scope.")
+        for i, retrieved in zip(unscoped, retriever.retrieve_many([queries[i] for i in unscoped], method_name, filters)):
+            retrieved_batch[i], resolved[i] = retrieved, []
+    return retrieved_batch, resolved
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +14,7 @@ RAG_PROMPT_TEMPLATE = """You are a helpful Product Insights Assistant. Your goal
 
 Your analysis must be based *strictly* on the information contained within the CONTEXT. Do not add external knowledge or information from outside the provided text.
 
-Pay attention to the metadata provided for each document, including Source, Overall Sentiment, Aspects, and LDA Topic, as this provides valuable clues about the content.
+Pay attention to the metadata provided for each document, including Source, Product, Overall Sentiment, Aspects (marked + positive, - negative, ~ neutral when listed compactly), and LDA Topic when present, as this provides valuable clues about the content.
 
 Present your entire response as a single, valid JSON object. Do not include any introductory text, explanations, summaries, or markdown formatting outside the JSON structure.
 
@@ -59,7 +59,63 @@ Analyze the CONTEXT and the QUESTION to generate the following insights, structu
 }}
 """
 
-def format_chroma_results_for_prompt(chroma_results: Dict[str, List[Any]]) -> str:
+# Variant used when the sentiment and aspect aggregates are computed from the
+# metadata (see analytics.py): the LLM receives them as ANALYTICS and only
+# writes the narrative fields; the app adds the computed 'sentiments' and
+# 'aspect_sentiments_aggregated' to the report.
+RAG_NARRATIVE_PROMPT_TEMPLATE = """You are a helpful Product Insights Assistant. Your goal is to analyze customer feedback (like reviews, forum posts, comments) provided in the CONTEXT to answer the user's QUESTION thoroughly.
+
+Your analysis must be based *strictly* on the information contained within the CONTEXT and the ANALYTICS. Do not add external knowledge or information from outside the provided text.
+
+The ANALYTICS were computed exactly from the metadata of the CONTEXT documents (sentiment distribution, aspect mention counts and sentiment per aspect). Use these numbers as they are; do not count sentiments or aspects yourself.
+
+Present your entire response as a single, valid JSON object. Do not include any introductory text, explanations, summaries, or markdown formatting outside the JSON structure.
+
+For demo purposes make the report as detailed and long as possible.
+
+ANALYTICS:
+{analytics}
+
+CONTEXT:
+{context}
+
+QUESTION:
+{question}
+
+Analyze the CONTEXT and the QUESTION to generate the following insights, structured according to the JSON schema below. Ensure all values are correctly typed within the JSON (e.g., numbers as numbers, lists as JSON arrays, strings as strings).
+
+{{
+  "report": "A synthesized textual summary answering the user's question based ONLY on context. Highlight key takeaways, user experiences (positive/negative), mentioned themes, and specific aspects discussed, citing the ANALYTICS figures where relevant. Use clear language and bullet points where appropriate for readability. (string)",
+  "metrics": [
+    {{
+      "title": "Metric Name (string)",
+      "value": "<value_taken_from_the_analytics_or_context_as_string_or_number>",
+      "description": "Brief explanation (string)"
+    }}
+  ],
+  "key_themes": [
+    "Theme or Keyword 1 (e.g., 'Battery Life', 'Customer Service', 'Video Quality')"
+  ]
+}}
+"""
+
+
+def format_analytics_for_prompt(summary: Dict[str, Any]) -> str:
+    """Formats an analytics summary (see analytics.MetadataAnalytics) as compact lines for the LLM prompt."""
+    sentiments = summary.get('sentiments', {})
+    lines = [f"Documents: {summary.get('document_count', 0)}",
+             f"Overall sentiment: {sentiments.get('positive', 0)} positive, {sentiments.get('neutral', 0)} neutral, "
+             f"{sentiments.get('negative', 0)} negative (mean compound score {sentiments.get('mean_compound_score')})"]
+    if summary.get('source_types'):
+        lines.append("Sources: " + ", ".join(f"{name}: {count}" for name, count in summary['source_types'].items()))
+    for aspect in summary.get('aspects', []):
+        lines.append(f"Aspect '{aspect['aspect']}': {aspect['mentions']} mentions in {aspect['documents']} documents "
+                     f"({aspect['positive']} positive, {aspect['neutral']} neutral, {aspect['negative']} negative, "
+                     f"mean score {aspect['mean_score']})")
+    return "\n".join(lines)
+
+
+def format_chroma_results_for_prompt(chroma_results: Dict[str, List[Any]], side_store: Optional[Any] = None) -> str:
     """
     Formats the raw dictionary results from chromadb.Collection.query
     into a single string context suitable for the LLM prompt.
@@ -68,6 +124,8 @@ def format_chroma_results_for_prompt(chroma_results: Dict[str, List[Any]]) -> st
     Args:
         chroma_results: The dictionary returned by collection.query.
                         Expected keys: 'ids', 'documents', 'metadatas'.
+        side_store: Optional SideStore. Product details and original titles are
+                    looked up there (in one batch) for the formatted documents only.
 
     Returns:
         A single string containing formatted document contexts, separated by newlines.
@@ -92,6 +150,12 @@ def format_chroma_results_for_prompt(chroma_results: Dict[str, List[Any]]) -> st
     # Slice lists to the minimum length
     ids, documents, metadatas = ids[:min_len], documents[:min_len], metadatas[:min_len]
 
+    # Join the side store lazily: only for the documents being formatted
+    side_texts, products = {}, {}
+    if side_store is not None:
+        side_texts = side_store.get_texts(ids)
+        products = side_store.get_products((meta or {}).get('product_id') for meta in metadatas)
+
     # Iterate through documents and format
     for i in range(min_len):
         doc_id = ids[i]
@@ -100,6 +164,19 @@ def format_chroma_results_for_prompt(chroma_results: Dict[str, List[Any]]) -> st
 
         # Build the metadata information string for this document
         meta_info = f"Source: {meta.get('source_type', 'unknown')}"
+        # Product attributes come from the side store (older collections still carry them in metadata)
+        product = products.get(meta.get('product_id')) or meta
+        if product.get('product_title'):
+             meta_info += f", Product: {product['product_title']}"
+             if product.get('product_rating_overall') is not None:
+                  meta_info += f" (overall rating {product['product_rating_overall']}"
+                  if product.get('product_review_count') is not None:
+                       meta_info += f", {product['product_review_count']} reviews"
+                  meta_info += ")"
+        doc_texts = side_texts.get(doc_id) or meta
+        doc_title = doc_texts.get('review_title_orig') or doc_texts.get('title_orig') or doc_texts.get('post_title_orig')
+        if doc_title:
+             meta_info += f", Title: {doc_title}"
         if meta.get('sentiment_label'):
              meta_info += f", Overall Sentiment: {meta['sentiment_label']}"
 
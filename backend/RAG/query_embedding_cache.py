@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL_SECONDS = 3600.0
+
+
+def normalize_query(query: str) -> str:
+    """Case-folds and collapses whitespace, so trivially different spellings share one embedding."""
+    return " ".join(query.casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with a time-to-live, keyed by
+    (model name, normalized query text). Thread-safe, so one instance can be
+    shared by every request of the Flask app.
+
+    Args:
+        embed_query: callable(text) -> embedding, called on a miss with the normalized text.
+        model_name: embedding model identifier, part of the cache key.
+        embed_queries: optional callable(list of texts) -> embeddings, used by get_many
+                       to embed all missing queries in one call.
+        max_size: entries kept before the least recently used one is evicted.
+        ttl_seconds: entries older than this are embedded again.
+    """
+    def __init__(self, embed_query: Callable[[str], List[float]], model_name: str,
+                 max_size: int = DEFAULT_MAX_SIZE, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 embed_queries: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        self.embed_query = embed_query
+        self.embed_queries = embed_queries
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Tuple[str, str], now: float) -> Optional[List[float]]:
+        """Cached embedding or None; counts the hit or miss. Must be called with the lock held."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, embedding = entry
+            if now - created_at <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return None
+
+    def _store(self, key: Tuple[str, str], embedding: List[float]):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, query: str) -> List[float]:
+        """Returns the embedding of `query`, embedding it only on a miss or after expiry."""
+        normalized = normalize_query(query)
+        key = (self.model_name, normalized)
+        with self._lock:
+            embedding = self._lookup(key, time.monotonic())
+        if embedding is not None:
+            return embedding
+
+        # Embed outside the lock so slow API calls don't block other requests
+        embedding = list(self.embed_query(normalized))
+        self._store(key, embedding)
+        return embedding
+
+    def get_many(self, queries: List[str]) -> List[List[float]]:
+        """
+        Returns one embedding per query. All missing (distinct) queries are
+        embedded together with embed_queries when it is available.
+        """
+        keys = [(self.model_name, normalize_query(query)) for query in queries]
+        found: Dict[Tuple[str, str], List[float]] = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                embedding = self._lookup(key, now)
+                if embedding is not None:
+                    found[key] = embedding
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            texts = [normalized for _, normalized in missing]
+            embeddings = self.embed_queries(texts) if self.embed_queries else [self.embed_query(text) for text in texts]
+            for key, embedding in zip(missing, embeddings):
+                found[key] = list(embedding)
+                self._store(key, found[key])
+        return [found[key] for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'model_name': self.model_name,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
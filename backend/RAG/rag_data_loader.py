@@ -1,37 +1,63 @@
 import pandas as pd
-import re
 import os
 import logging
-import json # Needed for parsing and dumping JSON strings
+import argparse
 
 # --- ChromaDB and Embedding Imports ---
 import chromadb
 import dotenv
-# Use the embedding function provided by chromadb.utils
-from chromadb.utils import embedding_functions
 from typing import List # Needed for type hinting in the wrapper if used
+from metadata_conversion import build_metadatas_columnar
+from embedding_cache import EmbeddingCache
+from ingestion_pipeline import IngestionPipeline
+from embedding_backends import create_embedding_backend, collection_name_for_backend
+from bm25_index import BM25Index
+from collection_sync import add_content_hashes, fetch_collection_hashes, plan_sync, delete_stale_documents
+from result_cache import bump_collection_version
+from context_builder import write_document_snippets
+from metadata_filters import DATE_FIELD, EQUALITY_FILTERS
+import config
 
 # --- Basic Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('chroma_csv_loader')
 
-# Load environment variables (make sure your .env file has GOOGLE_API_KEY)
+# Load environment variables (make sure your .env file has GOOGLE_API_KEY when using the Google backend)
 dotenv.load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# 'google' (Generative AI API) or 'local' (TF-IDF + LSA model, see embedding_backends.py)
+EMBEDDING_BACKEND = config.EMBEDDING_BACKEND
 
 # --- Configuration ---
 # The CSV file generated by the processing pipeline
-csv_file_path = "processed_output/chroma_prepared_final.csv" 
-# Directory where ChromaDB data will be stored
-persist_directory = "../chroma_db_market_research"
-# The name of the collection in ChromaDB
-collection_name = "market_data_main"
+csv_file_path = config.PREPARED_CSV_PATH
+# Side store read by the app; the document context snippets are added to it
+side_store_path = config.SIDE_STORE_PATH
+# Directory where ChromaDB data will be stored (the one the app opens, independent of the working directory)
+persist_directory = config.PERSIST_DIRECTORY
+# Directory of the BM25 keyword index, kept in step with the collection (the one the app loads)
+bm25_index_dir = config.BM25_INDEX_PATH
+# Version file read by the app's retrieval result cache (same path as the app); bumped after every write
+collection_version_path = config.COLLECTION_VERSION_PATH
+# Directory of the persistent embedding cache (one sub-directory per embedding model)
+embedding_cache_dir = config.EMBEDDING_CACHE_PATH
+# Name of the Google embedding model
+embedding_model_name = config.EMBEDDING_MODEL
+# Directory of the local embedding model (python embedding_backends.py train), the one the app loads
+local_embedding_model_path = config.LOCAL_EMBEDDING_MODEL_PATH
+# The name of the collection in ChromaDB (non-Google backends use their own collection)
+collection_name = collection_name_for_backend(config.COLLECTION_NAME, EMBEDDING_BACKEND)
 # Column names in the CSV that correspond to ChromaDB fields
 id_column = "chroma_id"
 document_column = "document_text"
 
+parser = argparse.ArgumentParser(description="Load the processed CSV into ChromaDB.")
+parser.add_argument("--sync", action="store_true",
+                    help="Only upsert new or changed rows and delete documents missing from the CSV.")
+args = parser.parse_args()
+
 # --- Validate API Key ---
-if not GOOGLE_API_KEY:
+if EMBEDDING_BACKEND == "google" and not GOOGLE_API_KEY:
     logger.error("GOOGLE_API_KEY not found in environment variables. Please set it.")
     exit(1)
 
@@ -54,68 +80,30 @@ if id_column not in data.columns or document_column not in data.columns:
     logger.error(f"CSV must contain '{id_column}' and '{document_column}' columns.")
     exit(1)
 
+# A CSV prepared before data processing wrote these would load a collection on which product and date filters match nothing
+missing_filter_columns = [col for col in (EQUALITY_FILTERS['product_asin'], DATE_FIELD) if col not in data.columns]
+if missing_filter_columns:
+    logger.error(f"CSV is missing the filter columns {', '.join(missing_filter_columns)}. "
+                 f"Re-run data_processing/main.py to regenerate {csv_file_path}.")
+    exit(1)
+
 # Get IDs and Documents, ensuring they are strings
 chroma_ids = data[id_column].astype(str).tolist()
 chroma_documents = data[document_column].astype(str).tolist()
 
 # Prepare Metadatas
-metadata_columns = [col for col in data.columns if col not in [id_column, document_column]]
-chroma_metadatas = []
+# Columns are converted whole (type inferred once per column) instead of cell by cell;
+# see metadata_conversion.py for the reference per-cell rules and a benchmark.
+# Raw texts and product attributes belong in the side store (processed_output/side_store.sqlite3),
+# not in the vector-store metadata; CSVs prepared before the side store existed still carry them.
+side_store_columns = ['original_text', 'review_title_orig', 'review_comment_orig', 'title_orig', 'post_title_orig',
+                      'product_asin', 'product_title', 'product_url', 'product_rating_overall', 'product_review_count']
+metadata_columns = [col for col in data.columns if col not in [id_column, document_column] + side_store_columns]
 
 logger.info("Preparing metadata for ChromaDB...")
-for index, row in data.iterrows():
-    meta = {}
-    for col in metadata_columns:
-        value = row[col]
-
-        # Skip empty strings or pandas NaN representations
-        if isinstance(value, str) and not value.strip():
-            continue
-        if pd.isna(value):
-             continue
-
-        # --- Metadata Value Conversion ---
-        # Attempt to convert known string representations back to native types
-        # This is important for ChromaDB's metadata filtering capabilities
-        if isinstance(value, str):
-            lower_value = value.lower()
-            if lower_value == 'true':
-                meta[col] = True
-            elif lower_value == 'false':
-                meta[col] = False
-            # Attempt to convert to int or float
-            elif re.fullmatch(r'-?\d+', value):
-                 try: meta[col] = int(value)
-                 except (ValueError, OverflowError): meta[col] = value # Keep as string if conversion fails
-            elif re.fullmatch(r'-?\d+\.\d+(?:e-?\d+)?', value):
-                 try: meta[col] = float(value)
-                 except ValueError: meta[col] = value # Keep as string if conversion fails
-            # Attempt to parse JSON strings back into lists/dicts
-            # If parsing results in a list or dict, convert it BACK to a JSON string for ChromaDB
-            elif value.startswith('[') or value.startswith('{'):
-                 try:
-                     parsed_value = json.loads(value)
-                     # Check if the parsed value is a list or dict
-                     if isinstance(parsed_value, (list, dict)):
-                          # Convert it back to a JSON string for ChromaDB metadata
-                          meta[col] = json.dumps(parsed_value)
-                          # logger.debug(f"Converted JSON string for column '{col}' back to string for ChromaDB.") # Too verbose
-                     else:
-                          # If it was a JSON string for a primitive (like "123"), keep the parsed primitive
-                          meta[col] = parsed_value
-                          # logger.debug(f"Parsed JSON string for column '{col}' to primitive type {type(parsed_value)}.") # Too verbose
-                 except json.JSONDecodeError:
-                      # If it's not valid JSON, keep it as the original string
-                      meta[col] = value
-                      logger.debug(f"Column '{col}' looks like JSON but failed to parse. Keeping as string.")
-            else:
-                meta[col] = value # Keep as string if no specific conversion applies
-        else:
-             # Fallback for any other unexpected types - convert to string
-             meta[col] = str(value)
-             logger.debug(f"Converted unexpected type for column '{col}' to string: {type(value)}")
-
-    chroma_metadatas.append(meta)
+chroma_metadatas = build_metadatas_columnar(data, metadata_columns)
+# Every row carries the hash of its text + metadata, which --sync compares against
+add_content_hashes(chroma_documents, chroma_metadatas)
 
 # Final sanity check on list lengths
 if not (len(chroma_ids) == len(chroma_documents) == len(chroma_metadatas)):
@@ -126,18 +114,23 @@ logger.info(f"Prepared {len(chroma_ids)} items for ChromaDB ingestion.")
 
 # --- Initialize Embedding Function and ChromaDB Client ---
 try:
-    google_ef = embedding_functions.GoogleGenerativeAiEmbeddingFunction(
+    embedding_backend = create_embedding_backend(
+        EMBEDDING_BACKEND,
+        model_name=embedding_model_name, # Verify this model is available and supported by your key
         api_key=GOOGLE_API_KEY,
-        model_name="models/embedding-001" # Verify this model is available and supported by your key
+        local_model_path=local_embedding_model_path
     )
+    # Only texts that are new or changed since the last load are embedded (cache keyed by backend model name)
+    embedding_cache = EmbeddingCache(embedding_cache_dir, embedding_backend.name)
     # Use PersistentClient to store the database on disk
     client = chromadb.PersistentClient(path=persist_directory)
     logger.info(f"ChromaDB PersistentClient initialized at '{persist_directory}'.")
-    logger.info(f"GoogleGenerativeAiEmbeddingFunction initialized for model '{google_ef.model_name}'.")
+    logger.info(f"'{EMBEDDING_BACKEND}' embedding backend initialized for model '{embedding_backend.name}'.")
+    logger.info(f"Embedding cache at '{embedding_cache.directory}' holds {len(embedding_cache)} vectors.")
 
 except Exception as e:
     logger.error(f"Error initializing embeddings function or ChromaDB client: {e}")
-    logger.error("Please ensure 'chromadb', 'google-generativeai', and 'python-dotenv' are installed and GOOGLE_API_KEY is set correctly.")
+    logger.error("Please ensure 'chromadb', 'langchain-google-genai', and 'python-dotenv' are installed and GOOGLE_API_KEY is set correctly (or train the local model).")
     exit(1)
 
 # --- Get or Create Collection and Add Data ---
@@ -146,37 +139,70 @@ try:
     # Get or create the collection, associating it with the embedding function
     collection = client.get_or_create_collection(
         name=collection_name,
-        embedding_function=google_ef
+        embedding_function=embedding_backend
     )
     logger.info(f"Collection '{collection_name}' ready. It currently contains {collection.count()} documents.")
 
-    # Add data in batches
-    batch_size = 500 # Adjust batch size based on memory/API limits
+    bm25_index = BM25Index.load_or_create(bm25_index_dir)
+    # Snippets are rendered for every row of the CSV, also when --sync writes only the changed ones
+    snippet_ids, snippet_metadatas = chroma_ids, chroma_metadatas
+    deleted_count = 0
+    if args.sync:
+        # Only rows whose content hash differs from the stored one are written,
+        # and documents that disappeared from the CSV are removed
+        sync_plan = plan_sync(chroma_ids, chroma_metadatas, fetch_collection_hashes(collection))
+        logger.info(f"Sync plan: {sync_plan.summary()}")
+        delete_stale_documents(collection, sync_plan.delete_ids)
+        bm25_index.remove(sync_plan.delete_ids)
+        deleted_count = len(sync_plan.delete_ids)
+        chroma_ids = [chroma_ids[i] for i in sync_plan.upsert_indices]
+        chroma_documents = [chroma_documents[i] for i in sync_plan.upsert_indices]
+        chroma_metadatas = [chroma_metadatas[i] for i in sync_plan.upsert_indices]
+
+    # Embed and write in batches: several embedding requests run concurrently
+    # while a single writer upserts the finished batches into the collection
+    batch_size = 100 # Texts per embedding request / upsert
+    max_in_flight = 4 # Concurrent embedding requests; lower it if the API rate-limits
     total_items = len(chroma_ids)
 
     logger.info(f"Adding/updating {total_items} documents to collection '{collection_name}' in batches of {batch_size}...")
 
-    # Optional: Consider deleting existing documents if doing a full refresh
-    # collection.delete(ids=collection.get()['ids']) # Dangerous! Use with caution.
-
-    for i in range(0, total_items, batch_size):
-        batch_end = min(i + batch_size, total_items)
-        batch_ids = chroma_ids[i:batch_end]
-        batch_docs = chroma_documents[i:batch_end]
-        batch_metas = chroma_metadatas[i:batch_end]
-
-        # Use add or upsert. add will raise error if ID exists. upsert updates if ID exists, adds if not.
-        # If your IDs are unique per run, add is fine. If you might re-process data, upsert is safer.
-        # collection.add(ids=batch_ids, documents=batch_docs, metadatas=batch_metas) # Use add for unique IDs
-        collection.upsert(ids=batch_ids, documents=batch_docs, metadatas=batch_metas) # Use upsert for robustness
+    # Upsert updates existing IDs and adds new ones, so re-processed data is safe to load again
+    pipeline = IngestionPipeline(
+        embed_fn=lambda texts: embedding_cache.embed(texts, embedding_backend),
+        write_fn=collection.upsert,
+        batch_size=batch_size,
+        max_in_flight=max_in_flight
+    )
+    ingestion_stats = pipeline.run(chroma_ids, chroma_documents, chroma_metadatas)
+    logger.info(f"Ingestion throughput: {ingestion_stats['items_per_second']} items/s "
+                f"(embedding {ingestion_stats['embed_seconds']}s, writing {ingestion_stats['write_seconds']}s).")
 
-        logger.info(f"Processed batch {i//batch_size + 1}/{(total_items + batch_size - 1)//batch_size} ({batch_end}/{total_items} items)")
+    # Index the same rows for keyword retrieval (unchanged texts are skipped)
+    bm25_updated = bm25_index.add_documents(chroma_ids, chroma_documents)
+    bm25_index.save()
+    logger.info(f"BM25 index: {bm25_updated} documents (re)indexed, {len(bm25_index)} in total.")
 
+    # Cached retrieval results of the previous version are no longer served
+    if total_items or deleted_count:
+        bump_collection_version(collection_version_path)
 
     logger.info(f"Finished adding/updating documents. Collection '{collection_name}' now contains {collection.count()} documents.")
+    cache_stats = embedding_cache.stats()
+    logger.info(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} texts embedded, {cache_stats['cached_vectors']} vectors cached.")
 
 except Exception as e:
     logger.error(f"An error occurred during ChromaDB collection handling or data addition: {e}", exc_info=True)
+    # Part of the data may have been written, so results cached before the failure are not reused
+    bump_collection_version(collection_version_path)
     exit(1)
 
+# --- Pre-render the prompt context snippets ---
+# The app looks these up instead of re-rendering each document's metadata per request
+try:
+    write_document_snippets(side_store_path, snippet_ids, snippet_metadatas, config.CONTEXT_MAX_ASPECTS)
+except Exception as e:
+    # The app renders documents without a snippet at query time, so the load itself succeeded
+    logger.warning(f"Could not write the document context snippets: {e}")
+
 logger.info("ChromaDB loading process completed.")
@@ -5,9 +5,13 @@ from typing import List, Dict, Any
 
 # Import modules from the local package
 import config
-from RAG_components import initialize_rag_components
+from RAG_components import initialize_rag_components, get_query_embedding_cache, get_result_cache
 from retrieval_methods import RetrievalMethods
-from prompt_formatter import RAG_PROMPT_TEMPLATE, format_chroma_results_for_prompt
+from bm25_index import load_keyword_index
+from metadata_filters import load_filter_index
+from reranker import load_reranker
+from prompt_formatter import RAG_PROMPT_TEMPLATE
+from context_builder import build_prompt_context
 
 # LangChain Imports for the chain structure
 from langchain_core.runnables import RunnablePassthrough
@@ -32,7 +36,12 @@ if __name__ == "__main__":
         exit(1)
 
     # Instantiate RetrievalMethods class with the initialized collection and k
-    retriever_methods = RetrievalMethods(chroma_collection, k=config.RETRIEVER_K)
+    retriever_methods = RetrievalMethods(chroma_collection, k=config.RETRIEVER_K,
+                                         query_embedding_cache=get_query_embedding_cache(),
+                                         keyword_index=load_keyword_index(config.BM25_INDEX_PATH),
+                                         result_cache=get_result_cache(),
+                                         filter_index=load_filter_index(chroma_collection),
+                                         reranker=load_reranker(config.RERANKER_MODEL_PATH) if config.RERANK_RESULTS else None)
 
     # Define the sample query for testing
     sample_query = "Analyze user feedback regarding the Arlo Essential Security Camera, focusing on battery life and video quality."
@@ -89,7 +98,7 @@ if __name__ == "__main__":
 
             # --- Format Retrieved Documents into Context String ---
             # Use the helper function to create the context string for the LLM
-            formatted_context = format_chroma_results_for_prompt(retrieved_docs_chroma_format)
+            formatted_context, _ = build_prompt_context(retrieved_docs_chroma_format, token_budget=config.CONTEXT_TOKEN_BUDGET)
 
             # Check if the formatted context is empty (e.g., if documents had no text)
             if not formatted_context.strip():
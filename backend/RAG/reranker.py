@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Features of a (query, candidate) pair, in model weight order
+FEATURE_NAMES = ['retrieval_rank', 'term_overlap', 'phrase_overlap', 'tfidf_overlap', 'aspect_match', 'mention_match']
+# Used until a model is trained: lexical and aspect evidence outweigh the first-stage order
+DEFAULT_WEIGHTS = [1.0, 1.5, 1.0, 1.0, 0.8, 0.5]
+DEFAULT_BIAS = 0.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Query words that carry no aspect (document texts are already stopword-free)
+_QUERY_STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could do does for from get good has have how i if in
+is it its like me my of on or our should so than that the their them there these they this to too use was we what
+when where which who why will with would you your
+""".split())
+
+
+def _normalize_token(token: str) -> str:
+    """Folds simple plurals so 'batteries' matches the lemmatized 'battery' of the processed texts."""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [_normalize_token(token) for token in _TOKEN_RE.findall((text or '').lower())]
+
+
+def _bigrams(tokens: Sequence[str]) -> Set[str]:
+    return {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def _parse_json(value: Any) -> Any:
+    """Metadata lists are stored as JSON strings (see metadata_conversion.py)."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    return value
+
+
+class QueryFeatures:
+    """Query terms and bigrams, computed once per query for all of its candidates."""
+    def __init__(self, query: str):
+        tokens = [token for token in tokenize(query) if token not in _QUERY_STOPWORDS]
+        self.terms = set(tokens)
+        self.bigrams = _bigrams(tokens)
+
+
+def candidate_features(query: QueryFeatures, rank: int, document: Optional[str],
+                       metadata: Optional[Dict[str, Any]]) -> List[float]:
+    """
+    Features of one candidate, in FEATURE_NAMES order (each in [0, 1]):
+    first-stage rank prior, share of query terms / bigrams in the text, TF-IDF
+    weight of the query terms among the document's tfidf_features, share of query
+    terms that are an extracted aspect, and share found in the product mentions.
+    """
+    metadata = metadata or {}
+    doc_tokens = tokenize(document)
+    doc_terms = set(doc_tokens)
+    terms = query.terms
+    term_count = len(terms) or 1
+
+    tfidf_overlap = 0.0
+    for entry in _parse_json(metadata.get('tfidf_features')) or []:
+        if isinstance(entry, list) and len(entry) == 2:
+            feature_tokens = tokenize(entry[0])
+            if feature_tokens and (" ".join(feature_tokens) in query.bigrams or
+                                   (len(feature_tokens) == 1 and feature_tokens[0] in terms)):
+                tfidf_overlap += float(entry[1])
+
+    aspects = set()
+    for entry in _parse_json(metadata.get('aspect_sentiments')) or []:
+        if isinstance(entry, dict):
+            aspects.update(tokenize(entry.get('aspect')))
+    mentions = set()
+    for mention in _parse_json(metadata.get('product_mentions')) or []:
+        if isinstance(mention, str):
+            mentions.update(tokenize(mention))
+
+    return [
+        1.0 / (1.0 + rank),
+        len(terms & doc_terms) / term_count,
+        len(query.bigrams & _bigrams(doc_tokens)) / len(query.bigrams) if query.bigrams else 0.0,
+        min(tfidf_overlap, 1.0),
+        len(terms & aspects) / term_count,
+        len(terms & mentions) / term_count,
+    ]
+
+
+class LinearReranker:
+    """
+    Second-stage reranker: a linear model over cheap lexical and metadata
+    features of each candidate (see candidate_features), scored on CPU.
+    The weights can be trained on judged candidates with fit() (logistic
+    regression) and stored as JSON; without a trained model DEFAULT_WEIGHTS are used.
+    """
+    def __init__(self, weights: Sequence[float] = DEFAULT_WEIGHTS, bias: float = DEFAULT_BIAS,
+                 name: str = "default"):
+        if len(weights) != len(FEATURE_NAMES):
+            raise ValueError(f"Expected {len(FEATURE_NAMES)} weights ({', '.join(FEATURE_NAMES)}), got {len(weights)}")
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.name = name
+
+    @property
+    def fingerprint(self) -> str:
+        """Short hash of the model; results reranked with other weights are cached apart."""
+        payload = json.dumps([self.weights.tolist(), self.bias])
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+    def features(self, query: str, documents: Sequence[Optional[str]],
+                 metadatas: Sequence[Optional[Dict[str, Any]]]) -> np.ndarray:
+        """(n, len(FEATURE_NAMES)) features of the candidates of a query, given in first-stage order."""
+        query_features = QueryFeatures(query)
+        rows = [candidate_features(query_features, rank, document, metadatas[rank] if rank < len(metadatas) else None)
+                for rank, document in enumerate(documents)]
+        return np.asarray(rows, dtype=np.float64).reshape(len(rows), len(FEATURE_NAMES))
+
+    def score(self, query: str, documents: Sequence[Optional[str]],
+              metadatas: Sequence[Optional[Dict[str, Any]]]) -> np.ndarray:
+        return self.features(query, documents, metadatas) @ self.weights + self.bias
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: Sequence[float], epochs: int = 500,
+            learning_rate: float = 0.5, l2: float = 1e-3) -> "LinearReranker":
+        """Logistic regression (full-batch gradient descent) on judged candidates: label 1 = relevant."""
+        x = np.asarray(features, dtype=np.float64)
+        y = np.asarray(labels, dtype=np.float64)
+        if len(x) == 0 or len(x) != len(y):
+            raise ValueError("fit needs one label per feature row.")
+        weights = np.zeros(x.shape[1])
+        bias = 0.0
+        for _ in range(epochs):
+            predictions = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+            error = predictions - y
+            weights -= learning_rate * (x.T @ error / len(y) + l2 * weights)
+            bias -= learning_rate * float(error.mean())
+        accuracy = float(((x @ weights + bias > 0) == (y > 0.5)).mean())
+        logger.info(f"Reranker trained on {len(y)} judged candidates (training accuracy {accuracy:.3f}).")
+        return cls(weights.tolist(), bias, name=f"trained-{len(y)}")
+
+    def save(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'name': self.name, 'features': FEATURE_NAMES, 'weights': self.weights.tolist(),
+                       'bias': self.bias}, f, indent=2)
+        os.replace(tmp_path, path)
+        logger.info(f"Reranker model saved to {path}.")
+
+    @classmethod
+    def load(cls, path: str) -> "LinearReranker":
+        with open(path, 'r', encoding='utf-8') as f:
+            model = json.load(f)
+        if model.get('features') != FEATURE_NAMES:
+            raise ValueError(f"Reranker model {path} was trained on other features: {model.get('features')}")
+        return cls(model['weights'], model.get('bias', 0.0), name=model.get('name', os.path.basename(path)))
+
+
+def load_reranker(path: Optional[str]) -> LinearReranker:
+    """The trained reranker at `path`, or the default weights when no model was trained."""
+    if path and os.path.exists(path):
+        try:
+            reranker = LinearReranker.load(path)
+            logger.info(f"Loaded reranker model '{reranker.name}' from {path}.")
+            return reranker
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load the reranker model {path}, using the default weights: {e}")
+    return LinearReranker()
+
+
+def timed_rerank(reranker: LinearReranker, query: str, documents: Sequence[Optional[str]],
+                 metadatas: Sequence[Optional[Dict[str, Any]]]):
+    """Returns (candidate positions best first, their scores, elapsed milliseconds); ties keep the first-stage order."""
+    start_time = time.perf_counter()
+    scores = reranker.score(query, documents, metadatas)
+    order = [int(i) for i in np.argsort(-scores, kind='stable')]
+    return order, [float(scores[i]) for i in order], (time.perf_counter() - start_time) * 1000
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Train the linear reranker on judged candidates.")
+    parser.add_argument("labels_path",
+                        help='JSONL, one judged candidate per line: {"query", "chroma_id", "rank", "label"} '
+                             '(rank = 0-based first-stage position, label 1 = relevant, 0 = not)')
+    parser.add_argument("--csv", default="processed_output/chroma_prepared_final.csv",
+                        help="Processed CSV holding the candidates' texts and metadata.")
+    parser.add_argument("--output", default="../reranker_model.json")
+    parser.add_argument("--epochs", type=int, default=500)
+    args = parser.parse_args()
+
+    data = pd.read_csv(args.csv, header=0, keep_default_na=False, dtype=str).set_index("chroma_id")
+    rows, labels = [], []
+    with open(args.labels_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            judged = json.loads(line)
+            if judged['chroma_id'] not in data.index:
+                logger.warning(f"Skipping unknown document {judged['chroma_id']}.")
+                continue
+            record = data.loc[judged['chroma_id']]
+            rows.append(candidate_features(QueryFeatures(judged['query']), int(judged.get('rank', 0)),
+                                           record['document_text'], record.to_dict()))
+            labels.append(float(judged['label']))
+    LinearReranker.fit(np.asarray(rows), labels, epochs=args.epochs).save(args.output)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from .query_embedding_cache import normalize_query
+except ImportError:
+    from query_embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 512
+# Version reported before any writer has bumped the version file
+INITIAL_VERSION = "0"
+
+
+# --- Collection version ---
+
+def bump_collection_version(path: str) -> str:
+    """
+    Marks the collection as changed: writes a new version token to `path`
+    (atomically) and returns it. Called by every writer of the collection
+    (rag_data_loader.py, snapshot imports, vector index builds).
+    """
+    counter = 0
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                counter = int(json.load(f).get('counter', 0))
+        except (OSError, ValueError):
+            logger.warning(f"Unreadable collection version file {path}; starting a new version sequence.")
+    counter += 1
+    # The random suffix keeps versions distinct even if the file is deleted and recreated
+    version = f"{counter}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'counter': counter, 'updated_at': time.time()}, f)
+    os.replace(tmp_path, path)
+    logger.info(f"Collection version is now {version}.")
+    return version
+
+
+class CollectionVersion:
+    """
+    Reads the version token written by bump_collection_version. The file is
+    re-read only when its modification time or size changes, so calling
+    current() on every request costs one os.stat.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._stat_key = None
+        self._version = INITIAL_VERSION
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return INITIAL_VERSION
+        stat_key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            if stat_key != self._stat_key:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._version = str(json.load(f)['version'])
+                    self._stat_key = stat_key
+                except (OSError, ValueError, KeyError):
+                    # Mid-replace or corrupt: use a version no cached entry can have
+                    return f"unreadable-{time.time_ns()}"
+            return self._version
+
+
+# --- Result cache ---
+
+class RetrievalResultCache:
+    """
+    Cache of retrieval results keyed by (normalized query, method, k, filters,
+    collection version), so a repeated question skips the vector store and the
+    keyword index entirely. Because the collection version is part of the key,
+    any write to the collection makes every older entry unreachable; stale
+    results are never served, they just age out of the LRU.
+
+    Tiers:
+        - in-process LRU of up to max_size entries;
+        - optional SQLite file (sqlite_path) shared by all processes of the app
+          (e.g. several gunicorn workers). Rows of older versions are deleted
+          the first time a new version is seen.
+
+    Entries are stored as JSON, so every hit returns a fresh copy that callers may modify.
+
+    Args:
+        version_source: callable returning the current collection version.
+        namespace: identifies the collection and embedding model, so caches of
+                   different backends can share one SQLite file.
+        max_size: in-process entries kept before the least recently used one is evicted.
+        sqlite_path: optional path of the shared SQLite tier.
+    """
+    def __init__(self, version_source: Callable[[], str], namespace: str = "",
+                 max_size: int = DEFAULT_MAX_SIZE, sqlite_path: Optional[str] = None):
+        self.version_source = version_source
+        self.namespace = namespace
+        self.max_size = max_size
+        self.sqlite_path = sqlite_path
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._seen_version = None
+        self._db = None
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS retrieval_results ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, created_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, query: str, method: str, k: int, filters: Optional[Dict[str, Any]], version: str) -> str:
+        payload = [self.namespace, normalize_query(query), method, k, filters, version]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _on_version(self, version: str):
+        """Drops the in-process entries and the shared rows of older versions when the version changes."""
+        with self._lock:
+            if version == self._seen_version:
+                return
+            if self._seen_version is not None:
+                logger.info(f"Collection version changed to {version}; dropping cached retrieval results.")
+            self._seen_version = version
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM retrieval_results WHERE version != ?", (version,))
+                self._db.commit()
+
+    def get(self, query: str, method: str, k: int, filters: Optional[Dict[str, Any]] = None,
+            version: Optional[str] = None) -> Optional[Any]:
+        """Cached result for the current (or the given) collection version, or None."""
+        version = version or self.version_source()
+        self._on_version(version)
+        key = self.make_key(query, method, k, filters, version)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(value)
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM retrieval_results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.shared_hits += 1
+                    self._remember(key, row[0])
+                    return json.loads(row[0])
+            self.misses += 1
+        return None
+
+    def put(self, query: str, method: str, k: int, filters: Optional[Dict[str, Any]], result: Any,
+            version: Optional[str] = None):
+        """
+        Stores a result. Pass the version read before the result was computed, so
+        a result computed while a writer bumped the version is filed under the old one.
+        """
+        current = self.version_source()
+        self._on_version(current)
+        if version is not None and version != current:
+            # The collection changed while the result was computed; it may already be stale
+            return
+        key = self.make_key(query, method, k, filters, current)
+        # numpy scalars/arrays (e.g. distances from some vector stores) become plain lists and floats
+        value = json.dumps(result, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO retrieval_results (key, version, created_at, value) "
+                                 "VALUES (?, ?, ?, ?)", (key, current, time.time(), value))
+                self._db.commit()
+
+    def _remember(self, key: str, value: str):
+        """Adds an entry to the in-process LRU. Must be called with the lock held."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, query: str, method: str, k: int, filters: Optional[Dict[str, Any]],
+                       compute: Callable[[], Any], version: Optional[str] = None) -> Any:
+        """
+        Returns the cached result, or computes, stores and returns it. Pass the
+        version the data behind compute() reflects (the current one by default).
+        """
+        version = version or self.version_source()
+        cached = self.get(query, method, k, filters, version=version)
+        if cached is not None:
+            return cached
+        result = compute()
+        self.put(query, method, k, filters, result, version=version)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM retrieval_results")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'collection_version': self._seen_version,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'shared_tier': self.sqlite_path,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.shared_hits) / lookups, 3) if lookups else None,
+            }
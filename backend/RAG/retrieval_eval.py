@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import config
+
+try:
+    from .embedding_backends import LocalLsaEmbeddingBackend
+    from .vector_index import QuantizedVectorIndex
+    from .bm25_index import BM25Index
+    from .metadata_conversion import build_metadatas_columnar
+    from .query_embedding_cache import QueryEmbeddingCache
+    from .retrieval_methods import RetrievalMethods
+    from .reranker import load_reranker
+except ImportError:
+    from embedding_backends import LocalLsaEmbeddingBackend
+    from vector_index import QuantizedVectorIndex
+    from bm25_index import BM25Index
+    from metadata_conversion import build_metadatas_columnar
+    from query_embedding_cache import QueryEmbeddingCache
+    from retrieval_methods import RetrievalMethods
+    from reranker import load_reranker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV_PATH = "processed_output/chroma_prepared_final.csv"
+# Dimensions of the fixture's local LSA model (the corpus is small)
+DEFAULT_FIXTURE_COMPONENTS = 128
+# Silver query set: terms mentioned by at least / at most this many documents
+SILVER_MIN_DOCS = 3
+SILVER_MAX_DOCS = 40
+SILVER_QUERY_COUNT = 30
+
+
+class EvalFixture:
+    """
+    Offline, deterministic copy of the retrieval stack: a local LSA model
+    (fixed random state), a quantized vector index and a BM25 index built
+    from the processed CSV. No API key, network or ChromaDB is needed.
+    """
+    def __init__(self, collection: QuantizedVectorIndex, keyword_index: BM25Index, embedding_backend: LocalLsaEmbeddingBackend,
+                 data: pd.DataFrame):
+        self.collection = collection
+        self.keyword_index = keyword_index
+        self.embedding_backend = embedding_backend
+        self.data = data
+
+    @classmethod
+    def build(cls, csv_path: str = DEFAULT_CSV_PATH, directory: Optional[str] = None, model_path: Optional[str] = None,
+              components: int = DEFAULT_FIXTURE_COMPONENTS, dtype: str = 'int8') -> "EvalFixture":
+        """Builds the fixture in `directory` (a new temporary directory by default)."""
+        start_time = time.perf_counter()
+        directory = directory or tempfile.mkdtemp(prefix="retrieval_eval_")
+        data = pd.read_csv(csv_path, header=0, keep_default_na=False, dtype=str)
+        ids = data['chroma_id'].tolist()
+        documents = data['document_text'].tolist()
+        metadatas = build_metadatas_columnar(data, [col for col in data.columns if col not in ('chroma_id', 'document_text')])
+
+        if model_path:
+            embedding_backend = LocalLsaEmbeddingBackend.load(model_path)
+        else:
+            embedding_backend = LocalLsaEmbeddingBackend.fit(documents, n_components=components)
+        index_directory = os.path.join(directory, 'vector_index')
+        QuantizedVectorIndex.build(index_directory, ids, embedding_backend(documents), documents, metadatas, dtype=dtype)
+        collection = QuantizedVectorIndex(index_directory, embedding_function=embedding_backend)
+
+        keyword_index = BM25Index(os.path.join(directory, 'bm25_index'))
+        keyword_index.add_documents(ids, documents)
+        logger.info(f"Evaluation fixture: {len(ids)} documents, model '{embedding_backend.name}', "
+                    f"built in {time.perf_counter() - start_time:.2f}s at {directory}.")
+        return cls(collection, keyword_index, embedding_backend, data)
+
+    def retrieval_methods(self, k: int, reranker=None, diversify: bool = False) -> RetrievalMethods:
+        # A fresh query embedding cache per run, so every method pays for its own embeddings
+        return RetrievalMethods(self.collection, k=k,
+                                query_embedding_cache=QueryEmbeddingCache(self.embedding_backend.embed_query,
+                                                                          model_name=self.embedding_backend.name),
+                                keyword_index=self.keyword_index, filter_index=self.collection.filter_index,
+                                reranker=reranker, diversify=diversify)
+
+
+def load_labeled_queries(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads a labeled query set: JSONL (or a JSON list) of {"query": str, "relevant_ids": [chroma_id, ...]}.
+
+    Raises:
+        ValueError: a query without text or relevant IDs.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    entries = json.loads(content) if content.lstrip().startswith('[') else \
+        [json.loads(line) for line in content.splitlines() if line.strip()]
+    for entry in entries:
+        if not entry.get('query') or not entry.get('relevant_ids'):
+            raise ValueError(f"Every labeled query needs 'query' and 'relevant_ids': {entry}")
+    return entries
+
+
+def build_silver_queries(data: pd.DataFrame, count: int = SILVER_QUERY_COUNT) -> List[Dict[str, Any]]:
+    """
+    Silver-labeled query set derived from the processed metadata: each query
+    asks about an extracted aspect or product mention, and the documents that
+    carry that term are its relevant IDs. Deterministic, so runs are comparable;
+    a hand-labeled set (load_labeled_queries) is preferable when available.
+    """
+    documents_by_term = defaultdict(set)
+    for _, row in data.iterrows():
+        terms = set()
+        for entry in json.loads(row.get('aspect_sentiments') or '[]'):
+            if isinstance(entry, dict) and entry.get('aspect'):
+                terms.add(entry['aspect'].strip().lower())
+        for mention in json.loads(row.get('product_mentions') or '[]'):
+            if isinstance(mention, str):
+                terms.add(mention.strip().lower())
+        for term in terms:
+            if len(term) > 2:
+                documents_by_term[term].add(row['chroma_id'])
+    candidates = sorted(((term, doc_ids) for term, doc_ids in documents_by_term.items()
+                         if SILVER_MIN_DOCS <= len(doc_ids) <= SILVER_MAX_DOCS),
+                        key=lambda item: (-len(item[1]), item[0]))
+    return [{'query': f"What do users say about {term}?", 'relevant_ids': sorted(doc_ids)}
+            for term, doc_ids in candidates[:count]]
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def evaluate_method(retrieval_methods: RetrievalMethods, method_name: str, labeled_queries: List[Dict[str, Any]],
+                    k: int) -> Dict[str, Any]:
+    """Runs every labeled query once through one method; returns recall@k, MRR and latency percentiles."""
+    # Warm-up (model, index pages, filter masks) so the first query does not skew the percentiles
+    retrieval_methods.retrieve(labeled_queries[0]['query'], method_name)
+    latencies, recalls, reciprocal_ranks = [], [], []
+    for labeled in labeled_queries:
+        relevant = set(labeled['relevant_ids'])
+        start = time.perf_counter()
+        results = retrieval_methods.retrieve(labeled['query'], method_name)
+        latencies.append((time.perf_counter() - start) * 1000)
+        retrieved_ids, _, _, _ = RetrievalMethods._flatten_results(results)
+        retrieved_ids = retrieved_ids[:k]
+        recalls.append(len(relevant.intersection(retrieved_ids)) / len(relevant))
+        first_hit = next((rank for rank, doc_id in enumerate(retrieved_ids, start=1) if doc_id in relevant), None)
+        reciprocal_ranks.append(1.0 / first_hit if first_hit else 0.0)
+    return {
+        'queries': len(labeled_queries),
+        f'recall@{k}': round(float(np.mean(recalls)), 4),
+        'mrr': round(float(np.mean(reciprocal_ranks)), 4),
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p95_ms': round(_percentile(latencies, 95), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+    }
+
+
+def evaluate(fixture: EvalFixture, labeled_queries: List[Dict[str, Any]], k: int = config.RETRIEVER_K,
+             methods: Optional[Sequence[str]] = None, reranker=None, diversify: bool = False) -> Dict[str, Any]:
+    """Evaluates each retrieval method (all of SUPPORTED_RETRIEVAL_METHODS by default) on the fixture."""
+    if not labeled_queries:
+        raise ValueError("The labeled query set is empty.")
+    results = {'k': k, 'queries': len(labeled_queries), 'documents': fixture.collection.count(),
+               'embedding_model': fixture.embedding_backend.name, 'reranker': getattr(reranker, 'name', None),
+               'diversify': diversify, 'methods': {}}
+    for method_name in methods or config.SUPPORTED_RETRIEVAL_METHODS:
+        results['methods'][method_name] = evaluate_method(
+            fixture.retrieval_methods(k, reranker=reranker, diversify=diversify), method_name, labeled_queries, k)
+    return results
+
+
+def format_results_table(results: Dict[str, Any]) -> str:
+    k = results['k']
+    header = f"{'method':<28}{'recall@' + str(k):>10}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines = [header, '-' * len(header)]
+    for method_name, metrics in results['methods'].items():
+        lines.append(f"{method_name:<28}{metrics[f'recall@{k}']:>10.4f}{metrics['mrr']:>8.4f}"
+                     f"{metrics['p50_ms']:>10.3f}{metrics['p95_ms']:>10.3f}{metrics['p99_ms']:>10.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Offline recall@k / MRR / latency evaluation of the retrieval methods.")
+    parser.add_argument("--queries", help="Labeled query set (JSONL of {query, relevant_ids}); "
+                                          "without it a silver set is derived from the processed metadata.")
+    parser.add_argument("--write-queries", help="Write the query set used to this path (JSONL), e.g. to hand-edit the silver set.")
+    parser.add_argument("--csv", default=DEFAULT_CSV_PATH)
+    parser.add_argument("--fixture-dir", help="Directory of the fixture indexes (a temporary directory by default).")
+    parser.add_argument("--model", help="Existing local embedding model; by default one is trained on the CSV.")
+    parser.add_argument("-k", type=int, default=config.RETRIEVER_K)
+    parser.add_argument("--methods", nargs="*", choices=config.SUPPORTED_RETRIEVAL_METHODS)
+    parser.add_argument("--rerank", action="store_true", help="Enable the rerank stage (see reranker.py).")
+    parser.add_argument("--reranker-model", default=config.RERANKER_MODEL_PATH)
+    parser.add_argument("--diversify", action="store_true", help="Enable MMR diversification (see diversification.py).")
+    parser.add_argument("--output", help="Write the results as JSON to this path.")
+    args = parser.parse_args()
+
+    eval_fixture = EvalFixture.build(args.csv, directory=args.fixture_dir, model_path=args.model)
+    query_set = load_labeled_queries(args.queries) if args.queries else build_silver_queries(eval_fixture.data)
+    if args.write_queries:
+        with open(args.write_queries, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(labeled) + "\n" for labeled in query_set)
+    eval_results = evaluate(eval_fixture, query_set, k=args.k, methods=args.methods,
+                            reranker=load_reranker(args.reranker_model) if args.rerank else None, diversify=args.diversify)
+    print(format_results_table(eval_results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(eval_results, f, indent=2)
+        logger.info(f"Results written to {args.output}.")
@@ -1,53 +1,131 @@
 import logging
 import json
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 
 # Import configuration constants from the local package config file
 import config
 
+try:
+    from .fusion import reciprocal_rank_fusion, weighted_score_fusion
+    from .metadata_filters import build_where
+    from .diversification import diversify
+    from .reranker import timed_rerank
+except ImportError:
+    from fusion import reciprocal_rank_fusion, weighted_score_fusion
+    from metadata_filters import build_where
+    from diversification import diversify
+    from reranker import timed_rerank
+
 logger = logging.getLogger(__name__)
 
+# Without a filter index, filtered BM25 retrieval ranks this many times k documents before filtering
+KEYWORD_FILTER_OVERFETCH = 10
+
 class RetrievalMethods:
     """
     Contains different methods for retrieving documents from a ChromaDB collection.
     Initialized with a ChromaDB collection object and the number of documents (k) to retrieve.
+    With a query_embedding_cache (see query_embedding_cache.py), each query is
+    embedded at most once and passed to the collection as query_embeddings.
+    With a keyword_index (see bm25_index.py), keyword retrieval is ranked with BM25.
+    retrieve_many runs a whole list of queries with one batched embedding call
+    and one multi-query collection.query.
+    With a result_cache (see result_cache.py), results are reused until the
+    collection version changes. The in-memory indexes (collection,
+    keyword_index, filter_index) are then reloaded through index_loader
+    before anything is retrieved or cached again; without an index_loader,
+    results computed after a version change are not cached.
+    Every method accepts metadata filters (see metadata_filters.parse_filters);
+    with a filter_index, keyword retrieval only ranks the pre-selected candidates.
+    With diversify, each method over-fetches candidates, near-duplicates are
+    collapsed and k documents are picked with maximal marginal relevance
+    (see diversification.py).
+    With a reranker (see reranker.py), the over-fetched candidates are rescored
+    on CPU before the best k are kept; results then carry 'rerank_scores' and
+    the rerank time of the request in 'rerank_ms'.
     """
-    def __init__(self, collection, k: int = config.RETRIEVER_K):
+    def __init__(self, collection, k: int = config.RETRIEVER_K, query_embedding_cache=None, keyword_index=None,
+                 result_cache=None, filter_index=None, diversify: bool = config.DIVERSIFY_RESULTS, reranker=None,
+                 index_loader: Optional[Callable[[], Dict[str, Any]]] = None):
         self.collection = collection
         self.k = k
+        self.diversify = diversify
+        self.reranker = reranker
+        # Candidates each method retrieves before the post-retrieval stages narrow them to k
+        multipliers = [1]
+        if diversify: multipliers.append(config.MMR_FETCH_MULTIPLIER)
+        if reranker is not None: multipliers.append(config.RERANK_FETCH_MULTIPLIER)
+        self.fetch_k = k * max(multipliers)
+        self.query_embedding_cache = query_embedding_cache
+        self.keyword_index = keyword_index
+        self.result_cache = result_cache
+        self.filter_index = filter_index
+        # Returns reloaded indexes ({'collection', 'keyword_index', 'filter_index'}, any subset) after a version change
+        self.index_loader = index_loader
+        self._index_lock = threading.Lock()
+        # Collection version the indexes were loaded at
+        self.index_version = result_cache.version_source() if result_cache is not None else None
+        # Runs the legs of hybrid retrieval concurrently
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
         # Ensure the collection was successfully initialized
         if self.collection is None:
              logger.error("RetrievalMethods initialized with None collection.")
              raise ValueError("ChromaDB collection must be initialized.")
-        logger.info(f"RetrievalMethods initialized with k={self.k}.")
+        logger.info(f"RetrievalMethods initialized with k={self.k} (diversify={self.diversify}, "
+                    f"reranker={getattr(reranker, 'name', None)}).")
+
+    def _query_input(self, query: str) -> Dict[str, Any]:
+        """Query argument for collection.query: the cached embedding, or the text for Chroma to embed."""
+        if self.query_embedding_cache is not None:
+            return {'query_embeddings': [self.query_embedding_cache.get(query)]}
+        return {'query_texts': [query]}
+
+    def _query_inputs(self, queries: Sequence[str]) -> Dict[str, Any]:
+        """Same as _query_input for several queries; missing embeddings are computed in one batch."""
+        if self.query_embedding_cache is not None:
+            return {'query_embeddings': self.query_embedding_cache.get_many(list(queries))}
+        return {'query_texts': list(queries)}
 
-    def retrieve_similarity(self, query: str) -> Dict[str, List[Any]]:
+    @staticmethod
+    def _where_kwargs(where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {'where': where} if where else {}
+
+    def retrieve_similarity(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
         """
         Performs standard vector similarity search based on the query embedding.
 
         Args:
             query: The user's query string.
+            filters: Optional normalized metadata filters.
 
         Returns:
             Dict: Raw results from ChromaDB collection.query.
         """
         logger.info(f"Retrieving (similarity, k={self.k}): {query[:50]}...")
-        # Use collection.query for flexibility, specifying query_texts and n_results
+        # Use collection.query for flexibility, with the (cached) query embedding and n_results
         # include=['documents', 'metadatas', 'distances'] ensures we get text, metadata, and similarity scores
         return self.collection.query(
-            query_texts=[query],
-            n_results=self.k,
-            include=['documents', 'metadatas', 'distances']
+            **self._query_input(query),
+            n_results=self.fetch_k,
+            include=['documents', 'metadatas', 'distances'],
+            **self._where_kwargs(build_where(filters))
         )
 
-    def retrieve_similarity_filter_sentiment(self, query: str, sentiment_label: str) -> Dict[str, List[Any]]:
+    def retrieve_similarity_filter_sentiment(self, query: str, sentiment_label: str,
+                                             filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
         """
         Performs vector similarity search filtered by a specific sentiment label metadata.
 
         Args:
             query: The user's query string.
             sentiment_label: The sentiment label to filter by ('positive', 'neutral', 'negative').
+            filters: Optional normalized metadata filters, combined with the sentiment filter.
 
         Returns:
             Dict: Raw results from ChromaDB collection.query.
@@ -60,111 +138,370 @@ class RetrievalMethods:
         logger.info(f"Retrieving (similarity + {sentiment_label} filter, k={self.k}): {query[:50]}...")
         # Use the 'where' clause in collection.query to filter metadata
         return self.collection.query(
-            query_texts=[query],
-            n_results=self.k,
+            **self._query_input(query),
+            n_results=self.fetch_k,
             include=['documents', 'metadatas', 'distances'],
-            where={"sentiment_label": sentiment_label} # Metadata filter condition
+            where=build_where(filters, {"sentiment_label": sentiment_label}) # Metadata filter condition
         )
 
-    def retrieve_keyword(self, query: str) -> Dict[str, List[Any]]:
+    def retrieve_keyword(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
         """
-        Performs basic keyword search using ChromaDB's $contains operator on document text.
-        Note: This is a simple substring search.
+        Performs keyword search. With a BM25 index, documents are ranked by their
+        BM25 score for the query terms and fetched from the collection by ID.
+        Without one, falls back to ChromaDB's $contains operator on document text
+        (a simple substring search of the whole query).
 
         Args:
-            query: The user's query string (used as the keyword phrase).
+            query: The user's query string.
+            filters: Optional normalized metadata filters.
 
         Returns:
-            Dict: Raw results from ChromaDB collection.query.
+            Dict: 'ids', 'documents', 'metadatas' (flat lists), plus 'scores' (BM25) when ranked.
         """
         logger.info(f"Retrieving (keyword, k={self.k}): {query[:50]}...")
+        where = build_where(filters)
+        if self.keyword_index is not None:
+            return self._fetch_ranked([self._rank_keyword(query, where)], where)[0]
         # Use the 'where_document' clause with '$contains' to search within the document content
-        # query_texts is still needed by the method signature, even if the primary search is keyword-based
-        return self.collection.query(
-            query_texts=[query],
-            n_results=self.k,
+        # collection.get filters without a query embedding, so no embedding call is made
+        return self.collection.get(
+            limit=self.fetch_k,
             include=['documents', 'metadatas'],
-            where_document={'$contains': query} # Keyword search condition
+            where_document={'$contains': query}, # Keyword search condition
+            **self._where_kwargs(where)
         )
 
-    def retrieve_hybrid_similarity_keyword(self, query: str) -> Dict[str, List[Any]]:
+    def _rank_keyword(self, query: str, where: Optional[Dict[str, Any]]) -> List[Tuple[str, float]]:
+        """BM25 ranking of a query, restricted to the documents matching `where`."""
+        if not where:
+            return self.keyword_index.search(query, self.fetch_k)
+        if self.filter_index is not None:
+            # Candidates pre-selected from the (cached) filter masks
+            return self.keyword_index.search(query, self.fetch_k, allowed_ids=self.filter_index.candidate_ids(where))
+        # No filter index: over-fetch, and let collection.get drop the documents that fail the filter
+        return self.keyword_index.search(query, self.fetch_k * KEYWORD_FILTER_OVERFETCH)
+
+    def _fetch_ranked(self, rankings: List[List[Tuple[str, float]]],
+                      where: Optional[Dict[str, Any]] = None) -> List[Dict[str, List[Any]]]:
+        """
+        Fetches the documents of one or more BM25 rankings with a single
+        collection.get and returns one keyword result per ranking (at most k),
+        in ranking order. Documents not matching `where` are dropped.
+        """
+        all_ids = list(dict.fromkeys(doc_id for ranked in rankings for doc_id, _ in ranked))
+        records = {}
+        if all_ids:
+            fetched = self.collection.get(ids=all_ids, include=['documents', 'metadatas'], **self._where_kwargs(where))
+            # collection.get does not keep the requested order
+            records = {doc_id: (doc, meta) for doc_id, doc, meta in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])}
+        results = []
+        for ranked in rankings:
+            ranked = [(doc_id, score) for doc_id, score in ranked if doc_id in records][:self.fetch_k]
+            results.append({
+                "ids": [doc_id for doc_id, _ in ranked],
+                "documents": [records[doc_id][0] for doc_id, _ in ranked],
+                "metadatas": [records[doc_id][1] for doc_id, _ in ranked],
+                "scores": [score for _, score in ranked],
+            })
+        return results
+
+    def retrieve_hybrid_similarity_keyword(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
         """
-        Combines results from standard vector similarity search and basic keyword search.
-        Retrieves k documents from each method and combines them, removing duplicates.
+        Combines vector similarity search and keyword search. Both legs run
+        concurrently (latency is the slower leg, not the sum) and retrieve k
+        documents each; the two rankings are fused into a single top-k with
+        reciprocal rank fusion or weighted min-max score fusion (config.HYBRID_FUSION).
 
         Args:
             query: The user's query string.
+            filters: Optional normalized metadata filters, applied to both legs.
 
         Returns:
-            Dict: Combined results in the same format as collection.query output.
+            Dict: 'ids', 'documents', 'metadatas' (flat lists, best first), 'scores'
+                  (fused) and 'leg_scores' (per document: similarity distance/rank
+                  and keyword score/rank, None for a leg that did not return it).
         """
-        logger.info(f"Retrieving (hybrid, k={self.k} each): {query[:50]}...")
+        logger.info(f"Retrieving (hybrid, k={self.k}, fusion={config.HYBRID_FUSION}): {query[:50]}...")
 
-        # Perform Similarity Search
-        sim_results = self.collection.query(
-            query_texts=[query],
-            n_results=self.k,
-            include=['documents', 'metadatas', 'distances']
-        )
-        logger.info(f"Hybrid: Similarity search found {len(sim_results.get('ids', []))} documents.")
+        # Run both legs at the same time
+        sim_future = self._executor.submit(self.retrieve_similarity, query, filters)
+        keyword_future = self._executor.submit(self.retrieve_keyword, query, filters)
+        return self._fuse(sim_future.result(), keyword_future.result())
 
-        # Perform Keyword Search
-        keyword_results = self.collection.query(
-            query_texts=[query], # Still need query_texts for embedding even if using where_document
-            n_results=self.k,
-            include=['documents', 'metadatas'],
-            where_document={'$contains': query}
+    def _fuse(self, sim_results: Dict[str, Any], keyword_results: Dict[str, Any]) -> Dict[str, List[Any]]:
+        """Fuses the similarity and keyword results of one query into the hybrid top-k."""
+        sim_ids, sim_docs, sim_metas, sim_distances = self._flatten_results(sim_results)
+        keyword_ids, keyword_docs, keyword_metas, keyword_scores = self._flatten_results(keyword_results)
+        logger.info(f"Hybrid: Similarity search found {len(sim_ids)} documents, keyword search found {len(keyword_ids)}.")
+
+        weights = {'similarity': config.HYBRID_SIMILARITY_WEIGHT, 'keyword': 1.0 - config.HYBRID_SIMILARITY_WEIGHT}
+        if config.HYBRID_FUSION == 'weighted':
+            # Higher is better on both legs; legs without scores fall back to reciprocal rank
+            sim_leg = {doc_id: -d for doc_id, d in zip(sim_ids, sim_distances)} if sim_distances \
+                else {doc_id: 1.0 / rank for rank, doc_id in enumerate(sim_ids, start=1)}
+            keyword_leg = dict(zip(keyword_ids, keyword_scores)) if keyword_scores \
+                else {doc_id: 1.0 / rank for rank, doc_id in enumerate(keyword_ids, start=1)}
+            fused = weighted_score_fusion({'similarity': sim_leg, 'keyword': keyword_leg}, weights)
+        else:
+            fused = reciprocal_rank_fusion({'similarity': sim_ids, 'keyword': keyword_ids}, weights, config.RRF_K)
+        fused = fused[:self.fetch_k]
+
+        records = {doc_id: (doc, meta) for doc_id, doc, meta in zip(keyword_ids, keyword_docs, keyword_metas)}
+        records.update({doc_id: (doc, meta) for doc_id, doc, meta in zip(sim_ids, sim_docs, sim_metas)})
+        sim_rank = {doc_id: rank for rank, doc_id in enumerate(sim_ids, start=1)}
+        keyword_rank = {doc_id: rank for rank, doc_id in enumerate(keyword_ids, start=1)}
+        sim_distance = dict(zip(sim_ids, sim_distances or []))
+        keyword_score = dict(zip(keyword_ids, keyword_scores or []))
+
+        logger.info(f"Hybrid search fused {len(set(sim_ids) | set(keyword_ids))} unique documents into {len(fused)}.")
+        return {
+            "ids": [doc_id for doc_id, _ in fused],
+            "documents": [records[doc_id][0] for doc_id, _ in fused],
+            "metadatas": [records[doc_id][1] for doc_id, _ in fused],
+            "scores": [score for _, score in fused],
+            "leg_scores": [{
+                "similarity_distance": sim_distance.get(doc_id),
+                "similarity_rank": sim_rank.get(doc_id),
+                "keyword_score": keyword_score.get(doc_id),
+                "keyword_rank": keyword_rank.get(doc_id),
+            } for doc_id, _ in fused],
+        }
+
+    @staticmethod
+    def _flatten_results(results: Dict[str, Any]):
+        """Flattens the nested lists of a single-query collection.query result; returns ids, docs, metas, scores."""
+        ids, docs, metas = results.get('ids') or [], results.get('documents') or [], results.get('metadatas') or []
+        scores = results.get('distances') or results.get('scores')
+        if ids and isinstance(ids[0], list): ids = ids[0]
+        if docs and isinstance(docs[0], list): docs = docs[0]
+        if metas and isinstance(metas[0], list): metas = metas[0]
+        if scores and isinstance(scores[0], list): scores = scores[0]
+        return ids, docs, metas, scores
+
+    @staticmethod
+    def _select(results: Dict[str, Any], indices: Sequence[int],
+                duplicate_ids: Optional[Dict[int, List[str]]] = None) -> Dict[str, Any]:
+        """Keeps the given positions of a result (nested or flat), adding the IDs collapsed into each kept document."""
+        nested = bool(results.get('ids')) and isinstance(results['ids'][0], list)
+        selected = dict(results)
+        for key in ('ids', 'documents', 'metadatas', 'distances', 'scores', 'leg_scores', 'rerank_scores'):
+            values = results.get(key)
+            if not values:
+                continue
+            values = values[0] if nested else values
+            picked = [values[i] for i in indices]
+            selected[key] = [picked] if nested else picked
+        if duplicate_ids is not None:
+            duplicates = [duplicate_ids.get(i, []) for i in indices]
+            selected['duplicate_ids'] = [duplicates] if nested else duplicates
+        return selected
+
+    def _rerank_result(self, query: str, results: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Rescores the candidates of one query with the reranker and reorders them
+        best first. All candidates are kept for diversification; otherwise the best k.
+        """
+        _, docs, metas, _ = self._flatten_results(results)
+        order, scores, elapsed_ms = timed_rerank(self.reranker, query, docs, metas)
+        keep = len(order) if self.diversify else self.k
+        nested = bool(results.get('ids')) and isinstance(results['ids'][0], list)
+        with_scores = dict(results)
+        score_by_position = dict(zip(order, scores))
+        ranked_scores = [score_by_position[i] for i in range(len(order))]
+        with_scores['rerank_scores'] = [ranked_scores] if nested else ranked_scores
+        reranked = self._select(with_scores, order[:keep])
+        reranked['rerank_ms'] = round(elapsed_ms, 3)
+        logger.info(f"Reranked {len(order)} candidates in {elapsed_ms:.2f} ms.")
+        return reranked
+
+    def _post_process(self, queries: List[str], method_name: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Post-retrieval stages on the over-fetched candidates: rerank, then diversify; the result holds k documents."""
+        if self.reranker is not None:
+            results = [self._rerank_result(query, result) for query, result in zip(queries, results)]
+        if self.diversify:
+            results = self._diversify_results(queries, method_name, results)
+        return results
+
+    def _diversify_results(self, queries: List[str], method_name: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Post-retrieval stage: collapses near-duplicates among each query's
+        candidates and picks k of them with MMR. The stored embeddings of all
+        candidates are read with one collection.get. Similarity methods measure
+        relevance against the query embedding; keyword, hybrid and reranked
+        candidates keep their own ranking as the relevance signal.
+        """
+        flat = [self._flatten_results(result) for result in results]
+        all_ids = list(dict.fromkeys(doc_id for ids, _, _, _ in flat for doc_id in ids))
+        embeddings_by_id = {}
+        if all_ids:
+            fetched = self.collection.get(ids=all_ids, include=['embeddings'])
+            embeddings_by_id = {doc_id: embedding for doc_id, embedding in zip(fetched['ids'], fetched['embeddings'])
+                                if embedding is not None}
+        query_embeddings = [None] * len(queries)
+        if method_name.startswith('similarity') and self.reranker is None and self.query_embedding_cache is not None:
+            query_embeddings = self.query_embedding_cache.get_many(queries)
+
+        diversified = []
+        for result, (ids, docs, _, _), query_embedding in zip(results, flat, query_embeddings):
+            if not embeddings_by_id or not ids:
+                diversified.append(self._select(result, range(min(self.k, len(ids))), {}))
+                continue
+            dim = len(next(iter(embeddings_by_id.values())))
+            embeddings = np.array([embeddings_by_id[doc_id] if doc_id in embeddings_by_id else np.zeros(dim)
+                                   for doc_id in ids], dtype=np.float32)
+            selected, duplicates = diversify(embeddings, docs, self.k, query_embedding,
+                                             config.MMR_LAMBDA, config.DUPLICATE_SIMILARITY_THRESHOLD)
+            collapsed = sum(len(indices) for indices in duplicates.values())
+            logger.info(f"Diversified {len(ids)} candidates into {len(selected)} documents ({collapsed} near-duplicates collapsed).")
+            diversified.append(self._select(result, selected, {kept: [ids[i] for i in indices]
+                                                                for kept, indices in duplicates.items()}))
+        return diversified
+
+    @staticmethod
+    def _split_query_results(results: Dict[str, Any], count: int) -> List[Dict[str, List[Any]]]:
+        """Splits a multi-query collection.query result into single-query results (same nested shape)."""
+        split = []
+        for i in range(count):
+            split.append({key: [results[key][i]] if results.get(key) else None
+                          for key in ('ids', 'documents', 'metadatas', 'distances')})
+        return split
+
+    def _retrieve_similarity_many(self, queries: List[str], where: Optional[Dict[str, Any]] = None) -> List[Dict[str, List[Any]]]:
+        """Similarity search for every query with a single collection.query call."""
+        results = self.collection.query(
+            **self._query_inputs(queries),
+            n_results=self.fetch_k,
+            include=['documents', 'metadatas', 'distances'],
+            **self._where_kwargs(where)
         )
-        logger.info(f"Hybrid: Keyword search found {len(keyword_results.get('ids', []))} documents.")
-
-        # Combine results - simple deduplication
-        combined_ids, combined_docs, combined_metas = [], [], []
-        seen_ids = set()
-
-        # Helper to flatten nested lists from Chroma results (sometimes happens with batching/includes)
-        def flatten_results(results):
-             ids, docs, metas = results.get('ids', []), results.get('documents', []), results.get('metadatas', [])
-             if ids and isinstance(ids[0], list): ids = ids[0]
-             if docs and isinstance(docs[0], list): docs = docs[0]
-             if metas and isinstance(metas[0], list): metas = metas[0]
-             return ids, docs, metas
-
-        # Add similarity results first
-        sim_ids, sim_docs, sim_metas = flatten_results(sim_results)
-        for i in range(len(sim_ids)):
-             doc_id = sim_ids[i]
-             if doc_id not in seen_ids:
-                 combined_ids.append(doc_id)
-                 combined_docs.append(sim_docs[i])
-                 combined_metas.append(sim_metas[i])
-                 seen_ids.add(doc_id)
-
-        # Add keyword results, skipping duplicates already added from similarity
-        keyword_ids, keyword_docs, keyword_metas = flatten_results(keyword_results)
-        for i in range(len(keyword_ids)):
-             doc_id = keyword_ids[i]
-             if doc_id not in seen_ids:
-                 combined_ids.append(doc_id)
-                 combined_docs.append(keyword_docs[i])
-                 combined_metas.append(keyword_metas[i])
-                 seen_ids.add(doc_id)
-
-        logger.info(f"Hybrid search combined {len(combined_ids)} unique documents.")
-
-        # Return the combined results in the expected dictionary format
-        return {"ids": combined_ids, "documents": combined_docs, "metadatas": combined_metas}
+        return self._split_query_results(results, len(queries))
+
+    def _retrieve_keyword_many(self, queries: List[str], filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, List[Any]]]:
+        """Keyword search for every query; with a BM25 index all documents are fetched with one collection.get."""
+        if self.keyword_index is not None:
+            where = build_where(filters)
+            return self._fetch_ranked([self._rank_keyword(query, where) for query in queries], where)
+        # $contains takes a single string, so the fallback stays one get per query
+        return [self.retrieve_keyword(query, filters) for query in queries]
+
+    def retrieve_many(self, queries: List[str], method_name: str,
+                      filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, List[Any]]]:
+        """
+        Runs one retrieval method for a list of queries. All query embeddings are
+        computed in one batch call and the similarity leg issues a single
+        multi-query collection.query, instead of one round-trip per query.
+
+        Args:
+            queries: The query strings.
+            method_name: The name of the retrieval method to use.
+            filters: Optional normalized metadata filters, applied to every query.
+
+        Returns:
+            List: one result per query, in query order, shaped like the result of retrieve().
+
+        Raises:
+            ValueError: If the provided method_name is not supported.
+        """
+        if method_name not in self.get_supported_methods():
+            raise ValueError(f"Unknown retrieval method: {method_name}. Supported methods are: {', '.join(self.get_supported_methods())}")
+        queries = list(queries)
+        if not queries:
+            return []
+        if self.result_cache is None:
+            return self._retrieve_many_uncached(queries, method_name, filters)
+
+        version = self.refresh_indexes()
+        if version is None:
+            return self._retrieve_many_uncached(queries, method_name, filters)
+
+        # Only the queries without a cached result for the current collection version are retrieved
+        results = [self.result_cache.get(query, self._cache_method(method_name), self.k, filters, version=version)
+                   for query in queries]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            retrieved = self._retrieve_many_uncached([queries[i] for i in missing], method_name, filters)
+            for i, result in zip(missing, retrieved):
+                self.result_cache.put(queries[i], self._cache_method(method_name), self.k, filters, result, version=version)
+                results[i] = result
+            missing = set(missing)
+        for i, result in enumerate(results):
+            if self.reranker is not None and i not in missing:
+                result['rerank_ms'] = 0.0 # Served from the cache, nothing was reranked for this request
+        return results
+
+    def _retrieve_many_uncached(self, queries: List[str], method_name: str,
+                                filters: Optional[Dict[str, Any]]) -> List[Dict[str, List[Any]]]:
+        results = self._retrieve_many_candidates(queries, method_name, filters)
+        return self._post_process(queries, method_name, results)
+
+    def _retrieve_many_candidates(self, queries: List[str], method_name: str,
+                                  filters: Optional[Dict[str, Any]]) -> List[Dict[str, List[Any]]]:
+        logger.info(f"Retrieving {len(queries)} queries ({method_name}, k={self.k}).")
+
+        if method_name == 'similarity':
+            return self._retrieve_similarity_many(queries, build_where(filters))
+        elif method_name == 'similarity_filter_positive':
+            return self._retrieve_similarity_many(queries, build_where(filters, {"sentiment_label": "positive"}))
+        elif method_name == 'similarity_filter_negative':
+            return self._retrieve_similarity_many(queries, build_where(filters, {"sentiment_label": "negative"}))
+        elif method_name == 'keyword':
+            return self._retrieve_keyword_many(queries, filters)
+        else:
+            # hybrid_similarity_keyword: both batched legs run concurrently, then each query is fused
+            sim_future = self._executor.submit(self._retrieve_similarity_many, queries, build_where(filters))
+            keyword_future = self._executor.submit(self._retrieve_keyword_many, queries, filters)
+            return [self._fuse(sim, keyword) for sim, keyword in zip(sim_future.result(), keyword_future.result())]
+
+    def refresh_indexes(self) -> Optional[str]:
+        """
+        Reloads the in-memory indexes through index_loader if the collection
+        version changed since they were loaded.
+
+        Returns:
+            The collection version the indexes reflect, to cache results under;
+            None when they are older than the current version (no index_loader,
+            or the reload failed), so results must not be cached.
+        """
+        if self.result_cache is None:
+            return None
+        version = self.result_cache.version_source()
+        if version == self.index_version:
+            return version
+        if self.index_loader is None:
+            return None
+        with self._index_lock:
+            if version != self.index_version:
+                start_time = time.perf_counter()
+                try:
+                    indexes = self.index_loader()
+                except Exception as e:
+                    logger.error(f"Could not reload the indexes for collection version {version}: {e}", exc_info=True)
+                    return None
+                for name in ('collection', 'keyword_index', 'filter_index'):
+                    if name in indexes:
+                        setattr(self, name, indexes[name])
+                self.index_version = version
+                logger.info(f"Indexes reloaded for collection version {version} in {time.perf_counter() - start_time:.2f}s.")
+        return self.index_version
+
+    def _cache_method(self, method_name: str) -> str:
+        """Result cache method key; results of the reranked / diversified pipelines are cached apart."""
+        if self.reranker is not None:
+            method_name = f"{method_name}+rerank:{self.reranker.fingerprint}"
+        return f"{method_name}+mmr" if self.diversify else method_name
 
     def get_supported_methods(self) -> List[str]:
         """Returns a list of supported retrieval method names from config."""
         return config.SUPPORTED_RETRIEVAL_METHODS
 
-    def retrieve(self, query: str, method_name: str) -> Dict[str, List[Any]]:
+    def retrieve(self, query: str, method_name: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
         """
         Calls the appropriate retrieval method based on the provided name.
 
         Args:
             query: The user's query string.
             method_name: The name of the retrieval method to use.
+            filters: Optional normalized metadata filters (see metadata_filters.parse_filters).
 
         Returns:
             Dict: Raw results from the selected ChromaDB retrieval method.
@@ -172,16 +509,36 @@ class RetrievalMethods:
         Raises:
             ValueError: If the provided method_name is not supported.
         """
+        if method_name not in self.get_supported_methods():
+            raise ValueError(f"Unknown retrieval method: {method_name}. Supported methods are: {', '.join(self.get_supported_methods())}")
+        version = self.refresh_indexes() if self.result_cache is not None else None
+        if version is not None:
+            computed = []
+            def compute():
+                computed.append(True)
+                return self._retrieve_uncached(query, method_name, filters)
+            results = self.result_cache.get_or_compute(query, self._cache_method(method_name), self.k, filters, compute,
+                                                       version=version)
+            if self.reranker is not None and not computed:
+                results['rerank_ms'] = 0.0 # Served from the cache, nothing was reranked for this request
+            return results
+        return self._retrieve_uncached(query, method_name, filters)
+
+    def _retrieve_uncached(self, query: str, method_name: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
+        results = self._retrieve_candidates(query, method_name, filters)
+        return self._post_process([query], method_name, [results])[0]
+
+    def _retrieve_candidates(self, query: str, method_name: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, List[Any]]:
         if method_name == 'similarity':
-            return self.retrieve_similarity(query)
+            return self.retrieve_similarity(query, filters)
         elif method_name == 'similarity_filter_positive':
-            return self.retrieve_similarity_filter_sentiment(query, 'positive')
+            return self.retrieve_similarity_filter_sentiment(query, 'positive', filters)
         elif method_name == 'similarity_filter_negative':
-            return self.retrieve_similarity_filter_sentiment(query, 'negative')
+            return self.retrieve_similarity_filter_sentiment(query, 'negative', filters)
         elif method_name == 'keyword':
-            return self.retrieve_keyword(query)
+            return self.retrieve_keyword(query, filters)
         elif method_name == 'hybrid_similarity_keyword':
-            return self.retrieve_hybrid_similarity_keyword(query)
+            return self.retrieve_hybrid_similarity_keyword(query, filters)
         else:
             # Raise an error if an unsupported method name is provided
             raise ValueError(f"Unknown retrieval method: {method_name}. Supported methods are: {', '.join(self.get_supported_methods())}")
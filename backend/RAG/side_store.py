@@ -0,0 +1,119 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Metadata key that links a document to its row in the products table
+PRODUCT_ID_KEY = 'product_id'
+# Prompt-ready header line per document, written after loading (see context_builder.write_document_snippets)
+SNIPPETS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS doc_snippets (
+    doc_id TEXT PRIMARY KEY,
+    header TEXT NOT NULL,
+    snippet_format TEXT NOT NULL
+);
+"""
+
+
+class SideStore:
+    """
+    Read-only access to the side store written by the processing pipeline
+    (data_processing/side_store.py): raw document texts keyed by doc_id and
+    product attributes keyed by product_id, plus the context snippets added
+    by the loader (write_snippets).
+
+    Lookups are batched per retrieval result, so only the documents actually
+    formatted into the prompt are read. Products are few and shared by many
+    reviews, so they are memoized. A missing store file is not an error: all
+    lookups then return empty results.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._conn = None
+        if os.path.exists(db_path):
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            logger.info(f"Side store opened: {db_path}")
+        else:
+            logger.warning(f"Side store not found at {db_path}. Raw texts and product details will be unavailable.")
+
+    def _select(self, table: str, key_column: str, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        keys = list(dict.fromkeys(key for key in keys if key))
+        if self._conn is None or not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM {table} WHERE {key_column} IN ({placeholders})", keys).fetchall()
+        return {row[key_column]: {k: row[k] for k in row.keys() if k != key_column and row[k] is not None} for row in rows}
+
+    def get_texts(self, doc_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Raw texts (original_text, *_orig titles and comments) of the given documents."""
+        return self._select('doc_texts', 'doc_id', doc_ids)
+
+    def get_products(self, product_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Product attributes (title, URL, overall rating, review count) of the given products."""
+        product_ids = set(product_id for product_id in product_ids if product_id)
+        missing = [product_id for product_id in product_ids if product_id not in self._products]
+        if missing:
+            self._products.update(self._select('products', PRODUCT_ID_KEY, missing))
+        return {product_id: self._products[product_id] for product_id in product_ids if product_id in self._products}
+
+    def get_snippets(self, doc_ids: Iterable[str], snippet_format: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Pre-rendered context headers of the given documents, joined with their
+        raw texts in the same query. Only snippets of snippet_format are
+        returned; none when the store has no snippets table.
+        """
+        doc_ids = list(dict.fromkeys(doc_id for doc_id in doc_ids if doc_id))
+        if self._conn is None or not doc_ids:
+            return {}
+        placeholders = ', '.join('?' * len(doc_ids))
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT s.doc_id AS snippet_doc_id, s.header, t.* FROM doc_snippets s "
+                    "LEFT JOIN doc_texts t ON t.doc_id = s.doc_id "
+                    f"WHERE s.snippet_format = ? AND s.doc_id IN ({placeholders})", [snippet_format] + doc_ids).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.debug(f"No document snippets available: {e}")
+            return {}
+        return {row['snippet_doc_id']: {k: row[k] for k in row.keys() if k not in ('snippet_doc_id', 'doc_id') and row[k] is not None}
+                for row in rows}
+
+    def get_all_products(self) -> List[Dict[str, Any]]:
+        """Every product row (with its product_id), e.g. to build the product catalog."""
+        if self._conn is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM products").fetchall()
+        return [{k: row[k] for k in row.keys() if row[k] is not None} for row in rows]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def write_snippets(db_path: str, rows: Iterable[Tuple[str, str]], snippet_format: str) -> int:
+    """
+    Replaces the doc_snippets table of an existing side store with (doc_id,
+    header) rows. The table is rewritten in one transaction, so readers see
+    either the old or the new snippets. Returns the number of snippets.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(SNIPPETS_SCHEMA)
+            conn.execute("DELETE FROM doc_snippets")
+            conn.executemany("INSERT OR REPLACE INTO doc_snippets (doc_id, header, snippet_format) VALUES (?, ?, ?)",
+                             ((doc_id, header, snippet_format) for doc_id, header in rows))
+        count = conn.execute("SELECT COUNT(*) FROM doc_snippets").fetchone()[0]
+    finally:
+        conn.close()
+    logger.info(f"Saved {count} document snippets ({snippet_format}) to {db_path}.")
+    return count
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from . import config
+except ImportError:
+    import config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MRSNAP\x00\x01"
+SNAPSHOT_FORMAT_VERSION = 1
+# Vectors start on a page boundary so the section can be memory-mapped directly
+VECTOR_ALIGNMENT = 4096
+DEFAULT_PAGE_SIZE = 1000
+_PREAMBLE = struct.Struct("<8sII") # magic, format version, header length
+
+
+def _aligned(offset: int) -> int:
+    return (offset + VECTOR_ALIGNMENT - 1) // VECTOR_ALIGNMENT * VECTOR_ALIGNMENT
+
+
+def write_snapshot(path: str, ids: List[str], embeddings, documents: List[Optional[str]],
+                   metadatas: List[Optional[Dict[str, Any]]], extra_header: Optional[Dict[str, Any]] = None):
+    """
+    Writes a single-file snapshot:
+      - preamble: magic, format version, header length
+      - header: JSON with counts, dimension, section offsets and checksum
+      - vectors: raw little-endian float32 matrix, page-aligned (memory-mappable)
+      - records: zlib-compressed JSON with ids, documents and metadatas
+    The file is written next to `path` and renamed into place.
+    """
+    vectors = np.ascontiguousarray(np.asarray(embeddings, dtype='<f4'))
+    if len(vectors) != len(ids):
+        raise ValueError(f"{len(ids)} ids but {len(vectors)} embeddings.")
+    dim = int(vectors.shape[1]) if vectors.ndim == 2 else 0
+    records = zlib.compress(json.dumps({'ids': ids, 'documents': documents, 'metadatas': metadatas}).encode('utf-8'), 6)
+
+    header = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'count': len(ids),
+        'dim': dim,
+        'vector_dtype': 'float32',
+        **(extra_header or {}),
+    }
+    # Offsets depend on the header length, so reserve room for them before encoding
+    header.update({'vectors_offset': 0, 'vectors_nbytes': vectors.nbytes, 'records_offset': 0,
+                   'records_nbytes': len(records), 'records_crc32': zlib.crc32(records)})
+    header_bytes = json.dumps(header).encode('utf-8') + b' ' * 64
+    header['vectors_offset'] = _aligned(_PREAMBLE.size + len(header_bytes))
+    header['records_offset'] = header['vectors_offset'] + vectors.nbytes
+    encoded_header = json.dumps(header).encode('utf-8')
+    header_bytes = encoded_header.ljust(len(header_bytes), b' ')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\x00' * (header['vectors_offset'] - f.tell()))
+        f.write(vectors.tobytes())
+        f.write(records)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote snapshot {path}: {len(ids)} records, dim {dim}, {os.path.getsize(path) / 1e6:.1f} MB.")
+
+
+class Snapshot:
+    """A snapshot opened for reading: vectors are memory-mapped, records are decompressed on open."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a collection snapshot.")
+            if version != SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported snapshot format version {version} in {path}.")
+            self.header = json.loads(f.read(header_length))
+            f.seek(self.header['records_offset'])
+            records = f.read(self.header['records_nbytes'])
+        if zlib.crc32(records) != self.header['records_crc32']:
+            raise ValueError(f"Snapshot {path} is corrupted (records checksum mismatch).")
+        records = json.loads(zlib.decompress(records))
+        self.ids: List[str] = records['ids']
+        self.documents: List[Optional[str]] = records['documents']
+        self.metadatas: List[Optional[Dict[str, Any]]] = records['metadatas']
+        count, dim = self.header['count'], self.header['dim']
+        self.vectors = np.memmap(path, dtype='<f4', mode='r', offset=self.header['vectors_offset'], shape=(count, dim)) \
+            if count else np.empty((0, dim), dtype=np.float32)
+
+
+def export_collection(collection, path: str, page_size: int = DEFAULT_PAGE_SIZE, extra_header: Optional[Dict[str, Any]] = None):
+    """Exports every ID, embedding, document and metadata of a ChromaDB collection to a snapshot file."""
+    ids, embeddings, documents, metadatas = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=page_size, offset=offset)
+        page_ids = page.get('ids') or []
+        ids.extend(page_ids)
+        embeddings.extend(page['embeddings'])
+        documents.extend(page['documents'])
+        metadatas.extend(page['metadatas'])
+        if len(page_ids) < page_size:
+            break
+        offset += page_size
+    write_snapshot(path, ids, np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1), documents, metadatas,
+                   extra_header={'collection_name': collection.name, **(extra_header or {})})
+
+
+def import_into_collection(snapshot: Snapshot, collection, batch_size: int = DEFAULT_PAGE_SIZE):
+    """Upserts the snapshot into a ChromaDB collection with its stored embeddings (no embedding calls)."""
+    for start in range(0, len(snapshot.ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=snapshot.ids[start:end],
+            embeddings=np.asarray(snapshot.vectors[start:end]).tolist(),
+            documents=snapshot.documents[start:end],
+            metadatas=snapshot.metadatas[start:end],
+        )
+    logger.info(f"Imported {len(snapshot.ids)} records into collection '{collection.name}'.")
+
+
+def import_into_vector_index(snapshot: Snapshot, directory: str, dtype: str = 'int8', nlist: int = 0):
+    """Builds a QuantizedVectorIndex from the snapshot."""
+    try:
+        from .vector_index import QuantizedVectorIndex
+    except ImportError:
+        from vector_index import QuantizedVectorIndex
+    QuantizedVectorIndex.build(directory, snapshot.ids, snapshot.vectors, snapshot.documents, snapshot.metadatas,
+                               dtype=dtype, nlist=nlist)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    try:
+        from .embedding_backends import collection_name_for_backend
+        from .result_cache import bump_collection_version
+    except ImportError:
+        from embedding_backends import collection_name_for_backend
+        from result_cache import bump_collection_version
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    default_collection = collection_name_for_backend(config.COLLECTION_NAME, config.EMBEDDING_BACKEND)
+    parser = argparse.ArgumentParser(description="Export or import a vector collection snapshot.")
+    parser.add_argument("--persist-directory", default=config.PERSIST_DIRECTORY)
+    parser.add_argument("--collection", default=default_collection)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write the collection to a snapshot file.")
+    export_parser.add_argument("path")
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into a collection or a vector index.")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--target", choices=["collection", "index"], default="collection")
+    import_parser.add_argument("--index", default=config.VECTOR_INDEX_PATH)
+    import_parser.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    import_parser.add_argument("--nlist", type=int, default=0)
+    info_parser = subparsers.add_parser("info", help="Print the snapshot header.")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    if args.command == "info":
+        print(json.dumps(Snapshot(args.path).header, indent=2))
+    elif args.command == "import" and args.target == "index":
+        import_into_vector_index(Snapshot(args.path), args.index, dtype=args.dtype, nlist=args.nlist)
+    else:
+        import chromadb
+        client = chromadb.PersistentClient(path=args.persist_directory)
+        if args.command == "export":
+            export_collection(client.get_collection(args.collection), args.path,
+                              extra_header={'embedding_backend': config.EMBEDDING_BACKEND})
+        else:
+            # No embedding function: vectors come from the snapshot, so the embedding API is never called
+            import_into_collection(Snapshot(args.path), client.get_or_create_collection(name=args.collection))
+    if args.command == "import":
+        # Cached retrieval results of the replaced data are no longer served
+        bump_collection_version(config.COLLECTION_VERSION_PATH)
+    logger.info(f"'{args.command}' finished in {time.perf_counter() - start_time:.2f}s.")
@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import bm25_index
+from bm25_index import BM25Index, POSTING_ARRAYS
+
+IDS = ['d1', 'd2', 'd3']
+TEXTS = ['battery life is short', 'great night vision camera', 'battery replacement was easy']
+
+
+def _build(directory):
+    index = BM25Index(str(directory))
+    index.add_documents(IDS, TEXTS)
+    index.save()
+    return index
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = _build(tmp_path)
+
+    loaded = BM25Index.load(str(tmp_path))
+
+    assert loaded.search('battery', 3) == index.search('battery', 3)
+    assert isinstance(loaded.posting_rows, np.memmap)
+    assert [name for name in os.listdir(tmp_path) if name != 'manifest.json'] == [
+        json.loads((tmp_path / 'manifest.json').read_text())['segment']]
+
+
+def test_incremental_save_replaces_the_segment(tmp_path):
+    _build(tmp_path)
+    index = BM25Index.load(str(tmp_path))
+    index.remove(['d1'])
+    index.add_documents(['d4'], ['battery pack for the doorbell'])
+    index.save()
+
+    loaded = BM25Index.load(str(tmp_path))
+
+    assert sorted(doc_id for doc_id, _ in loaded.search('battery', 5)) == ['d3', 'd4']
+    assert len([name for name in os.listdir(tmp_path) if name.startswith('segment-')]) == 1
+
+
+def test_crash_before_the_manifest_swap_keeps_the_previous_index(tmp_path, monkeypatch):
+    _build(tmp_path)
+    index = BM25Index.load(str(tmp_path))
+    index.add_documents(['d4'], ['battery pack for the doorbell'])
+
+    def crash(src, dst):
+        raise OSError("simulated crash")
+    monkeypatch.setattr(bm25_index.os, 'replace', crash)
+    with pytest.raises(OSError):
+        index.save()
+    monkeypatch.undo()
+
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.doc_ids == IDS
+    assert sorted(doc_id for doc_id, _ in loaded.search('battery', 5)) == ['d1', 'd3']
+    # The next save clears the segment of the interrupted one
+    loaded.save()
+    assert len([name for name in os.listdir(tmp_path) if name.startswith('segment-')]) == 1
+
+
+@pytest.mark.parametrize('format_version', [1, 2])
+def test_legacy_formats_load_and_are_converted_on_save(tmp_path, format_version):
+    index = BM25Index(str(tmp_path))
+    index.add_documents(IDS, TEXTS)
+    index._compact()
+    with open(tmp_path / 'docs.json', 'w') as f:
+        json.dump({'ids': index.doc_ids, 'text_hashes': index.text_hashes}, f)
+    with open(tmp_path / 'vocab.json', 'w') as f:
+        json.dump(index.vocab, f)
+    arrays = {name: getattr(index, name) for name in POSTING_ARRAYS + ['doc_lengths']}
+    if format_version == 1:
+        np.savez(tmp_path / 'postings.npz', **arrays)
+    else:
+        for name, array in arrays.items():
+            np.save(tmp_path / f'{name}.npy', array)
+    with open(tmp_path / 'manifest.json', 'w') as f:
+        json.dump({'format_version': format_version}, f)
+
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search('battery', 3) == index.search('battery', 3)
+
+    loaded.save()
+    assert sorted(name for name in os.listdir(tmp_path) if not name.startswith('segment-')) == ['manifest.json']
+    assert BM25Index.load(str(tmp_path)).search('battery', 3) == index.search('battery', 3)
@@ -0,0 +1,57 @@
+import pytest
+
+from context_builder import TRUNCATION_MARK, allocate_budget, build_context, estimate_tokens, truncate_text
+
+
+def test_allocate_budget_gives_every_document_its_cost_when_they_fit():
+    assert allocate_budget([30, 50, 20], 1000) == [30, 50, 20]
+    assert allocate_budget([], 1000) == []
+
+
+def test_allocate_budget_favours_higher_ranks_and_stays_within_the_budget():
+    allowances = allocate_budget([400, 400, 400], 600)
+
+    assert allowances[0] > allowances[1] > allowances[2]
+    assert sum(allowances) <= 600
+    assert allocate_budget([400, 400, 400], 600, rank_decay=1.0) == [200, 200, 200]
+
+
+def test_allocate_budget_shares_what_short_documents_leave():
+    allowances = allocate_budget([10, 1000, 1000], 600)
+
+    assert allowances[0] == 10
+    # The 590 tokens left are split 1 : 0.85 between the two long documents
+    assert allowances[1:] == [int(590 / 1.85), int(590 * 0.85 / 1.85)]
+
+
+def test_truncate_text_keeps_short_texts():
+    assert truncate_text("Great camera.", 10) == ("Great camera.", False)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("Battery lasts a month. Night vision is sharp. The app crashes often and support never replied.",
+     "Battery lasts a month. Night vision is sharp." + TRUNCATION_MARK),
+    # Scraped reviews often run sentences together
+    ("Battery lasts a month.Night vision is sharp.The app crashes often and support never replied.",
+     "Battery lasts a month.Night vision is sharp." + TRUNCATION_MARK),
+    ("battery lasts a month night vision is sharp the app crashes often and support never replied",
+     "battery lasts a month night vision is sharp the" + TRUNCATION_MARK),
+])
+def test_truncate_text_cuts_at_a_sentence_end_or_a_word_boundary(text, expected):
+    truncated, was_truncated = truncate_text(text, 14)
+
+    assert (truncated, was_truncated) == (expected, True)
+    assert estimate_tokens(truncated) <= 14
+
+
+def test_build_context_drops_the_lowest_ranked_documents_first():
+    long_text = "The doorbell camera works well. " * 40
+    results = {'ids': [['d1', 'd2', 'd3']], 'documents': [[long_text, long_text, long_text]],
+               'metadatas': [[{'source_type': 'amazon_review'}] * 3]}
+
+    context, stats = build_context(results, token_budget=300, min_text_tokens=100)
+
+    assert [entry['id'] for entry in stats['document_tokens']] == ['d1', 'd2']
+    assert stats['documents_dropped'] == 1 and stats['documents_truncated'] == 2
+    assert context.startswith('[1] ') and '\n\n[2] ' in context and '[3]' not in context
+    assert sum(entry['tokens'] for entry in stats['document_tokens']) <= 300
@@ -0,0 +1,32 @@
+import numpy as np
+
+from diversification import collapse_near_duplicates, diversify, maximal_marginal_relevance
+
+
+def test_duplicates_by_text_or_embedding_collapse_into_the_better_candidate():
+    embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [0.999, 0.01], [0.5, 0.5], [0.0, 0.0]])
+    texts = ['Battery died fast', 'Great app', 'other wording', '  battery DIED fast ', 'no embedding']
+
+    kept, duplicates = collapse_near_duplicates(embeddings, texts)
+
+    assert kept == [0, 1, 4]
+    assert duplicates == {0: [2, 3]}
+
+
+def test_mmr_skips_a_candidate_similar_to_one_already_picked():
+    relevance = np.array([1.0, 0.95, 0.6])
+    embeddings = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]])
+
+    assert maximal_marginal_relevance(relevance, embeddings, 2, lambda_mult=0.5) == [0, 2]
+    assert maximal_marginal_relevance(relevance, embeddings, 2, lambda_mult=1.0) == [0, 1]
+    assert maximal_marginal_relevance(relevance, embeddings, 0) == []
+
+
+def test_diversify_reports_the_duplicates_of_the_selected_candidates():
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [0.7, 0.7], [0.0, 1.0]])
+    texts = ['a', 'b', 'c', 'd']
+
+    selected, duplicates = diversify(embeddings, texts, k=2, query_embedding=[1.0, 0.2], lambda_mult=0.5)
+
+    assert selected == [0, 3]
+    assert duplicates == {0: [1]}
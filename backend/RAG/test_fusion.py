@@ -0,0 +1,64 @@
+import pytest
+
+import config
+from fusion import reciprocal_rank_fusion, weighted_score_fusion
+from retrieval_methods import RetrievalMethods
+from vector_index import QuantizedVectorIndex
+
+
+def test_rrf_rewards_documents_both_legs_return():
+    fused = reciprocal_rank_fusion({'similarity': ['a', 'b', 'c'], 'keyword': ['c', 'd']}, rrf_k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ['c', 'a', 'b', 'd']
+    assert dict(fused)['c'] == pytest.approx(1 / 63 + 1 / 61)
+    assert dict(fused)['a'] == pytest.approx(1 / 61)
+
+
+def test_rrf_weights_scale_each_leg():
+    fused = reciprocal_rank_fusion({'similarity': ['a'], 'keyword': ['b']}, {'similarity': 0.2, 'keyword': 0.8}, rrf_k=0)
+
+    assert fused == [('b', pytest.approx(0.8)), ('a', pytest.approx(0.2))]
+
+
+def test_weighted_fusion_normalizes_each_leg_before_summing():
+    # Raw keyword scores are much larger than the similarity ones; normalization puts both legs in [0, 1]
+    fused = weighted_score_fusion({'similarity': {'a': -0.1, 'b': -0.3, 'c': -0.5},
+                                   'keyword': {'c': 40.0, 'd': 10.0}},
+                                  {'similarity': 0.5, 'keyword': 0.5})
+
+    assert dict(fused) == pytest.approx({'a': 0.5, 'b': 0.25, 'c': 0.5, 'd': 0.0})
+    assert weighted_score_fusion({'similarity': {'a': 2.0, 'b': 2.0}, 'keyword': {}}) == [('a', 1.0), ('b', 1.0)]
+
+
+def _embed(texts):
+    return [[1.0, float(len(text) % 5), 0.5] for text in texts]
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    ids = ['d1', 'd2', 'd3']
+    documents = ['first document', 'second document', 'third document']
+    QuantizedVectorIndex.build(str(tmp_path), ids, _embed(documents), documents, [{'n': 1}, {'n': 2}, {'n': 3}])
+    return RetrievalMethods(QuantizedVectorIndex(str(tmp_path), embedding_function=_embed), k=2, diversify=False)
+
+
+@pytest.mark.parametrize('fusion, expected_ids', [
+    ('rrf', ['d2', 'd1']), # d2 is the only document both legs return
+    ('weighted', ['d1', 'd3']), # d2 is the worst of both legs, so min-max normalization gives it 0 twice
+])
+def test_hybrid_fusion_keeps_each_documents_leg_scores(retriever, monkeypatch, fusion, expected_ids):
+    monkeypatch.setattr(config, 'HYBRID_FUSION', fusion)
+    similarity = {'ids': [['d1', 'd2']], 'documents': [['first', 'second']], 'metadatas': [[{'n': 1}, {'n': 2}]],
+                  'distances': [[0.1, 0.4]]}
+    keyword = {'ids': ['d3', 'd2'], 'documents': ['third', 'second'], 'metadatas': [{'n': 3}, {'n': 2}],
+               'scores': [7.5, 2.0]}
+
+    fused = retriever._fuse(similarity, keyword)
+
+    assert sorted(fused['ids']) == sorted(expected_ids) and fused['ids'][0] == expected_ids[0]
+    by_id = dict(zip(fused['ids'], zip(fused['documents'], fused['leg_scores'])))
+    assert by_id['d1'] == ('first', {'similarity_distance': 0.1, 'similarity_rank': 1,
+                                     'keyword_score': None, 'keyword_rank': None})
+    if 'd2' in by_id:
+        assert by_id['d2'] == ('second', {'similarity_distance': 0.4, 'similarity_rank': 2,
+                                          'keyword_score': 2.0, 'keyword_rank': 2})
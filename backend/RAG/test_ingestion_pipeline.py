@@ -0,0 +1,97 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from ingestion_pipeline import FakeEmbeddingFunction, IngestionPipeline, benchmark_pipeline
+
+IDS = [f"doc_{i}" for i in range(95)]
+DOCUMENTS = [f"document number {i}" for i in range(95)]
+METADATAS = [{'n': i} for i in range(95)]
+
+
+class RecordingWriter:
+    def __init__(self, fail_on_batch=None):
+        self.fail_on_batch = fail_on_batch
+        self.written = Counter()
+        self.embeddings = {}
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ids, documents, metadatas, embeddings):
+        with self._lock:
+            self.batches += 1
+            if self.batches == self.fail_on_batch:
+                raise IOError("simulated write failure")
+            self.written.update(ids)
+            self.embeddings.update(zip(ids, embeddings))
+
+
+def _run(pipeline, timeout=10):
+    """Runs the pipeline on another thread; fails the test if it hangs"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['stats'] = pipeline.run(IDS, DOCUMENTS, METADATAS)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "ingestion pipeline hung"
+    return outcome
+
+
+def test_every_document_is_written_exactly_once():
+    writer = RecordingWriter()
+    embed_fn = FakeEmbeddingFunction(latency=0.002)
+    pipeline = IngestionPipeline(embed_fn, writer, batch_size=7, max_in_flight=3)
+
+    outcome = _run(pipeline)
+
+    assert 'error' not in outcome
+    assert writer.written == Counter(IDS)
+    assert writer.embeddings == {doc_id: embed_fn._vector(text) for doc_id, text in zip(IDS, DOCUMENTS)}
+    assert outcome['stats']['items'] == len(IDS) and outcome['stats']['batches'] == 14
+
+
+def test_failed_embedding_requests_are_retried():
+    writer = RecordingWriter()
+    # One request in flight: every second call fails and its retry succeeds
+    pipeline = IngestionPipeline(FakeEmbeddingFunction(fail_every=2), writer, batch_size=10, max_in_flight=1,
+                                 max_retries=1, backoff_base=0.0)
+
+    outcome = _run(pipeline)
+
+    assert 'error' not in outcome
+    assert writer.written == Counter(IDS)
+
+
+@pytest.mark.parametrize('max_in_flight', [1, 4])
+def test_embedding_error_stops_the_pipeline(max_in_flight):
+    writer = RecordingWriter()
+    pipeline = IngestionPipeline(FakeEmbeddingFunction(latency=0.002, fail_every=3), writer, batch_size=5,
+                                 max_in_flight=max_in_flight, max_retries=0)
+
+    outcome = _run(pipeline)
+
+    assert isinstance(outcome.get('error'), RuntimeError)
+    assert max(writer.written.values(), default=1) == 1
+    assert sum(writer.written.values()) < len(IDS)
+
+
+def test_write_error_stops_the_pipeline():
+    writer = RecordingWriter(fail_on_batch=2)
+    pipeline = IngestionPipeline(FakeEmbeddingFunction(), writer, batch_size=5, max_in_flight=2)
+
+    outcome = _run(pipeline)
+
+    assert isinstance(outcome.get('error'), IOError)
+    assert max(writer.written.values(), default=1) == 1
+
+
+def test_pipeline_writes_the_same_data_as_the_serial_loop():
+    results = benchmark_pipeline(num_items=200, batch_size=20, max_in_flight=4, embed_latency=0.005, write_latency=0.001)
+    assert results['items'] == 200
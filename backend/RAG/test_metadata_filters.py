@@ -0,0 +1,50 @@
+import pytest
+
+from metadata_filters import MetadataFilterIndex, build_where, check_filter_fields, parse_filters
+
+IDS = ['review_1', 'review_2', 'post_1']
+METADATAS = [
+    {'source_type': 'amazon_review', 'product_id': 'B0AAAAAAAA', 'review_rating': 5.0, 'created_epoch': 1717113600},
+    {'source_type': 'amazon_review', 'product_id': 'B0BBBBBBBB', 'review_rating': 2.0, 'created_epoch': 1714521600},
+    {'source_type': 'reddit_post', 'subreddit': 'homesecurity', 'created_epoch': 1717200000},
+]
+
+
+def test_parse_filters_normalizes_values_and_dates():
+    filters = parse_filters({'product_asin': ['B0BBBBBBBB', 'B0AAAAAAAA', 'B0AAAAAAAA'], 'source_type': 'amazon_review',
+                             'rating_min': 4, 'date_from': '2024-05-01', 'date_to': '2024-05-31'})
+
+    assert filters == {'product_asin': ['B0AAAAAAAA', 'B0BBBBBBBB'], 'source_type': ['amazon_review'],
+                       'rating_min': 4.0, 'date_from': 1714521600, 'date_to': 1717199999}
+    assert parse_filters({}) is None
+
+
+@pytest.mark.parametrize('raw', [{'colour': 'red'}, {'rating_min': 'high'}, {'date_from': '31/05/2024'},
+                                 {'product_asin': [1, 2]}])
+def test_parse_filters_rejects_invalid_filters(raw):
+    with pytest.raises(ValueError):
+        parse_filters(raw)
+
+
+def test_filter_index_matches_the_where_clause():
+    index = MetadataFilterIndex(IDS, METADATAS)
+    where = build_where(parse_filters({'date_from': '2024-05-31', 'rating_min': 4}))
+
+    assert index.candidate_ids(where) == {'review_1'}
+    assert index.candidate_ids(build_where(parse_filters({'source_type': ['reddit_post', 'amazon_review']}))) == set(IDS)
+
+
+def test_filters_on_a_field_no_document_has_are_rejected():
+    # A collection loaded before data processing wrote product_id and created_epoch
+    stale = [{key: value for key, value in metadata.items() if key not in ('product_id', 'created_epoch')}
+             for metadata in METADATAS]
+    index = MetadataFilterIndex(IDS, stale)
+
+    assert index.missing_fields() == ['product_id', 'created_epoch', 'sentiment_label']
+    with pytest.raises(ValueError, match='created_epoch'):
+        check_filter_fields(parse_filters({'date_from': '2024-05-01'}), index)
+    with pytest.raises(ValueError, match='product_id'):
+        check_filter_fields(parse_filters({'product_asin': 'B0AAAAAAAA'}), index)
+    check_filter_fields(parse_filters({'rating_min': 4, 'subreddit': 'homesecurity'}), index)
+    check_filter_fields(parse_filters({'date_from': '2024-05-01'}), MetadataFilterIndex(IDS, METADATAS))
+    check_filter_fields(parse_filters({'date_from': '2024-05-01'}), None)
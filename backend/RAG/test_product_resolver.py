@@ -0,0 +1,68 @@
+import pytest
+
+from product_resolver import ProductResolver, retrieve_many_scoped, retrieve_scoped
+from retrieval_methods import RetrievalMethods
+from vector_index import QuantizedVectorIndex
+
+PRODUCTS = [
+    {'product_id': 'B0AAAAAAAA', 'product_title': 'eufy Security eufyCam 2C, Wireless Home Security Camera'},
+    {'product_id': 'B0BBBBBBBB', 'product_title': 'Wyze Cam v3 Pro, Indoor/Outdoor Camera'},
+]
+
+
+def _embed(texts):
+    return [[1.0, float(len(text) % 7), 0.5] for text in texts]
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    # The eufy product has no reviews; it is only discussed in a forum post, which carries no product_id
+    ids = ['amazon_review_B0BBBBBBBB_1', 'reddit_post_1']
+    documents = ['wyze night vision is great', 'my eufycam 2c battery died after a month']
+    metadatas = [{'source_type': 'amazon_review', 'product_id': 'B0BBBBBBBB'}, {'source_type': 'reddit_post'}]
+    QuantizedVectorIndex.build(str(tmp_path), ids, _embed(documents), documents, metadatas)
+    return RetrievalMethods(QuantizedVectorIndex(str(tmp_path), embedding_function=_embed), k=2, diversify=False)
+
+
+@pytest.fixture
+def resolver():
+    return ProductResolver.from_records(PRODUCTS)
+
+
+@pytest.mark.parametrize('method', ['similarity', 'similarity_filter_negative', 'hybrid_similarity_keyword'])
+def test_scoped_retrieval_falls_back_when_the_product_has_no_documents(retriever, resolver, method):
+    assert [product['product_id'] for product in resolver.resolve('eufy 2C battery')] == ['B0AAAAAAAA']
+    scoped = retriever.retrieve('eufy 2C battery', method, {'product_asin': ['B0AAAAAAAA']})
+    assert not RetrievalMethods._flatten_results(scoped)[0]
+    if method.startswith('similarity'):
+        assert scoped['ids'] == [[]] # nested like chromadb.Collection.query, so truthy although empty
+
+    retrieved, resolved_products = retrieve_scoped(retriever, resolver, 'eufy 2C battery', method, None)
+
+    assert resolved_products == []
+    if method != 'similarity_filter_negative': # no document carries a sentiment label
+        assert 'reddit_post_1' in RetrievalMethods._flatten_results(retrieved)[0]
+
+
+def test_scoped_retrieval_keeps_the_scope_when_it_finds_documents(retriever, resolver):
+    retrieved, resolved_products = retrieve_scoped(retriever, resolver, 'wyze cam v3 night vision', 'similarity', None)
+
+    assert [product['product_id'] for product in resolved_products] == ['B0BBBBBBBB']
+    assert RetrievalMethods._flatten_results(retrieved)[0] == ['amazon_review_B0BBBBBBBB_1']
+
+
+def test_batch_scoped_retrieval_falls_back_per_query(retriever, resolver):
+    retrieved, resolved = retrieve_many_scoped(retriever, resolver, ['eufy 2C battery', 'wyze cam v3 night vision'],
+                                               'similarity', None)
+
+    assert resolved[0] == [] and 'reddit_post_1' in RetrievalMethods._flatten_results(retrieved[0])[0]
+    assert [product['product_id'] for product in resolved[1]] == ['B0BBBBBBBB']
+    assert RetrievalMethods._flatten_results(retrieved[1])[0] == ['amazon_review_B0BBBBBBBB_1']
+
+
+def test_no_scope_when_the_request_filters_by_product(retriever, resolver):
+    retrieved, resolved_products = retrieve_scoped(retriever, resolver, 'eufy 2C battery', 'similarity',
+                                                   {'product_asin': ['B0BBBBBBBB']})
+
+    assert resolved_products == []
+    assert RetrievalMethods._flatten_results(retrieved)[0] == ['amazon_review_B0BBBBBBBB_1']
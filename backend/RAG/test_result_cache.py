@@ -0,0 +1,85 @@
+from result_cache import CollectionVersion, INITIAL_VERSION, RetrievalResultCache, bump_collection_version
+
+RESULT = {'ids': [['d1', 'd2']], 'distances': [[0.1, 0.2]]}
+
+
+class VersionStub:
+    def __init__(self, version='1'):
+        self.version = version
+
+    def __call__(self):
+        return self.version
+
+
+def test_a_hit_returns_a_copy_for_the_normalized_query_and_filters():
+    cache = RetrievalResultCache(VersionStub())
+    cache.put('  Battery   LIFE ', 'similarity', 5, {'source_type': ['amazon_review']}, RESULT)
+
+    hit = cache.get('battery life', 'similarity', 5, {'source_type': ['amazon_review']})
+    hit['ids'].clear()
+
+    assert cache.get('battery life', 'similarity', 5, {'source_type': ['amazon_review']}) == RESULT
+    assert cache.get('battery life', 'similarity', 5, None) is None
+    assert cache.get('battery life', 'keyword', 5, {'source_type': ['amazon_review']}) is None
+
+
+def test_a_new_collection_version_invalidates_every_entry(tmp_path):
+    version = VersionStub()
+    cache = RetrievalResultCache(version, sqlite_path=str(tmp_path / 'results.sqlite3'))
+    cache.put('battery life', 'similarity', 5, None, RESULT)
+
+    version.version = '2'
+
+    assert cache.get('battery life', 'similarity', 5, None) is None
+    assert cache._db.execute("SELECT COUNT(*) FROM retrieval_results").fetchone()[0] == 0
+
+
+def test_a_result_computed_across_a_version_bump_is_not_stored(tmp_path):
+    version = VersionStub()
+    cache = RetrievalResultCache(version, sqlite_path=str(tmp_path / 'results.sqlite3'))
+
+    def compute():
+        version.version = '2' # a writer reloads the collection while the query runs
+        return RESULT
+
+    assert cache.get_or_compute('battery life', 'similarity', 5, None, compute) == RESULT
+    assert cache.get('battery life', 'similarity', 5, None) is None
+    assert cache._db.execute("SELECT COUNT(*) FROM retrieval_results").fetchone()[0] == 0
+
+
+def test_processes_share_results_through_the_sqlite_tier(tmp_path):
+    sqlite_path = str(tmp_path / 'results.sqlite3')
+    version = VersionStub()
+    writer = RetrievalResultCache(version, namespace='local', sqlite_path=sqlite_path)
+    reader = RetrievalResultCache(version, namespace='local', sqlite_path=sqlite_path)
+    other_backend = RetrievalResultCache(version, namespace='google', sqlite_path=sqlite_path)
+
+    writer.put('battery life', 'similarity', 5, None, RESULT)
+
+    assert reader.get('battery life', 'similarity', 5, None) == RESULT
+    assert reader.stats()['shared_hits'] == 1
+    assert other_backend.get('battery life', 'similarity', 5, None) is None
+
+
+def test_the_lru_evicts_the_least_recently_used_entry():
+    cache = RetrievalResultCache(VersionStub(), max_size=2)
+    cache.put('q1', 'similarity', 5, None, RESULT)
+    cache.put('q2', 'similarity', 5, None, RESULT)
+    cache.get('q1', 'similarity', 5, None)
+    cache.put('q3', 'similarity', 5, None, RESULT)
+
+    assert cache.get('q2', 'similarity', 5, None) is None
+    assert cache.get('q1', 'similarity', 5, None) == RESULT
+    assert cache.stats()['evictions'] == 1
+
+
+def test_collection_version_follows_the_version_file(tmp_path):
+    path = str(tmp_path / 'collection_version.json')
+    version = CollectionVersion(path)
+    assert version.current() == INITIAL_VERSION
+
+    first = bump_collection_version(path)
+    assert version.current() == first
+    second = bump_collection_version(path)
+    assert version.current() == second != first
+    assert second.startswith('2-')
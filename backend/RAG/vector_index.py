@@ -0,0 +1,425 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .metadata_filters import MetadataFilterIndex
+except ImportError:
+    from metadata_filters import MetadataFilterIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+SUPPORTED_INDEX_DTYPES = ['int8', 'float16']
+# Candidates re-scored in float32 per requested result
+DEFAULT_RESCORE_FACTOR = 4
+# Rows scored per block, which bounds the float32 temporaries of one query
+SCORE_BLOCK_ROWS = 16384
+DEFAULT_PAGE_SIZE = 1000
+
+
+# --- Chroma-style filters ---
+
+_COMPARISONS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$gt': lambda value, operand: value is not None and value > operand,
+    '$gte': lambda value, operand: value is not None and value >= operand,
+    '$lt': lambda value, operand: value is not None and value < operand,
+    '$lte': lambda value, operand: value is not None and value <= operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+}
+
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Chroma `where` metadata filter ($and/$or, $eq/$ne/$gt/$gte/$lt/$lte/$in/$nin) on one record."""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_where(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator not in _COMPARISONS:
+                    raise ValueError(f"Unsupported where operator: {operator}")
+                try:
+                    if not _COMPARISONS[operator](value, operand):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def matches_where_document(document: Optional[str], where_document: Optional[Dict[str, Any]]) -> bool:
+    """Evaluates a Chroma `where_document` filter ($contains, $not_contains, $and, $or) on one document."""
+    if not where_document:
+        return True
+    document = document or ''
+    for operator, operand in where_document.items():
+        if operator == '$contains':
+            if operand not in document:
+                return False
+        elif operator == '$not_contains':
+            if operand in document:
+                return False
+        elif operator == '$and':
+            if not all(matches_where_document(document, sub) for sub in operand):
+                return False
+        elif operator == '$or':
+            if not any(matches_where_document(document, sub) for sub in operand):
+                return False
+        else:
+            raise ValueError(f"Unsupported where_document operator: {operator}")
+    return True
+
+
+# --- Quantization and IVF helpers ---
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Returns (quantized matrix, per-row scales). int8 uses symmetric per-vector
+    scaling (x ~= q * scale); float16 needs no scale (scales are all ones).
+    """
+    if dtype == 'float16':
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unsupported index dtype '{dtype}'. Supported: {SUPPORTED_INDEX_DTYPES}")
+
+
+def train_ivf(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 42):
+    """
+    Plain k-means (Lloyd) partitioning for the IVF index.
+
+    Returns:
+        (centroids, assignments): centroids of shape (nlist, dim) and the list of every vector.
+    """
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * vectors @ centroids.T
+        assignments = distances.argmin(axis=1)
+        for list_id in range(nlist):
+            members = vectors[assignments == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+    return centroids.astype(np.float32), assignments
+
+
+class QuantizedVectorIndex:
+    """
+    In-process vector index with the query/get/count interface RetrievalMethods
+    uses on a ChromaDB collection, so it can replace the collection.
+
+    Files in the index directory:
+      - manifest.json: format version, dimension, count, dtype, IVF settings
+      - vectors_f32.npy: full-precision vectors (memory-mapped, only candidate rows are read)
+      - vectors_q.npy / scales.npy: int8 (or float16) vectors scanned for every query
+      - norms_sq.npy: squared norms, so L2 distances need a single dot product
+      - centroids.npy / list_offsets.npy / list_rows.npy: IVF partitions (when nlist > 0)
+      - records.json: ids, documents and metadatas
+
+    Search scans the quantized matrix (exact) or only the `nprobe` closest IVF
+    lists, keeps `rescore_factor * n_results` candidates and re-scores them
+    with float32 vectors. Distances are squared L2, like Chroma's default space.
+    """
+    def __init__(self, directory: str, embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 nprobe: int = 8, rescore_factor: int = DEFAULT_RESCORE_FACTOR):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self.rescore_factor = rescore_factor
+
+        with open(os.path.join(directory, 'manifest.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format {self.manifest.get('format_version')} in {directory}")
+        self.dim = self.manifest['dim']
+        self.dtype = self.manifest['dtype']
+
+        def load(name):
+            return np.load(os.path.join(directory, name), mmap_mode='r')
+        self.vectors = load('vectors_f32.npy')
+        self.quantized = load('vectors_q.npy')
+        self.scales = np.asarray(load('scales.npy'))
+        self.norms_sq = np.asarray(load('norms_sq.npy'))
+        self.centroids = np.asarray(load('centroids.npy')) if self.manifest['nlist'] else None
+        self.list_offsets = np.asarray(load('list_offsets.npy')) if self.manifest['nlist'] else None
+        self.list_rows = np.asarray(load('list_rows.npy')) if self.manifest['nlist'] else None
+
+        with open(os.path.join(directory, 'records.json'), 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        self.ids: List[str] = records['ids']
+        self.documents: List[Optional[str]] = records['documents']
+        self.metadatas: List[Optional[Dict[str, Any]]] = records['metadatas']
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self._filter_masks: Dict[str, np.ndarray] = {}
+        # Indexed `where` evaluation, shared with keyword retrieval (see metadata_filters.load_filter_index)
+        self.filter_index = MetadataFilterIndex(self.ids, self.metadatas)
+        logger.info(f"Loaded {self.dtype} vector index from {directory}: {len(self.ids)} vectors, "
+                    f"dim {self.dim}, {self.manifest['nlist'] or 'no'} IVF lists.")
+
+    @staticmethod
+    def build(directory: str, ids: Sequence[str], embeddings, documents: Sequence[Optional[str]],
+              metadatas: Sequence[Optional[Dict[str, Any]]], dtype: str = 'int8', nlist: int = 0):
+        """Writes a new index to `directory` (nlist=0 builds an exact, non-partitioned index)."""
+        vectors = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32))
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Embeddings must be a 2-D array with one row per ID.")
+        os.makedirs(directory, exist_ok=True)
+        quantized, scales = quantize(vectors, dtype)
+        np.save(os.path.join(directory, 'vectors_f32.npy'), vectors)
+        np.save(os.path.join(directory, 'vectors_q.npy'), quantized)
+        np.save(os.path.join(directory, 'scales.npy'), scales)
+        np.save(os.path.join(directory, 'norms_sq.npy'), (vectors ** 2).sum(axis=1).astype(np.float32))
+
+        nlist = min(nlist, len(vectors))
+        if nlist:
+            centroids, assignments = train_ivf(vectors, nlist)
+            list_rows = np.argsort(assignments, kind='stable')
+            list_offsets = np.searchsorted(assignments[list_rows], np.arange(nlist + 1))
+            np.save(os.path.join(directory, 'centroids.npy'), centroids)
+            np.save(os.path.join(directory, 'list_rows.npy'), list_rows.astype(np.int64))
+            np.save(os.path.join(directory, 'list_offsets.npy'), list_offsets.astype(np.int64))
+
+        with open(os.path.join(directory, 'records.json'), 'w', encoding='utf-8') as f:
+            json.dump({'ids': list(ids), 'documents': list(documents), 'metadatas': list(metadatas)}, f)
+        with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'format_version': INDEX_FORMAT_VERSION, 'dim': int(vectors.shape[1]), 'count': len(ids),
+                       'dtype': dtype, 'nlist': nlist, 'metric': 'l2'}, f)
+        logger.info(f"Built {dtype} vector index in {directory}: {len(ids)} vectors, {nlist or 'no'} IVF lists.")
+
+    def reopen(self) -> "QuantizedVectorIndex":
+        """A new instance over the index files now in `directory` (e.g. after a rebuild), with the same settings."""
+        return QuantizedVectorIndex(self.directory, self.embedding_function, self.nprobe, self.rescore_factor)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes scanned per query (quantized matrix + norms + scales) vs the float32 matrix."""
+        return {
+            'quantized_bytes': int(self.quantized.nbytes + self.scales.nbytes + self.norms_sq.nbytes),
+            'float32_bytes': int(self.vectors.nbytes),
+        }
+
+    def _filter_mask(self, where, where_document) -> Optional[np.ndarray]:
+        mask = self.filter_index.mask(where)
+        if not where_document:
+            return mask
+        cache_key = json.dumps(where_document, sort_keys=True)
+        document_mask = self._filter_masks.get(cache_key)
+        if document_mask is None:
+            document_mask = np.fromiter(
+                (matches_where_document(doc, where_document) for doc in self.documents),
+                dtype=bool, count=len(self.ids)
+            )
+            if len(self._filter_masks) > 256:
+                self._filter_masks.clear()
+            self._filter_masks[cache_key] = document_mask
+        return document_mask if mask is None else mask & document_mask
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows of the nprobe closest IVF lists, or None for an exact scan."""
+        if self.centroids is None:
+            return None
+        centroid_distances = (self.centroids ** 2).sum(axis=1) - 2 * self.centroids @ query
+        probes = np.argsort(centroid_distances)[:self.nprobe]
+        return np.concatenate([self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+
+    def _approximate_distances(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """||x||^2 - 2 q.x with quantized vectors (||q||^2 is constant per query and left out)."""
+        total = len(self.ids) if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, total)
+            block_rows = slice(start, end) if rows is None else rows[start:end]
+            dots = self.quantized[block_rows].astype(np.float32) @ query
+            scores[start:end] = self.norms_sq[block_rows] - 2 * dots * self.scales[block_rows]
+        return scores
+
+    def search(self, query_embedding, n_results: int, where=None, where_document=None):
+        """
+        Returns:
+            (rows, distances) of the n_results nearest vectors, closest first.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        rows = self._candidate_rows(query)
+        mask = self._filter_mask(where, where_document)
+        if mask is not None:
+            selected = np.flatnonzero(mask)
+            # A selective filter leaves fewer rows than the probed lists hold: scan them all
+            # (exact and cheaper, and the IVF lists cannot leave the top-k short)
+            rows = selected if rows is None or len(selected) <= len(rows) else rows[mask[rows]]
+        total = len(self.ids) if rows is None else len(rows)
+        if total == 0 or n_results <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        approximate = self._approximate_distances(query, rows)
+        n_candidates = min(total, n_results * self.rescore_factor)
+        candidates = np.argpartition(approximate, n_candidates - 1)[:n_candidates]
+        candidate_rows = candidates if rows is None else rows[candidates]
+        candidate_rows = np.sort(candidate_rows) # sequential reads from the memory map
+
+        exact_vectors = self.vectors[candidate_rows]
+        distances = ((exact_vectors - query) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind='stable')[:n_results]
+        return candidate_rows[order], distances[order]
+
+    def _embed_queries(self, query_texts):
+        if self.embedding_function is None:
+            raise ValueError("query_texts requires an embedding function; pass query_embeddings instead.")
+        return self.embedding_function(list(query_texts))
+
+    def _records(self, rows: Sequence[int], include: Sequence[str]) -> Dict[str, Any]:
+        return {
+            'ids': [self.ids[row] for row in rows],
+            'documents': [self.documents[row] for row in rows] if 'documents' in include else None,
+            'metadatas': [self.metadatas[row] for row in rows] if 'metadatas' in include else None,
+            'embeddings': [self.vectors[row].tolist() for row in rows] if 'embeddings' in include else None,
+        }
+
+    def query(self, query_texts=None, query_embeddings=None, n_results: int = 10,
+              where=None, where_document=None, include=('documents', 'metadatas', 'distances')) -> Dict[str, Any]:
+        """Same arguments and (nested, one list per query) result shape as chromadb.Collection.query."""
+        if query_embeddings is None:
+            query_embeddings = self._embed_queries(query_texts)
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': [], 'embeddings': []}
+        for query_embedding in query_embeddings:
+            rows, distances = self.search(query_embedding, n_results, where, where_document)
+            records = self._records(rows.tolist(), include)
+            for key in ('ids', 'documents', 'metadatas', 'embeddings'):
+                results[key].append(records[key])
+            results['distances'].append(distances.tolist())
+        for key in ('documents', 'metadatas', 'distances', 'embeddings'):
+            if key not in include:
+                results[key] = None
+        return results
+
+    def get(self, ids=None, where=None, where_document=None, limit=None, offset=None,
+            include=('documents', 'metadatas')) -> Dict[str, Any]:
+        """Same arguments and (flat) result shape as chromadb.Collection.get."""
+        if ids is not None:
+            rows = [self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id]
+        else:
+            rows = range(len(self.ids))
+        mask = self._filter_mask(where, where_document)
+        if mask is not None:
+            rows = [row for row in rows if mask[row]]
+        rows = list(rows)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._records(rows, include)
+
+
+def build_index_from_collection(collection, directory: str, dtype: str = 'int8', nlist: int = 0,
+                                page_size: int = DEFAULT_PAGE_SIZE):
+    """Pages through a ChromaDB collection and builds a QuantizedVectorIndex from its stored embeddings."""
+    ids, embeddings, documents, metadatas = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=page_size, offset=offset)
+        page_ids = page.get('ids') or []
+        ids.extend(page_ids)
+        embeddings.extend(page['embeddings'])
+        documents.extend(page['documents'])
+        metadatas.extend(page['metadatas'])
+        if len(page_ids) < page_size:
+            break
+        offset += page_size
+    QuantizedVectorIndex.build(directory, ids, embeddings, documents, metadatas, dtype=dtype, nlist=nlist)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def benchmark_index(index: QuantizedVectorIndex, query_embeddings, k: int = 10, collection=None) -> Dict[str, Any]:
+    """
+    Latency, memory and recall@k of the index (and optionally of a Chroma HNSW
+    collection holding the same vectors), with exact float32 search as ground truth.
+    """
+    full = np.asarray(index.vectors, dtype=np.float32)
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    ground_truth = [set(np.argsort(((full - query) ** 2).sum(axis=1))[:k].tolist()) for query in queries]
+
+    def measure(search_fn):
+        latencies, recalls = [], []
+        for query, truth in zip(queries, ground_truth):
+            start = time.perf_counter()
+            rows = search_fn(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(truth.intersection(rows)) / len(truth) if truth else 1.0)
+        return {'p50_ms': _percentile(latencies, 0.5), 'p95_ms': _percentile(latencies, 0.95),
+                f'recall@{k}': sum(recalls) / len(recalls)}
+
+    results = {'vectors': index.count(), 'dtype': index.dtype, 'nlist': index.manifest['nlist'], **index.memory_bytes()}
+    results['quantized_index'] = measure(lambda query: index.search(query, k)[0].tolist())
+    if collection is not None:
+        def chroma_search(query):
+            found_ids = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])['ids'][0]
+            return [index._row_by_id[doc_id] for doc_id in found_ids if doc_id in index._row_by_id]
+        results['chroma_hnsw'] = measure(chroma_search)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    try:
+        from . import config
+        from .embedding_backends import collection_name_for_backend
+        from .result_cache import bump_collection_version
+    except ImportError:
+        import config
+        from embedding_backends import collection_name_for_backend
+        from result_cache import bump_collection_version
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    default_collection = collection_name_for_backend(config.COLLECTION_NAME, config.EMBEDDING_BACKEND)
+    parser = argparse.ArgumentParser(description="Build or benchmark the quantized vector index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("build", "benchmark"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--persist-directory", default=config.PERSIST_DIRECTORY)
+        sub.add_argument("--collection", default=default_collection)
+        sub.add_argument("--index", default=config.VECTOR_INDEX_PATH)
+        sub.add_argument("--dtype", choices=SUPPORTED_INDEX_DTYPES, default="int8")
+        sub.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = exact scan).")
+    subparsers.choices["build"].add_argument("--version-file", default=config.COLLECTION_VERSION_PATH,
+                                             help="Collection version bumped after the build (see result_cache.py).")
+    subparsers.choices["benchmark"].add_argument("--queries", type=int, default=100, help="Stored vectors reused as queries.")
+    subparsers.choices["benchmark"].add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    import chromadb
+    chroma_collection = chromadb.PersistentClient(path=args.persist_directory).get_collection(args.collection)
+    if args.command == "build":
+        build_index_from_collection(chroma_collection, args.index, dtype=args.dtype, nlist=args.nlist)
+        bump_collection_version(args.version_file)
+    else:
+        vector_index = QuantizedVectorIndex(args.index)
+        rng = np.random.default_rng(0)
+        sample = rng.choice(vector_index.count(), min(args.queries, vector_index.count()), replace=False)
+        # Perturb the stored vectors so queries are not exact matches
+        sample_queries = np.asarray(vector_index.vectors[np.sort(sample)]) * rng.normal(1.0, 0.05, (len(sample), vector_index.dim))
+        logger.info(json.dumps(benchmark_index(vector_index, sample_queries, args.k, chroma_collection), indent=2))
@@ -7,9 +7,17 @@ from flask_cors import CORS
 # Import configuration and RAG components from your predefined files
 try:
     import config 
-    from RAG.RAG_components import initialize_rag_components
+    from RAG.RAG_components import initialize_rag_components, get_query_embedding_cache, get_result_cache
     from RAG.retrieval_methods import RetrievalMethods
-    from RAG.prompt_formatter import RAG_PROMPT_TEMPLATE, format_chroma_results_for_prompt
+    from RAG.prompt_formatter import RAG_PROMPT_TEMPLATE, RAG_NARRATIVE_PROMPT_TEMPLATE, format_analytics_for_prompt
+    from RAG.context_builder import build_prompt_context
+    from RAG.side_store import SideStore
+    from RAG.vector_index import QuantizedVectorIndex
+    from RAG.bm25_index import load_keyword_index
+    from RAG.metadata_filters import parse_filters, check_filter_fields, load_filter_index
+    from RAG.reranker import load_reranker
+    from RAG.analytics import MetadataAnalytics, load_analytics, to_report_fields
+    from RAG.product_resolver import load_product_resolver, retrieve_scoped, retrieve_many_scoped
 except ImportError as e:
     logging.error(f"Failed to import RAG components. Ensure they are in a valid Python package: {e}")
     # Exit or handle appropriately if core components cannot be imported
@@ -36,11 +44,14 @@ chroma_collection = None
 rag_llm = None
 rag_chain = None
 retriever_methods = None # Instance of RetrievalMethods class
+side_store = None # Raw texts and product attributes, joined only for formatted documents
+analytics_store = None # Columnar copy of the sentiment / aspect metadata for deterministic aggregates
+product_resolver = None # Resolves the products named in a query against the product catalog
 
 
 def initialize_rag_components_app():
     """Initializes the expensive RAG components for the Flask app."""
-    global chroma_collection, rag_llm, rag_chain, retriever_methods
+    global chroma_collection, rag_llm, rag_chain, retriever_methods, side_store, analytics_store, product_resolver
 
     if rag_chain is not None:
         logger.info("RAG components already initialized.")
@@ -52,30 +63,186 @@ def initialize_rag_components_app():
     chroma_collection, rag_llm = initialize_rag_components()
 
     # Instantiate RetrievalMethods class
-    retriever_methods = RetrievalMethods(chroma_collection, k=config.RETRIEVER_K)
+    indexes = _load_indexes(chroma_collection)
+    retriever_methods = RetrievalMethods(chroma_collection, k=config.RETRIEVER_K,
+                                         query_embedding_cache=get_query_embedding_cache(),
+                                         keyword_index=indexes['keyword_index'],
+                                         result_cache=get_result_cache(),
+                                         filter_index=indexes['filter_index'],
+                                         reranker=load_reranker(config.RERANKER_MODEL_PATH) if config.RERANK_RESULTS else None,
+                                         index_loader=_reload_indexes)
     logger.info("RetrievalMethods instance created.")
 
     # --- RAG Chain Setup ---
     # Build the RAG chain structure using the initialized LLM and Prompt Template
-    rag_prompt = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
-    rag_chain = (
-        {"context": RunnablePassthrough(), "question": RunnablePassthrough()}
-        | rag_prompt
-        | rag_llm
-        | StrOutputParser()
-    )
+    if config.DETERMINISTIC_ANALYTICS:
+        # Sentiment and aspect aggregates are computed from the metadata; the LLM only writes the narrative
+        rag_chain = ChatPromptTemplate.from_template(RAG_NARRATIVE_PROMPT_TEMPLATE) | rag_llm | StrOutputParser()
+    else:
+        rag_prompt = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
+        rag_chain = (
+            {"context": RunnablePassthrough(), "question": RunnablePassthrough()}
+            | rag_prompt
+            | rag_llm
+            | StrOutputParser()
+        )
     logger.info("RAG chain structure built.")
 
 
-# --- API Endpoint ---
+def _load_indexes(collection) -> dict:
+    """
+    Loads everything built from the collection's contents: the BM25 and
+    metadata filter indexes (returned for RetrievalMethods) and the side
+    store, analytics store and product catalog (set as globals).
+    """
+    global chroma_collection, side_store, analytics_store, product_resolver
+    chroma_collection = collection
+    side_store = SideStore(config.SIDE_STORE_PATH)
+    analytics_store = load_analytics(collection)
+    product_resolver = load_product_resolver(side_store, collection, config.PRODUCT_KEYWORDS)
+    filter_index = load_filter_index(collection)
+    missing_fields = filter_index.missing_fields() if filter_index is not None and len(filter_index) else []
+    if missing_fields:
+        logger.warning(f"No document of the collection has the metadata fields {', '.join(missing_fields)}; "
+                       f"filters on them are rejected. Reload the collection with RAG/rag_data_loader.py.")
+    return {'collection': collection, 'keyword_index': load_keyword_index(config.BM25_INDEX_PATH),
+            'filter_index': filter_index}
+
+
+def _reload_indexes() -> dict:
+    """
+    Index loader of RetrievalMethods, called when a writer (rag_data_loader.py,
+    a vector index build, a snapshot import) bumps the collection version.
+    The quantized vector index is an in-memory copy and is reopened; a
+    ChromaDB collection is live and kept.
+    """
+    collection = chroma_collection.reopen() if isinstance(chroma_collection, QuantizedVectorIndex) else chroma_collection
+    return _load_indexes(collection)
 
-@app.route('/api/research', methods=['POST'])
-def generate_research_report():
+
+def _empty_report(message: str, retrieval_method: str, document_count: int) -> dict:
+    """Report returned when there is no usable context to send to the LLM."""
+    return {
+        "report": message,
+        "metrics": [],
+        "sentiments": {"description": "N/A", "positive": 0, "neutral": 0, "negative": 0},
+        "key_themes": [],
+        "aspect_sentiments_aggregated": [],
+        "retrieval_method_used": retrieval_method,
+        "retrieved_document_count": document_count
+    }
+
+
+def _parse_report(llm_output_string: str, retrieval_method: str, document_count: int):
     """
-    Endpoint to generate a market research report using RAG.
-    Accepts query and optional retrieval_method in the request body.
+    Extracts the JSON report from the LLM output.
+    Returns (report_data, status code); on failure report_data holds the error and raw output.
     """
-    # Ensure RAG components are initialized before processing requests
+    json_match = re.search(r'\{.*\}', llm_output_string, re.DOTALL)
+    if json_match:
+        json_string = json_match.group(0)
+        try:
+            report_data = json.loads(json_string)
+            logger.info("Successfully parsed LLM output as JSON.")
+
+            # Add metadata about the retrieval method and count to the report data
+            report_data["retrieval_method_used"] = retrieval_method
+            report_data["retrieved_document_count"] = document_count
+            return report_data, 200
+
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse LLM output as JSON: {e}")
+            logger.error(f"Raw LLM output: {llm_output_string}")
+            return {"error": "Failed to parse report from AI.", "raw_output": llm_output_string}, 500 # Internal server error for parsing failure
+    else:
+         logger.error("LLM output did not contain a detectable JSON object.")
+         logger.error(f"Raw LLM output: {llm_output_string}")
+         return {"error": "AI did not return a valid report format.", "raw_output": llm_output_string}, 500 # Internal server error for format issue
+
+
+def _with_retrieval_info(report_data: dict, retrieved: dict, resolved_products=None, context_stats=None) -> dict:
+    """
+    Adds the post-retrieval stage timings of the request (rerank_ms), the
+    resolved products and the prompt context size (context) to a report.
+    """
+    if retrieved.get('rerank_ms') is not None:
+        report_data["rerank_ms"] = retrieved['rerank_ms']
+    if resolved_products:
+        report_data["resolved_products"] = resolved_products
+    if context_stats is not None:
+        report_data["context"] = context_stats
+    return report_data
+
+
+def _format_context(retrieved: dict):
+    """Returns (prompt context, context stats or None) of the retrieved documents, within CONTEXT_TOKEN_BUDGET."""
+    return build_prompt_context(retrieved, side_store, config.CONTEXT_TOKEN_BUDGET, rank_decay=config.CONTEXT_RANK_DECAY,
+                                min_text_tokens=config.CONTEXT_MIN_TEXT_TOKENS, max_aspects=config.CONTEXT_MAX_ASPECTS)
+
+
+def _retrieve_scoped(query: str, retrieval_method: str, filters, auto_scope: bool):
+    """
+    Retrieves within the products named in the query, falling back to the
+    request's own filters when that finds nothing (see product_resolver.retrieve_scoped).
+    Returns (retrieved, resolved products).
+    """
+    # Reload the indexes first if the collection changed, so the product catalog is current too
+    retriever_methods.refresh_indexes()
+    return retrieve_scoped(retriever_methods, product_resolver, query, retrieval_method, filters, auto_scope)
+
+
+def _retrieve_many_scoped(queries, retrieval_method: str, filters, auto_scope: bool):
+    """Batch version of _retrieve_scoped. Returns (retrieved per query, resolved products per query)."""
+    retriever_methods.refresh_indexes()
+    return retrieve_many_scoped(retriever_methods, product_resolver, queries, retrieval_method, filters, auto_scope)
+
+
+def _parse_filters(data: dict):
+    """
+    Normalized filters of a request (see metadata_filters.parse_filters).
+    Raises ValueError for an invalid filter or one the loaded collection has no metadata for.
+    """
+    filters = parse_filters(data.get('filters'))
+    retriever_methods.refresh_indexes()
+    check_filter_fields(filters, retriever_methods.filter_index)
+    return filters
+
+
+def _auto_scope(data: dict) -> bool:
+    auto_scope = data.get('auto_scope')
+    return config.AUTO_PRODUCT_SCOPE if auto_scope is None else bool(auto_scope)
+
+
+def _summarize_retrieved(retrieved: dict) -> dict:
+    """Deterministic sentiment / aspect aggregates of the retrieved documents."""
+    ids, _, metadatas, _ = RetrievalMethods._flatten_results(retrieved)
+    if analytics_store is not None:
+        return analytics_store.summarize_ids(ids, config.ANALYTICS_TOP_ASPECTS)
+    # No store (metadata could not be read at startup): aggregate the retrieved metadata directly
+    retrieved_analytics = MetadataAnalytics(ids, metadatas)
+    return retrieved_analytics.summarize_filters(None, config.ANALYTICS_TOP_ASPECTS)
+
+
+def _chain_input(query: str, formatted_context: str, retrieved: dict):
+    """Returns (RAG chain input, analytics summary or None) for one query."""
+    chain_input = {"context": formatted_context, "question": query}
+    if not config.DETERMINISTIC_ANALYTICS:
+        return chain_input, None
+    summary = _summarize_retrieved(retrieved)
+    chain_input["analytics"] = format_analytics_for_prompt(summary)
+    return chain_input, summary
+
+
+def _with_analytics(report_data: dict, summary) -> dict:
+    """Replaces the report's sentiment and aspect aggregates with the computed ones."""
+    if summary is not None and "error" not in report_data:
+        report_data.update(to_report_fields(summary))
+        report_data["analytics"] = summary
+    return report_data
+
+
+def _ensure_initialized():
+    """Initializes the RAG components if needed; returns an error response tuple when they are unavailable."""
     if rag_chain is None or retriever_methods is None:
         logger.error("RAG components not initialized.")
         # Attempt initialization, but likely indicates a startup issue
@@ -86,7 +253,24 @@ def generate_research_report():
         except Exception as e:
              logger.error(f"Failed to re-initialize components on request: {e}")
              return jsonify({"error": "Research service is not available (re-initialization failed)."}), 503
+    return None
+
 
+# --- API Endpoint ---
+
+@app.route('/api/research', methods=['POST'])
+def generate_research_report():
+    """
+    Endpoint to generate a market research report using RAG.
+    Accepts query, optional retrieval_method and optional filters (product_asin,
+    source_type, subreddit, rating_min, rating_max, date_from, date_to) in the request body.
+    Products named in the query are resolved and retrieval is scoped to them
+    (reported as resolved_products); send "auto_scope": false to search every product.
+    """
+    # Ensure RAG components are initialized before processing requests
+    unavailable = _ensure_initialized()
+    if unavailable:
+        return unavailable
 
     data = request.get_json()
     query = data.get('query')
@@ -99,72 +283,177 @@ def generate_research_report():
     if retrieval_method not in retriever_methods.get_supported_methods():
          return jsonify({"error": f"Invalid retrieval_method. Supported methods: {', '.join(retriever_methods.get_supported_methods())}"}), 400
 
-    logger.info(f"Received research query (Method: {retrieval_method}): {query[:100]}...")
+    try:
+        filters = _parse_filters(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.info(f"Received research query (Method: {retrieval_method}, filters: {filters}): {query[:100]}...")
 
     # --- Perform Retrieval ---
-    retrieved_docs_chroma_format = retriever_methods.retrieve(query, retrieval_method)
+    retrieved_docs_chroma_format, resolved_products = _retrieve_scoped(query, retrieval_method, filters, _auto_scope(data))
 
-    if not retrieved_docs_chroma_format.get('ids'):
+    retrieved_ids, _, _, _ = RetrievalMethods._flatten_results(retrieved_docs_chroma_format)
+    if not retrieved_ids:
         logger.warning(f"No documents retrieved for query '{query[:50]}...' with method '{retrieval_method}'.")
         # Return a specific response indicating no context found
-        report_data = {
-            "report": "No relevant information found in the database for this query.",
-            "metrics": [],
-            "sentiments": {"description": "N/A", "positive": 0, "neutral": 0, "negative": 0},
-            "key_themes": [],
-            "aspect_sentiments_aggregated": [],
-            "retrieval_method_used": retrieval_method,
-            "retrieved_document_count": 0
-        }
-        return jsonify(report_data), 200 # Return 200 with empty data
+        report_data = _empty_report("No relevant information found in the database for this query.", retrieval_method, 0)
+        return jsonify(_with_retrieval_info(report_data, retrieved_docs_chroma_format, resolved_products)), 200 # Return 200 with empty data
 
 
     # --- Format Retrieved Documents and Invoke RAG Chain ---
-    formatted_context = format_chroma_results_for_prompt(retrieved_docs_chroma_format)
+    formatted_context, context_stats = _format_context(retrieved_docs_chroma_format)
 
     if not formatted_context.strip():
          logger.warning("Formatted context is empty after retrieval.")
-         report_data = {
-            "report": "Relevant documents were found, but their content was empty after processing. Cannot generate report.",
-            "metrics": [],
-            "sentiments": {"description": "N/A", "positive": 0, "neutral": 0, "negative": 0},
-            "key_themes": [],
-            "aspect_sentiments_aggregated": [],
-            "retrieval_method_used": retrieval_method,
-            "retrieved_document_count": len(retrieved_docs_chroma_format.get('ids', []))
-         }
-         return jsonify(report_data), 200
+         report_data = _empty_report(
+            "Relevant documents were found, but their content was empty after processing. Cannot generate report.",
+            retrieval_method, len(retrieved_ids)
+         )
+         return jsonify(_with_retrieval_info(report_data, retrieved_docs_chroma_format, resolved_products)), 200
 
 
     # Invoke the RAG chain
-    llm_output_string = rag_chain.invoke({"context": formatted_context, "question": query})
+    chain_input, analytics_summary = _chain_input(query, formatted_context, retrieved_docs_chroma_format)
+    llm_output_string = rag_chain.invoke(chain_input)
     logger.info("RAG chain invocation successful.")
 
     # Attempt to parse the string output as JSON
-    report_data = {}
-    json_match = re.search(r'\{.*\}', llm_output_string, re.DOTALL)
-    if json_match:
-        json_string = json_match.group(0)
-        try:
-            report_data = json.loads(json_string)
-            logger.info("Successfully parsed LLM output as JSON.")
+    report_data, status = _parse_report(llm_output_string, retrieval_method, len(retrieved_ids))
+    report_data = _with_analytics(report_data, analytics_summary)
+    return jsonify(_with_retrieval_info(report_data, retrieved_docs_chroma_format, resolved_products, context_stats)), status
 
-            # Add metadata about the retrieval method and count to the report data
-            report_data["retrieval_method_used"] = retrieval_method
-            report_data["retrieved_document_count"] = len(retrieved_docs_chroma_format.get('ids', []))
 
-            return jsonify(report_data), 200 # Return the parsed JSON
+@app.route('/api/research/batch', methods=['POST'])
+def generate_research_reports_batch():
+    """
+    Batch version of /api/research for a list of questions.
+    Accepts queries (list of strings), retrieval_method, optional filters
+    (as in /api/research, applied to every query), optional auto_scope and
+    optional include_reports (default true) in the request body. All queries are
+    embedded and retrieved together (RetrievalMethods.retrieve_many) and the
+    reports are generated with a single rag_chain.batch call. With
+    include_reports false, only the retrieved document IDs are returned.
+    """
+    unavailable = _ensure_initialized()
+    if unavailable:
+        return unavailable
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM output as JSON: {e}")
-            logger.error(f"Raw LLM output: {llm_output_string}")
-            return jsonify({"error": "Failed to parse report from AI.", "raw_output": llm_output_string}), 500 # Internal server error for parsing failure
-    else:
-         logger.error("LLM output did not contain a detectable JSON object.")
-         logger.error(f"Raw LLM output: {llm_output_string}")
-         return jsonify({"error": "AI did not return a valid report format.", "raw_output": llm_output_string}), 500 # Internal server error for format issue
+    data = request.get_json()
+    queries = data.get('queries')
+    retrieval_method = data.get('retrieval_method')
+    include_reports = data.get('include_reports', True)
+
+    if not queries or not isinstance(queries, list) or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({"error": "Missing or invalid 'queries' parameter (expected a list of strings)"}), 400
+
+    if len(queries) > config.MAX_BATCH_QUERIES:
+        return jsonify({"error": f"Too many queries: at most {config.MAX_BATCH_QUERIES} per request."}), 400
+
+    if retrieval_method not in retriever_methods.get_supported_methods():
+         return jsonify({"error": f"Invalid retrieval_method. Supported methods: {', '.join(retriever_methods.get_supported_methods())}"}), 400
+
+    try:
+        filters = _parse_filters(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.info(f"Received batch of {len(queries)} research queries (Method: {retrieval_method}, filters: {filters}).")
+
+    # --- Perform Retrieval for all queries at once ---
+    retrieved_batch, resolved_batch = _retrieve_many_scoped(queries, retrieval_method, filters, _auto_scope(data))
+
+    results = []
+    chain_inputs = [] # (result index, chain input, analytics summary) of the queries that have context
+    for query, retrieved, resolved_products in zip(queries, retrieved_batch, resolved_batch):
+        ids, _, _, _ = RetrievalMethods._flatten_results(retrieved)
+        if not include_reports:
+            results.append(_with_retrieval_info({"query": query, "retrieval_method_used": retrieval_method,
+                                                "retrieved_document_count": len(ids), "retrieved_ids": ids}, retrieved, resolved_products))
+            continue
+        if not ids:
+            results.append(_with_retrieval_info({"query": query, **_empty_report(
+                "No relevant information found in the database for this query.", retrieval_method, 0)}, retrieved, resolved_products))
+            continue
+        formatted_context, context_stats = _format_context(retrieved)
+        if not formatted_context.strip():
+            results.append(_with_retrieval_info({"query": query, **_empty_report(
+                "Relevant documents were found, but their content was empty after processing. Cannot generate report.",
+                retrieval_method, len(ids))}, retrieved, resolved_products))
+            continue
+        results.append(_with_retrieval_info({"query": query, "retrieved_document_count": len(ids)}, retrieved, resolved_products,
+                                            context_stats))
+        chain_inputs.append((len(results) - 1, *_chain_input(query, formatted_context, retrieved)))
+
+    if chain_inputs:
+        # LangChain runs the batch concurrently
+        llm_outputs = rag_chain.batch([chain_input for _, chain_input, _ in chain_inputs])
+        logger.info(f"RAG chain batch invocation successful ({len(llm_outputs)} reports).")
+        for (index, _, analytics_summary), llm_output_string in zip(chain_inputs, llm_outputs):
+            report_data, _ = _parse_report(llm_output_string, retrieval_method, results[index]["retrieved_document_count"])
+            results[index] = {**results[index], **_with_analytics(report_data, analytics_summary)}
+
+    return jsonify({"retrieval_method": retrieval_method, "results": results}), 200
+
+
+# --- Analytics Endpoint ---
+@app.route('/api/analytics', methods=['POST'])
+def analytics():
+    """
+    Deterministic sentiment distribution, aspect mention counts and sentiment
+    per aspect, computed from the metadata without calling the LLM.
+    The scope is, in order of precedence: 'ids' (a list of document IDs),
+    the documents retrieved for 'query' (with optional retrieval_method and
+    filters), or every document matching 'filters' (the whole collection
+    without filters). Optional 'top_aspects' limits the aspect list.
+    """
+    unavailable = _ensure_initialized()
+    if unavailable:
+        return unavailable
+    retriever_methods.refresh_indexes()
+    if analytics_store is None:
+        return jsonify({"error": "Analytics are not available (the collection metadata could not be read)."}), 503
+
+    data = request.get_json() or {}
+    top_aspects = data.get('top_aspects', config.ANALYTICS_TOP_ASPECTS)
+    if isinstance(top_aspects, bool) or not isinstance(top_aspects, int) or top_aspects < 0:
+        return jsonify({"error": "'top_aspects' must be a non-negative integer."}), 400
+    try:
+        filters = _parse_filters(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if data.get('ids') is not None:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(doc_id, str) for doc_id in ids):
+            return jsonify({"error": "'ids' must be a list of document IDs."}), 400
+        return jsonify({"scope": "ids", **analytics_store.summarize_ids(ids, top_aspects)}), 200
+
+    if data.get('query'):
+        retrieval_method = data.get('retrieval_method') or 'similarity'
+        if retrieval_method not in retriever_methods.get_supported_methods():
+            return jsonify({"error": f"Invalid retrieval_method. Supported methods: {', '.join(retriever_methods.get_supported_methods())}"}), 400
+        retrieved, resolved_products = _retrieve_scoped(data['query'], retrieval_method, filters, _auto_scope(data))
+        ids, _, _, _ = RetrievalMethods._flatten_results(retrieved)
+        return jsonify({"scope": "retrieved", "retrieval_method_used": retrieval_method, "retrieved_ids": ids,
+                        "resolved_products": resolved_products, **analytics_store.summarize_ids(ids, top_aspects)}), 200
+
+    return jsonify({"scope": "filters", "filters": filters, **analytics_store.summarize_filters(filters, top_aspects)}), 200
+
+
+# --- Cache Statistics Endpoint ---
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    Returns hit/miss statistics of the retrieval caches.
+    """
+    query_embedding_cache = get_query_embedding_cache()
+    result_cache = get_result_cache()
+    return jsonify({
+        "query_embedding_cache": query_embedding_cache.stats() if query_embedding_cache else None,
+        "retrieval_result_cache": result_cache.stats() if result_cache else None
+    }), 200
 
-    
 # --- Health Check Endpoint ---
 @app.route('/', methods=['GET'])
 def health_check():
@@ -0,0 +1,243 @@
+import os
+import random
+import sqlite3
+import time
+import socket
+
+# Default lease: a worker that dies mid-task gives its task back after this delay
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+# Failed tasks wait backoff_base * 2^(attempt-1) seconds (plus jitter) before a retry
+DEFAULT_BACKOFF_BASE = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrape_tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    query TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    url TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    result_count INTEGER,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (query, platform, page)
+);
+CREATE INDEX IF NOT EXISTS idx_scrape_tasks_status ON scrape_tasks (status, available_at);
+"""
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ScrapeJobQueue:
+    """
+    Durable (query, platform, page) task queue stored in a SQLite file.
+
+    Tasks move through 'pending' -> 'leased' -> 'done' (or 'failed' once
+    max_attempts is reached). A leased task whose lease expires, e.g. because
+    its worker was killed, becomes available again, so an interrupted crawl
+    resumes where it stopped; once it has used all its attempts it is marked
+    'failed' instead, so a page that keeps crashing or hanging its worker is
+    not retried forever. Several worker processes can share the same
+    database file: leasing runs in an IMMEDIATE transaction, so a task is
+    never handed to two workers at once, and only the current lease holder
+    can complete or fail a task.
+    """
+    def __init__(self, db_path, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff_base=DEFAULT_BACKOFF_BASE):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def enqueue(self, query, platform, page=1, url=None):
+        """Add a task; already known (query, platform, page) tasks are left untouched"""
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO scrape_tasks "
+            "(query, platform, page, url, max_attempts, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (query, platform, page, url, self.max_attempts, now, now, now)
+        )
+        return cursor.rowcount > 0
+
+    def enqueue_queries(self, queries, platforms):
+        """Add the first page of every query x platform pair; returns the number of new tasks"""
+        return sum(self.enqueue(query, platform) for query in queries for platform in platforms)
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Claim the next runnable task for `worker_id`.
+
+        Returns:
+            The task as a dict, or None if nothing is runnable right now.
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that were the task's last attempt are not handed out again
+            self._conn.execute(
+                "UPDATE scrape_tasks SET status = 'failed', last_error = ?, lease_owner = NULL, "
+                "lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires_at <= ? AND attempts >= max_attempts",
+                (f"Lease of {lease_seconds}s expired on the last attempt (worker crashed or hung)", now, now)
+            )
+            row = self._conn.execute(
+                "SELECT * FROM scrape_tasks "
+                "WHERE (status = 'pending' AND available_at <= ?) "
+                "   OR (status = 'leased' AND lease_expires_at <= ?) "
+                "ORDER BY available_at, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            self._conn.execute(
+                "UPDATE scrape_tasks SET status = 'leased', lease_owner = ?, lease_expires_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row['id'])
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        task = dict(row)
+        task['attempts'] += 1
+        task['status'] = 'leased'
+        task['lease_owner'] = worker_id
+        return task
+
+    def complete(self, task, result_count=0, next_url=None, max_pages=None):
+        """
+        Mark a leased task as done. If the page had a next page (and
+        `max_pages` allows it), the follow-up page task is enqueued.
+
+        Returns:
+            False if the lease was lost (it expired and the task was leased
+            again or marked failed); nothing is recorded then.
+        """
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE scrape_tasks SET status = 'done', result_count = ?, last_error = NULL, "
+            "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (result_count, now, task['id'], task['lease_owner'])
+        )
+        if cursor.rowcount == 0:
+            return False
+        if next_url and (max_pages is None or task['page'] < max_pages):
+            self.enqueue(task['query'], task['platform'], task['page'] + 1, next_url)
+        return True
+
+    def fail(self, task, error):
+        """
+        Record a failure. The task is retried after an exponential backoff,
+        or marked 'failed' once it has used all its attempts.
+
+        Returns:
+            True if the task will be retried, False if it was marked 'failed',
+            None if the lease was lost (nothing is recorded then).
+        """
+        now = time.time()
+        lease_check = "WHERE id = ? AND status = 'leased' AND lease_owner = ?"
+        if task['attempts'] >= task['max_attempts']:
+            cursor = self._conn.execute(
+                "UPDATE scrape_tasks SET status = 'failed', last_error = ?, lease_owner = NULL, "
+                f"lease_expires_at = NULL, updated_at = ? {lease_check}",
+                (str(error), now, task['id'], task['lease_owner'])
+            )
+            return False if cursor.rowcount else None
+        delay = self.backoff_base * 2 ** (task['attempts'] - 1)
+        delay += random.uniform(0, delay / 2)
+        cursor = self._conn.execute(
+            "UPDATE scrape_tasks SET status = 'pending', last_error = ?, available_at = ?, "
+            f"lease_owner = NULL, lease_expires_at = NULL, updated_at = ? {lease_check}",
+            (str(error), now + delay, now, task['id'], task['lease_owner'])
+        )
+        return True if cursor.rowcount else None
+
+    def retry_failed(self):
+        """Give every 'failed' task a fresh set of attempts"""
+        now = time.time()
+        cursor = self._conn.execute(
+            "UPDATE scrape_tasks SET status = 'pending', attempts = 0, available_at = ?, updated_at = ? "
+            "WHERE status = 'failed'",
+            (now, now)
+        )
+        return cursor.rowcount
+
+    def progress(self):
+        """Task counts per status, plus the number of products scraped so far"""
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM scrape_tasks GROUP BY status"):
+            counts[row['status']] = row['n']
+        counts['total'] = sum(counts.values())
+        counts['products'] = self._conn.execute(
+            "SELECT COALESCE(SUM(result_count), 0) FROM scrape_tasks WHERE status = 'done'"
+        ).fetchone()[0]
+        return counts
+
+    def has_unfinished(self):
+        return self._conn.execute(
+            "SELECT 1 FROM scrape_tasks WHERE status IN ('pending', 'leased') LIMIT 1"
+        ).fetchone() is not None
+
+
+def format_progress(counts):
+    return (f"{counts['done']}/{counts['total']} done, {counts['leased']} running, "
+            f"{counts['pending']} pending, {counts['failed']} failed, {counts['products']} products")
+
+
+def run_worker(db_path, handler, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               poll_interval=5.0, backoff_base=DEFAULT_BACKOFF_BASE):
+    """
+    Lease and run tasks until the queue has nothing left to do.
+
+    Args:
+        db_path: SQLite file of the queue.
+        handler: callable(task) -> (result_count, next_url, max_pages); an
+                 exception marks the task as failed and schedules a retry.
+        worker_id: identifier stored with the lease; defaults to host-pid.
+        lease_seconds: how long a task stays reserved for this worker.
+        poll_interval: wait between polls while other tasks are backing off or leased.
+        backoff_base: base delay of the exponential retry backoff, in seconds.
+    """
+    worker_id = worker_id or default_worker_id()
+    queue = ScrapeJobQueue(db_path, backoff_base=backoff_base)
+    try:
+        while True:
+            task = queue.lease(worker_id, lease_seconds)
+            if task is None:
+                if not queue.has_unfinished():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            print(f"[{worker_id}] {task['platform']} '{task['query']}' page {task['page']} (attempt {task['attempts']})")
+            try:
+                result_count, next_url, max_pages = handler(task)
+            except Exception as e:
+                retried = queue.fail(task, e)
+                if retried is None:
+                    print(f"[{worker_id}] Failed: {e} (lease expired meanwhile; not recorded)")
+                else:
+                    print(f"[{worker_id}] Failed: {e} ({'retry scheduled' if retried else 'giving up'})")
+            else:
+                if not queue.complete(task, result_count, next_url, max_pages):
+                    print(f"[{worker_id}] Lease expired before the task finished; result not recorded")
+            print(f"[{worker_id}] Progress: {format_progress(queue.progress())}")
+    finally:
+        queue.close()
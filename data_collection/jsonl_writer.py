@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import uuid
+
+MANIFEST_FORMAT_VERSION = 1
+# Name suffixes (after the stem) of files a successful run removes unless its manifest lists them:
+# run segments '.{run_id}.{index:05d}.jsonl', segments of the older '.{index:05d}.jsonl' format, manifest temp files
+_STALE_SUFFIX = re.compile(r'\.(?:[0-9a-f]{8}\.)?\d{5}\.jsonl|\.manifest\.json\.[0-9a-f]{8}\.tmp')
+# ... and hidden in-progress '.part' files, or '.staged' segments of the older format
+_STALE_HIDDEN_SUFFIX = re.compile(r'\.[0-9a-f]{8}\.\d{5}\.jsonl\.(?:part|staged)')
+
+
+def manifest_path(path):
+    """Manifest of the segments written for `path` ('{stem}.manifest.json')"""
+    directory, filename = os.path.split(path)
+    stem = filename[:-len('.jsonl')] if filename.endswith('.jsonl') else filename
+    return os.path.join(directory or '.', f"{stem}.manifest.json")
+
+
+def committed_segments(path):
+    """Segment paths of the last successful run for `path`, in order; [] if there is none"""
+    try:
+        with open(manifest_path(path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return []
+    directory = os.path.dirname(manifest_path(path))
+    return [os.path.join(directory, name) for name in manifest['segments']]
+
+
+def _fsync_directory(directory):
+    """Make renames in `directory` durable; not supported (nor needed) on Windows"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class JsonlWriter:
+    """
+    Streams records to JSON Lines files, one JSON object per line.
+
+    Records are appended to a hidden '.part' file and flushed as soon as they
+    are written, so a crash loses at most the record being written. A full
+    segment (`max_records`) is fsynced and renamed to its run-scoped name
+    '{stem}.{run_id}.{index:05d}.jsonl'.
+
+    The segments of a run are published together when the writer is closed
+    successfully: '{stem}.manifest.json', which lists them, is replaced in
+    one atomic step, so readers (see data_processing/jsonl_loader.py) see
+    either the whole previous run or the whole new one. The previous run's
+    segments, segments of runs that failed and leftover '.part' / '.staged'
+    files of the stem are then removed, so re-scraping a query never
+    duplicates data. A run that writes nothing, or that fails, leaves the
+    previous manifest untouched; a failed run's records stay in its segments
+    (listed in the error message) until the next successful run of the stem.
+    """
+    def __init__(self, path, max_records=1000):
+        directory, filename = os.path.split(path)
+        self.directory = directory or '.'
+        self.stem = filename[:-len('.jsonl')] if filename.endswith('.jsonl') else filename
+        self.manifest_path = manifest_path(path)
+        self.max_records = max_records
+        self.segment_index = 0
+        self.records_in_segment = 0
+        self.total_records = 0
+        self.run_id = uuid.uuid4().hex[:8]
+        self.segment_paths = []
+        self.committed_paths = []
+        self._file = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segment_path(self, index):
+        return os.path.join(self.directory, f"{self.stem}.{self.run_id}.{index:05d}.jsonl")
+
+    def _part_path(self):
+        return os.path.join(self.directory, f".{self.stem}.{self.run_id}.{self.segment_index:05d}.jsonl.part")
+
+    def write(self, record):
+        """Append one record and flush it to disk immediately"""
+        if self._file is None:
+            self._file = open(self._part_path(), 'w', encoding='utf-8')
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self.records_in_segment += 1
+        self.total_records += 1
+        if self.max_records and self.records_in_segment >= self.max_records:
+            self.rotate()
+
+    def rotate(self):
+        """Finish the current segment (complete and fsynced) and start a new one"""
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        segment_path = self.segment_path(self.segment_index)
+        os.replace(self._part_path(), segment_path)
+        self.segment_paths.append(segment_path)
+        self.segment_index += 1
+        self.records_in_segment = 0
+
+    def close(self):
+        """Publish the run's segments by replacing the manifest, then remove what older runs left behind"""
+        self.rotate()
+        if not self.total_records:
+            return self.committed_paths
+        _fsync_directory(self.directory)
+        manifest = {
+            'format_version': MANIFEST_FORMAT_VERSION,
+            'run_id': self.run_id,
+            'records': self.total_records,
+            'segments': [os.path.basename(path) for path in self.segment_paths],
+        }
+        tmp_path = f"{self.manifest_path}.{self.run_id}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        _fsync_directory(self.directory)
+        self.committed_paths = self.segment_paths
+        self.segment_paths = []
+        self._remove_stale_files()
+        return self.committed_paths
+
+    def _remove_stale_files(self):
+        """Remove the stem's segments and temporary files that the manifest does not list"""
+        committed = set(self.committed_paths)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path in committed:
+                continue
+            if name.startswith(f"{self.stem}."):
+                stale = _STALE_SUFFIX.fullmatch(name[len(self.stem):])
+            elif name.startswith(f".{self.stem}."):
+                stale = _STALE_HIDDEN_SUFFIX.fullmatch(name[len(self.stem) + 1:])
+            else:
+                stale = None
+            if stale:
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep what was scraped before the failure; the previous run's manifest stays as it was
+            self.rotate()
+            if self.segment_paths:
+                print(f"Run failed; {self.total_records} records kept in {', '.join(self.segment_paths)} "
+                      f"(not published, removed by the next successful run)")
+        return False
@@ -1,11 +1,14 @@
 import requests
 from bs4 import BeautifulSoup
 import json 
-import random
 import time
 from fake_useragent import UserAgent
 from urllib.parse import urljoin, quote
 from configgeneral import configurations
+from jsonl_writer import JsonlWriter
+from job_queue import ScrapeJobQueue, run_worker, format_progress
+from rate_controller import get_rate_controller, is_retryable, metrics_report, share_rate_state
+import multiprocessing
 import re
 import argparse
 from dotenv import load_dotenv
@@ -21,15 +24,35 @@ def clean_comment(text):
     text = text.replace('"', "'")
     return text + '\n' 
 
-# Fonction pour utiliser ScraperAPI
-def fetch_with_scraperapi(url, api_key):
-    api_url = f"http://api.scraperapi.com?api_key={api_key}&url={url}"
+# Nombre maximum de tentatives par page quand la plateforme nous freine (429/503, timeout)
+MAX_FETCH_ATTEMPTS = 4
+
+def timed_get(url, controller, error_label="Erreur requête", **kwargs):
+    """
+    Requête GET mesurée: le statut, la latence et la taille de la réponse sont
+    transmis au contrôleur de débit de la plateforme.
+    Retourne (code HTTP ou None si exception, texte si statut 200 sinon None).
+    """
+    started = time.monotonic()
     try:
-        response = requests.get(api_url, timeout=30)
-        return response.text if response.status_code == 200 else None
+        response = requests.get(url, **kwargs)
     except Exception as e:
-        print(f"Erreur ScraperAPI: {str(e)}")
-        return None
+        controller.record(None, time.monotonic() - started)
+        print(f"{error_label}: {str(e)}")
+        return None, None
+    controller.record(
+        response.status_code, time.monotonic() - started, len(response.content),
+        retry_after=response.headers.get('Retry-After'))
+    return response.status_code, response.text if response.status_code == 200 else None
+
+# La passerelle ScraperAPI a ses propres limites (concurrence du compte, timeouts de 30 s, latence de
+# plusieurs secondes): elle a son propre contrôleur, pour ne pas freiner les requêtes directes aux plateformes
+SCRAPERAPI_RATE_CONFIG = {'initial_rate': 0.5, 'max_rate': 5.0}
+
+# Fonction pour utiliser ScraperAPI
+def fetch_with_scraperapi(url, api_key, controller):
+    api_url = f"http://api.scraperapi.com?api_key={api_key}&url={url}"
+    return timed_get(api_url, controller, "Erreur ScraperAPI", timeout=30)
 
 # Headers pour le fallback
 def get_random_headers():
@@ -114,10 +137,86 @@ def get_next_page_url(soup, base_url, config):
     next_page = soup.find(config['selector'], config['attrs'])
     return urljoin(base_url, next_page['href']) if next_page and 'href' in next_page.attrs else None
 
-def scrape_website(platform, query):
-    """Fonction principale pour scraper une plateforme spécifique"""
+def fetch_page_html(url, platform, error_label="Erreur requête directe"):
+    """
+    Récupère le HTML via ScraperAPI, puis en requête directe en cas d'échec.
+    Les requêtes directes sont cadencées par le contrôleur adaptatif de la
+    plateforme, celles à ScraperAPI par celui de la passerelle ('scraperapi'),
+    et une réponse 429/503 ou un timeout déclenche une nouvelle tentative.
+    """
+    controller = get_rate_controller(platform, **configurations[platform].get('RATE_CONFIG', {}))
+    gateway_controller = get_rate_controller('scraperapi', **SCRAPERAPI_RATE_CONFIG)
+    for attempt in range(1, MAX_FETCH_ATTEMPTS + 1):
+        if attempt > 1:
+            controller.record_retry()
+            print(f"Nouvelle tentative {attempt}/{MAX_FETCH_ATTEMPTS} ({controller.rate * 60:.1f} req/min): {url}")
+
+        gateway_controller.wait()
+        status, html_content = fetch_with_scraperapi(url, os.getenv('SCRAPERAPI_KEY'), gateway_controller)
+        if html_content:
+            return html_content
+
+        controller.wait()
+        direct_status, html_content = timed_get(
+            url, controller, error_label, headers=get_random_headers(), timeout=30)
+        if html_content:
+            return html_content
+
+        # Une erreur définitive (404, 403...) ne sert à rien de réessayer
+        if not (is_retryable(status) or is_retryable(direct_status)):
+            return None
+    return None
+
+# Intervalle minimal entre deux affichages des compteurs de débit, en secondes
+RATE_METRICS_INTERVAL = 300
+_last_rate_metrics_at = None
+
+def print_rate_metrics(force=False):
+    """
+    Affiche les compteurs de débit de chaque plateforme et de la passerelle
+    ScraperAPI, au plus une fois par RATE_METRICS_INTERVAL (sauf force=True, en fin de traitement)
+    """
+    global _last_rate_metrics_at
+    now = time.monotonic()
+    if not force and _last_rate_metrics_at is not None and now - _last_rate_metrics_at < RATE_METRICS_INTERVAL:
+        return
+    _last_rate_metrics_at = now
+    for metrics in metrics_report():
+        print(f"[{metrics['platform']}] {metrics['rate_per_minute']} req/min, "
+              f"{metrics['pages_per_minute']} pages/min, {metrics['bytes']} octets, "
+              f"{metrics['failures']} échecs ({metrics['throttled']} freinages), {metrics['retries']} nouvelles tentatives")
+
+def scrape_listing_page(platform, page_url):
+    """
+    Scrape une page de résultats.
+    Retourne (urls des produits, url de la page suivante), ou None si la page n'a pas pu être récupérée.
+    """
+    config = configurations[platform]
+    html_content = fetch_page_html(page_url, platform)
+    if not html_content:
+        return None
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    product_urls = extract_product_urls(soup, config['base_url'], config['URL_EXTRACTION_CONFIG'])
+    print(f"Produits trouvés: {len(product_urls)}")
+    next_url = get_next_page_url(
+        soup, config['base_url'], config['PAGINATION_CONFIG']['next_page'])
+    return product_urls[:10], next_url
+
+def scrape_product(platform, product_url):
+    """Scrape la page d'un produit; retourne ses détails ou None"""
+    config = configurations[platform]
+    print(f"Scraping: {product_url}")
+    product_html = fetch_page_html(product_url, platform, "Erreur requête produit")
+    if not product_html:
+        return None
+    product_soup = BeautifulSoup(product_html, 'html.parser')
+    return extract_product_details(
+        product_soup, product_url, config['DETAILS_EXTRACTION_CONFIG'])
+
+def iter_website_products(platform, query):
+    """Générateur qui produit chaque produit dès qu'il est extrait"""
     config = configurations[platform]
-    data = []
     start_url = config['start_url'].format(query=quote(query))
     current_url = start_url
     page_count = 1
@@ -127,67 +226,40 @@ def scrape_website(platform, query):
 
     while current_url and page_count <= config['MAX_PAGES']:
         print(f"Page {page_count} - {current_url}")
-        time.sleep(random.uniform(1, 3))
-
-        html_content = fetch_with_scraperapi(current_url,os.getenv('SCRAPERAPI_KEY'))
-        if not html_content:
-            try:
-                response = requests.get(current_url, headers=get_random_headers())
-                html_content = response.text if response.status_code == 200 else None
-            except Exception as e:
-                print(f"Erreur requête directe: {str(e)}")
-                break
-
-        if html_content:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            product_urls = extract_product_urls(soup, config['base_url'], config['URL_EXTRACTION_CONFIG'])
-            print(f"Produits trouvés: {len(product_urls)}")    
-            
-            for product_url in product_urls[:10]:  
-                print(f"Scraping: {product_url}")
-                time.sleep(random.uniform(2, 5))
-                
-                product_html = fetch_with_scraperapi(product_url,os.getenv('SCRAPERAPI_KEY'))
-                if not product_html:
-                    try:
-                        response = requests.get(product_url, headers=get_random_headers())
-                        product_html = response.text if response.status_code == 200 else None
-                    except Exception as e:
-                        print(f"Erreur requête produit: {str(e)}")
-                        continue
-                
-                if product_html:
-                    product_soup = BeautifulSoup(product_html, 'html.parser')
-                    product_data = extract_product_details(
-                        product_soup, product_url, config['DETAILS_EXTRACTION_CONFIG'])
-                    if product_data:
-                        data.append(product_data)
-            
-            current_url = get_next_page_url(
-                soup, config['base_url'], config['PAGINATION_CONFIG']['next_page'])
-            page_count += 1
-        else:
+        listing = scrape_listing_page(platform, current_url)
+        if listing is None:
             print("Aucun contenu HTML reçu")
             break
-    return data
-
-def scrape_all_websites(query):
-    """Scraper toutes les plateformes configurées"""
-    all_data = {}
-    for platform in configurations.keys():
-        platform_data = scrape_website(platform, query)
-        all_data[platform] = platform_data
-    empty = {"amazon": [],"bestbuytunisie": [],"ebay": [],"newegg": []}
-    if all_data ==empty:
+
+        product_urls, current_url = listing
+        for product_url in product_urls:
+            product_data = scrape_product(platform, product_url)
+            if product_data:
+                yield product_data
+        page_count += 1
+
+def scrape_website(platform, query):
+    """Fonction principale pour scraper une plateforme spécifique"""
+    return list(iter_website_products(platform, query))
+
+def scrape_all_websites(query, output_dir="."):
+    """
+    Scraper toutes les plateformes configurées.
+    Chaque produit est écrit dans un fichier JSONL dès son extraction
+    (une ligne par produit, avec les clés 'platform' et 'query').
+    """
+    combined_filename = os.path.join(output_dir, f"all_products_{query.replace(' ', '_')}.jsonl")
+    with JsonlWriter(combined_filename) as writer:
+        for platform in configurations.keys():
+            for product_data in iter_website_products(platform, query):
+                writer.write({"platform": platform, "query": query, **product_data})
+    print_rate_metrics()
+    if not writer.total_records:
         return None
-    # Sauvegarde combinée
-    combined_filename = f"all_products_{query.replace(' ', '_')}.json"
-    with open(combined_filename, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, indent=4, ensure_ascii=False)
-    print(f"\nToutes les données sauvegardées dans {combined_filename}")
+    print(f"\n{writer.total_records} produits sauvegardés dans {', '.join(writer.committed_paths)}")
 
-def main():
-    queries = [
+# Requêtes scrapées par défaut
+QUERIES = [
     # Ring Products
     "Ring Indoor Cam (2nd Gen)",
     "Ring Stick Up Cam Battery",
@@ -232,10 +304,90 @@ def main():
     "eufy Security Indoor Cam 2K Pan & Tilt",
     "eufy Video Doorbell E340",
 ]
-    
-    print(f"\nLancement du scraping pour: '{queries}'")
-    for q in queries:
-        scrape_all_websites(q)
+
+# Base SQLite de la file de tâches (query, platform, page)
+JOB_QUEUE_DB = "scrape_jobs.sqlite3"
+
+def scrapable_platforms():
+    """Plateformes dont au moins une page de résultats doit être scrapée"""
+    return [platform for platform, config in configurations.items() if config['MAX_PAGES'] >= 1]
+
+def process_scrape_task(task, output_dir="."):
+    """
+    Exécute une tâche (query, platform, page) de la file.
+    Les produits de la page sont écrits dans leur propre fichier JSONL, si bien
+    qu'une tâche rejouée après une interruption remplace simplement sa sortie.
+    Retourne (nombre de produits, url de la page suivante, MAX_PAGES).
+    """
+    platform, query, page = task['platform'], task['query'], task['page']
+    config = configurations[platform]
+    page_url = task['url'] or config['start_url'].format(query=quote(query))
+
+    listing = scrape_listing_page(platform, page_url)
+    if listing is None:
+        # Une exception fait repasser la tâche en attente, avec backoff
+        raise RuntimeError(f"Aucun contenu HTML reçu pour {page_url}")
+
+    product_urls, next_url = listing
+    output_filename = os.path.join(
+        output_dir, f"all_products_{query.replace(' ', '_')}_{platform}_p{page}.jsonl")
+    with JsonlWriter(output_filename) as writer:
+        for product_url in product_urls:
+            product_data = scrape_product(platform, product_url)
+            if product_data:
+                writer.write({"platform": platform, "query": query, "page": page, **product_data})
+    print_rate_metrics()
+    return writer.total_records, next_url, config['MAX_PAGES']
+
+def worker_process(db_path, output_dir):
+    """
+    Point d'entrée d'un processus worker. Le débit de chaque plateforme est
+    partagé par tous les workers via la base de la file (table rate_state):
+    ensemble, ils ne dépassent pas le débit auquel le contrôleur a convergé.
+    """
+    share_rate_state(db_path)
+    run_worker(db_path, lambda task: process_scrape_task(task, output_dir))
+    print_rate_metrics(force=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Scraping des plateformes e-commerce")
+    parser.add_argument('--db', default=JOB_QUEUE_DB, help="Base SQLite de la file de tâches")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('enqueue', help="Ajouter les requêtes x plateformes à la file")
+    work_parser = subparsers.add_parser('work', help="Lancer des workers sur la file")
+    work_parser.add_argument('--workers', type=int, default=1, help="Nombre de processus workers")
+    work_parser.add_argument('--output-dir', default=".", help="Répertoire des fichiers JSONL")
+    subparsers.add_parser('status', help="Afficher la progression de la file")
+    subparsers.add_parser('retry-failed', help="Remettre en attente les tâches en échec")
+    args = parser.parse_args()
+
+    if args.command is None:
+        # Comportement historique: boucle séquentielle sur toutes les requêtes
+        print(f"\nLancement du scraping pour: '{QUERIES}'")
+        for q in QUERIES:
+            scrape_all_websites(q)
+        print_rate_metrics(force=True)
+        return
+
+    queue = ScrapeJobQueue(args.db)
+    try:
+        if args.command == 'enqueue':
+            added = queue.enqueue_queries(QUERIES, scrapable_platforms())
+            print(f"{added} nouvelles tâches ajoutées à {args.db}")
+        elif args.command == 'retry-failed':
+            print(f"{queue.retry_failed()} tâches remises en attente")
+        elif args.command == 'work':
+            workers = [
+                multiprocessing.Process(target=worker_process, args=(args.db, args.output_dir))
+                for _ in range(args.workers)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        print(f"Progression: {format_progress(queue.progress())}")
+    finally:
+        queue.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
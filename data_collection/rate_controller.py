@@ -0,0 +1,258 @@
+import random
+import sqlite3
+import threading
+import time
+
+# HTTP statuses that mean "slow down" rather than "this page is broken"
+THROTTLE_STATUS_CODES = {429, 503}
+
+# Default AIMD settings, in requests per second. The initial rate matches the
+# old fixed sleeps (1-3 s between listing pages, 2-5 s between products).
+DEFAULT_RATE_SETTINGS = {
+    'initial_rate': 0.3,
+    'min_rate': 0.05,
+    'max_rate': 2.0,
+    'additive_increase': 0.02,     # added to the rate after each fast success
+    'multiplicative_decrease': 0.5, # rate factor applied on 429/503/timeouts
+    'slow_latency_factor': 3.0,    # a success this much slower than average is not rewarded
+    'jitter': 0.25,                # +/- fraction applied to every delay
+}
+
+
+class ScraperMetrics:
+    """Per-platform request counters"""
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.requests = 0
+        self.pages = 0
+        self.bytes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.retries = 0
+        self.total_latency = 0.0
+
+    def snapshot(self):
+        elapsed_minutes = max(time.monotonic() - self.started_at, 1e-9) / 60
+        return {
+            'requests': self.requests,
+            'pages': self.pages,
+            'pages_per_minute': round(self.pages / elapsed_minutes, 2),
+            'bytes': self.bytes,
+            'failures': self.failures,
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'success_rate': round(self.pages / self.requests, 3) if self.requests else None,
+            'avg_latency_s': round(self.total_latency / self.requests, 3) if self.requests else None,
+        }
+
+
+class LocalRateState:
+    """Rate and next request slot of each platform, for the controllers of this process"""
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def clock(self):
+        return time.monotonic()
+
+    def update(self, platform, initial_rate, update_fn):
+        """
+        Apply update_fn(rate, next_slot) -> (rate, next_slot) atomically.
+
+        Returns:
+            The new (rate, next_slot).
+        """
+        with self._lock:
+            rate, next_slot = self._values.get(platform, (initial_rate, 0.0))
+            self._values[platform] = update_fn(rate, next_slot)
+            return self._values[platform]
+
+
+RATE_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_state (
+    platform TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    next_slot REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SharedRateState(LocalRateState):
+    """
+    Same as LocalRateState, stored in a SQLite file (one row per platform) so
+    that every process using the file paces its requests from the same rate
+    and the same request slots. Slots are wall-clock times, comparable
+    across processes.
+    """
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(RATE_STATE_SCHEMA)
+
+    def clock(self):
+        return time.time()
+
+    def update(self, platform, initial_rate, update_fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT rate, next_slot FROM rate_state WHERE platform = ?", (platform,)).fetchone()
+                rate, next_slot = update_fn(*(row or (initial_rate, 0.0)))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_state (platform, rate, next_slot, updated_at) VALUES (?, ?, ?, ?)",
+                    (platform, rate, next_slot, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return rate, next_slot
+
+    def close(self):
+        self._conn.close()
+
+
+class AdaptiveRateController:
+    """
+    AIMD request pacing for one platform.
+
+    Every request first calls wait(), which spaces request starts by 1/rate
+    seconds (with jitter). record() then adjusts the rate: each fast success
+    adds `additive_increase`, each throttling signal (429/503, timeout or
+    connection error) multiplies it by `multiplicative_decrease` and honours
+    any Retry-After delay. The rate therefore converges to the highest value
+    the platform tolerates.
+
+    The rate and the next request slot live in `state`: a LocalRateState
+    paces the threads of one process, a SharedRateState (see
+    share_rate_state) the requests of every worker process together, so N
+    workers share one rate instead of each probing up to its own.
+    """
+    def __init__(self, platform, state=None, **settings):
+        self.platform = platform
+        self.settings = {**DEFAULT_RATE_SETTINGS, **settings}
+        self.state = state or LocalRateState()
+        self.rate = self.settings['initial_rate']
+        self.metrics = ScraperMetrics()
+        self._avg_latency = None
+        self._lock = threading.Lock()
+
+    def _update(self, update_fn):
+        settings = self.settings
+
+        def bounded_update(rate, next_slot):
+            # The stored rate may come from a run with other settings
+            rate = min(settings['max_rate'], max(settings['min_rate'], rate))
+            return update_fn(rate, next_slot)
+
+        self.rate, next_slot = self.state.update(self.platform, settings['initial_rate'], bounded_update)
+        return next_slot
+
+    def wait(self):
+        jitter = 1 + random.uniform(-self.settings['jitter'], self.settings['jitter'])
+        taken = {}
+
+        def take_slot(rate, next_slot):
+            taken['now'] = self.state.clock()
+            taken['slot'] = max(taken['now'], next_slot)
+            return rate, taken['slot'] + jitter / rate
+
+        self._update(take_slot)
+        delay = taken['slot'] - taken['now']
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, status_code, latency, nbytes=0, retry_after=None):
+        """
+        Record the outcome of one request.
+
+        Args:
+            status_code: HTTP status, or None if the request raised (timeout, connection error).
+            latency: request duration in seconds.
+            nbytes: size of the response body.
+            retry_after: value of the Retry-After header, if any.
+        """
+        settings = self.settings
+        with self._lock:
+            self.metrics.requests += 1
+            self.metrics.total_latency += latency
+            self.metrics.bytes += nbytes
+
+            if status_code == 200:
+                self.metrics.pages += 1
+                slow = self._avg_latency is not None and latency > settings['slow_latency_factor'] * self._avg_latency
+                self._avg_latency = latency if self._avg_latency is None else 0.8 * self._avg_latency + 0.2 * latency
+            elif status_code is None or status_code in THROTTLE_STATUS_CODES:
+                self.metrics.throttled += 1
+                self.metrics.failures += 1
+            else:
+                self.metrics.failures += 1
+
+        if status_code == 200:
+            if not slow:
+                self._update(lambda rate, next_slot: (min(settings['max_rate'], rate + settings['additive_increase']), next_slot))
+        elif status_code is None or status_code in THROTTLE_STATUS_CODES:
+            pause = _parse_retry_after(retry_after)
+
+            def decrease(rate, next_slot):
+                if pause:
+                    next_slot = max(next_slot, self.state.clock() + pause)
+                return max(settings['min_rate'], rate * settings['multiplicative_decrease']), next_slot
+
+            self._update(decrease)
+
+    def record_retry(self):
+        with self._lock:
+            self.metrics.retries += 1
+
+    def snapshot(self):
+        return {'platform': self.platform, 'rate_per_minute': round(self.rate * 60, 2), **self.metrics.snapshot()}
+
+
+def is_retryable(status_code):
+    return status_code is None or status_code in THROTTLE_STATUS_CODES
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        # HTTP-date form is rare for these sites; fall back to the AIMD delay
+        return None
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+_shared_state = None
+
+
+def share_rate_state(db_path):
+    """
+    Pace every controller of this process (those already created and those
+    created later) through the rate state stored in `db_path`, e.g. the
+    job-queue database, shared by all worker processes using the same file
+    """
+    global _shared_state
+    with _controllers_lock:
+        _shared_state = SharedRateState(db_path)
+        for controller in _controllers.values():
+            controller.state = _shared_state
+
+
+def get_rate_controller(platform, **settings):
+    """Returns the controller of a platform, creating it on first use"""
+    with _controllers_lock:
+        if platform not in _controllers:
+            _controllers[platform] = AdaptiveRateController(platform, state=_shared_state, **settings)
+        return _controllers[platform]
+
+
+def metrics_report():
+    """Snapshot of every platform controller used in this process"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return [controller.snapshot() for controller in controllers]
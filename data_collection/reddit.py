@@ -1,16 +1,62 @@
-import praw
 import pandas as pd
 from datetime import datetime
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from jsonl_writer import JsonlWriter
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
-reddit = praw.Reddit(
-    client_id=os.getenv('REDDIT_CLIENT_ID'),  
-    client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
-    user_agent=os.getenv('REDDIT_USER_AGENT'),
-)
+# Reddit allows ~100 requests per minute for an OAuth client; stay under it by default
+DEFAULT_REQUESTS_PER_MINUTE = 60
+
+def make_reddit_client():
+    """
+    Build a PRAW client from the REDDIT_* environment variables
+    """
+    import praw  # only needed for real clients; tests pass fake ones
+
+    return praw.Reddit(
+        client_id=os.getenv('REDDIT_CLIENT_ID'),  
+        client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+        user_agent=os.getenv('REDDIT_USER_AGENT'),
+    )
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_reddit_client():
+    """
+    Module-level client, built on first use
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = make_reddit_client()
+        return _default_client
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing request starts evenly so that all workers
+    together never exceed `requests_per_minute`.
+    """
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
 
 def scrape_reddit_posts(product_name, subreddit="all", limit=100):
     """
@@ -19,7 +65,7 @@ def scrape_reddit_posts(product_name, subreddit="all", limit=100):
     search_query = f"{product_name} product OR review"
     posts = []
     
-    for submission in reddit.subreddit(subreddit).search(search_query, limit=limit):
+    for submission in get_reddit_client().subreddit(subreddit).search(search_query, limit=limit):
         post_data = {
             "title": submission.title,
             "author": str(submission.author),
@@ -36,11 +82,11 @@ def scrape_reddit_posts(product_name, subreddit="all", limit=100):
     
     return posts  
 
-def scrape_post_comments(post_id, limit=100):
+def scrape_post_comments(post_id, limit=100, reddit_client=None):
     """
     Scrape comments from a specific Reddit post
     """
-    submission = reddit.submission(id=post_id)
+    submission = (reddit_client or get_reddit_client()).submission(id=post_id)
     submission.comments.replace_more(limit=0)  
     
     comments = []
@@ -57,6 +103,57 @@ def scrape_post_comments(post_id, limit=100):
     
     return comments
 
+def iter_comments_concurrently(
+    post_ids,
+    comment_limit: int = 50,
+    max_workers: int = 4,
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+    client_factory=make_reddit_client
+):
+    """
+    Fetch the comments of several posts in parallel.
+
+    PRAW clients are not thread safe, so every worker thread builds its own
+    client with `client_factory` (pass a factory returning a fake client to run
+    against local fixtures). A shared RateLimiter keeps the combined request
+    rate within the API budget.
+
+    Yields:
+        One comment list per post, in the same order as `post_ids`, as soon as
+        that post and all posts before it are done.
+
+    Raises:
+        The error of the first post (in `post_ids` order) whose comments could
+        not be fetched, like the sequential path; posts not started yet are
+        cancelled.
+    """
+    limiter = RateLimiter(requests_per_minute)
+    local = threading.local()
+
+    def fetch(post_id):
+        if not hasattr(local, 'client'):
+            local.client = client_factory()
+        limiter.wait()
+        try:
+            return scrape_post_comments(post_id, limit=comment_limit, reddit_client=local.client)
+        except Exception as e:
+            print(f"  ! {post_id}: failed to fetch comments: {e}")
+            raise
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        # executor.map yields results in submission order, whatever the completion order,
+        # and re-raises a post's error when its turn comes
+        yield from executor.map(fetch, post_ids)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def fetch_comments_concurrently(post_ids, **kwargs):
+    """
+    Same as iter_comments_concurrently, collected into a list
+    """
+    return list(iter_comments_concurrently(post_ids, **kwargs))
+
 def save_to_json(data, filename):
     """
     Save data to a JSON file
@@ -96,50 +193,76 @@ def scrape_subreddit(
     sort: str = 'hot',          # one of 'hot', 'new', 'top', 'controversial'
     post_limit: int = 100,
     comment_limit: int = 50,
-    output_filename: str = None
+    output_filename: str = None,
+    max_workers: int = 1,
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+    reddit_client=None,
+    client_factory=make_reddit_client
 ):
     """
-    Scrape posts + comments from a specific subreddit and save to JSON.
+    Scrape posts + comments from a specific subreddit and stream them to JSONL,
+    one thread (post with its comments) per line, as soon as it is complete.
 
     Args:
         subreddit_name: e.g. "Python"
         sort: which listing to use; defaults to 'hot'
         post_limit: how many posts to fetch
         comment_limit: how many comments per post
-        output_filename: where to save JSON; 
-                         defaults to '{subreddit}_{sort}_{post_limit}posts.json'
+        output_filename: where to save JSONL segments (see JsonlWriter);
+                         defaults to '{subreddit}_{sort}_{post_limit}posts.jsonl'
+        max_workers: number of threads fetching comments; 1 keeps the sequential behaviour
+        requests_per_minute: combined request budget for the concurrent comment fetch
+        reddit_client: client used for the listing; defaults to the module-level client (get_reddit_client)
+        client_factory: builds one client per comment worker thread
     """
     print(f"→ Scraping r/{subreddit_name} [{sort}] – {post_limit} posts, {comment_limit} comments each")
 
+    # default filename if none provided
+    if not output_filename:
+        output_filename = f"{subreddit_name}_{sort}_{post_limit}posts.jsonl"
+
     posts = []
     # dynamically grab the listing method: reddit.subreddit(...).hot(), .new(), .top(), etc.
-    fetcher = getattr(reddit.subreddit(subreddit_name), sort)
-    
-    for submission in fetcher(limit=post_limit):
-        post_data = {
-            "title": submission.title,
-            "author": str(submission.author),
-            "score": submission.score,
-            "id": submission.id,
-            "url": submission.url,
-            "num_comments": submission.num_comments,
-            "created_utc": datetime.utcfromtimestamp(submission.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
-            "selftext": submission.selftext,
-            "subreddit": str(submission.subreddit),
-            "comments": []  
-        }
+    fetcher = getattr((reddit_client or get_reddit_client()).subreddit(subreddit_name), sort)
 
-        # grab comments (uses your existing function)
-        post_data['comments'] = scrape_post_comments(submission.id, limit=comment_limit)
-        print(f"  • {submission.id}: fetched {len(post_data['comments'])} comments")
-        posts.append(post_data)
+    with JsonlWriter(output_filename) as writer:
+        for submission in fetcher(limit=post_limit):
+            post_data = {
+                "title": submission.title,
+                "author": str(submission.author),
+                "score": submission.score,
+                "id": submission.id,
+                "url": submission.url,
+                "num_comments": submission.num_comments,
+                "created_utc": datetime.utcfromtimestamp(submission.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
+                "selftext": submission.selftext,
+                "subreddit": str(submission.subreddit),
+                "comments": []  
+            }
 
-    # default filename if none provided
-    if not output_filename:
-        output_filename = f"{subreddit_name}_{sort}_{post_limit}posts.json"
+            if max_workers <= 1:
+                # grab comments (uses your existing function)
+                post_data['comments'] = scrape_post_comments(submission.id, limit=comment_limit, reddit_client=reddit_client)
+                print(f"  • {submission.id}: fetched {len(post_data['comments'])} comments")
+                writer.write(post_data)
+            else:
+                posts.append(post_data)
+
+        if posts:
+            print(f"  Fetching comments for {len(posts)} posts with {max_workers} workers...")
+            all_comments = iter_comments_concurrently(
+                [post['id'] for post in posts],
+                comment_limit=comment_limit,
+                max_workers=max_workers,
+                requests_per_minute=requests_per_minute,
+                client_factory=client_factory
+            )
+            for post, comments in zip(posts, all_comments):
+                post['comments'] = comments
+                print(f"  • {post['id']}: fetched {len(comments)} comments")
+                writer.write(post)
 
-    save_to_json(posts, output_filename)
-    print(f"✅ Saved {len(posts)} posts (with comments) to {output_filename}")
+    print(f"✅ Saved {writer.total_records} posts (with comments) to {', '.join(writer.committed_paths)}")
 
 
 
@@ -172,6 +295,7 @@ if __name__ == "__main__":
         subreddit_name="homesecurity",
         sort="top",
         post_limit=10,
-        comment_limit=20
+        comment_limit=20,
+        max_workers=4
     )
-    # main(product_name=query, subreddit=subreddit)
\ No newline at end of file
+    # main(product_name=query, subreddit=subreddit)
\ No newline at end of file
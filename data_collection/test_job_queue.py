@@ -0,0 +1,122 @@
+import pytest
+
+import job_queue
+from job_queue import ScrapeJobQueue, run_worker
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(job_queue.time, 'time', clock)
+    monkeypatch.setattr(job_queue.random, 'uniform', lambda low, high: 0.0)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = ScrapeJobQueue(str(tmp_path / 'jobs.sqlite3'), max_attempts=2, backoff_base=10.0)
+    yield queue
+    queue.close()
+
+
+def _status(queue, task):
+    return queue._conn.execute("SELECT status FROM scrape_tasks WHERE id = ?", (task['id'],)).fetchone()[0]
+
+
+def test_enqueue_ignores_known_tasks_and_a_task_is_leased_once(queue):
+    assert queue.enqueue_queries(['camera'], ['amazon', 'ebay']) == 2
+    assert queue.enqueue('camera', 'amazon') is False
+
+    first = queue.lease('worker-a')
+    second = queue.lease('worker-b')
+
+    assert (first['platform'], second['platform']) == ('amazon', 'ebay')
+    assert queue.lease('worker-c') is None
+    assert queue.progress()['leased'] == 2
+
+
+def test_completing_a_page_enqueues_the_next_one_up_to_max_pages(queue):
+    queue.enqueue('camera', 'amazon')
+
+    assert queue.complete(queue.lease('worker-a'), 20, next_url='https://example.com/p2', max_pages=2)
+    page_two = queue.lease('worker-a')
+    assert (page_two['page'], page_two['url']) == (2, 'https://example.com/p2')
+    assert queue.complete(page_two, 15, next_url='https://example.com/p3', max_pages=2)
+
+    assert queue.lease('worker-a') is None
+    assert queue.progress() == {'pending': 0, 'leased': 0, 'done': 2, 'failed': 0, 'total': 2, 'products': 35}
+
+
+def test_an_expired_lease_is_handed_over_and_the_old_holder_is_fenced_off(queue, clock):
+    queue.enqueue('camera', 'amazon')
+    stale = queue.lease('worker-a', lease_seconds=60)
+    clock.now += 61
+
+    current = queue.lease('worker-b', lease_seconds=60)
+
+    assert current['id'] == stale['id'] and current['attempts'] == 2
+    assert queue.complete(stale, 99) is False
+    assert queue.fail(stale, RuntimeError("late failure")) is None
+    assert queue.complete(current, 5) is True
+    assert queue.progress()['products'] == 5
+
+
+def test_a_failed_task_backs_off_then_gives_up(queue, clock):
+    queue.enqueue('camera', 'amazon')
+
+    task = queue.lease('worker-a')
+    assert queue.fail(task, RuntimeError("HTTP 503")) is True
+    assert queue.lease('worker-a') is None # backing off for backoff_base seconds
+    clock.now += 10
+    task = queue.lease('worker-a')
+    assert task['attempts'] == 2
+    assert queue.fail(task, RuntimeError("HTTP 503")) is False
+
+    assert _status(queue, task) == 'failed'
+    assert queue.has_unfinished() is False
+    assert queue.retry_failed() == 1
+    assert queue.lease('worker-a')['attempts'] == 1
+
+
+def test_an_expired_lease_on_the_last_attempt_marks_the_task_failed(queue, clock):
+    queue.enqueue('camera', 'amazon')
+    queue.lease('worker-a', lease_seconds=60)
+    clock.now += 61
+    task = queue.lease('worker-b', lease_seconds=60)
+    clock.now += 61
+
+    # The page crashed or hung its worker on every attempt: it is not handed out a third time
+    assert queue.lease('worker-c') is None
+    assert _status(queue, task) == 'failed'
+
+
+def test_run_worker_follows_pages_and_retries_failures(tmp_path, clock, monkeypatch):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    queue = ScrapeJobQueue(db_path)
+    queue.enqueue('camera', 'amazon')
+    queue.close()
+    calls = []
+
+    def handler(task):
+        calls.append((task['page'], task['attempts']))
+        if task['page'] == 2 and task['attempts'] == 1:
+            raise RuntimeError("HTTP 503")
+        return 10, f"https://example.com/p{task['page'] + 1}", 2
+
+    def sleep(seconds):
+        clock.now += seconds
+    monkeypatch.setattr(job_queue.time, 'sleep', sleep)
+    run_worker(db_path, handler, worker_id='worker-a', backoff_base=1.0, poll_interval=1.0)
+
+    assert calls == [(1, 1), (2, 1), (2, 2)]
+    queue = ScrapeJobQueue(db_path)
+    assert queue.progress()['done'] == 2
+    queue.close()
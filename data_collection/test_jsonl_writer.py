@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+import jsonl_writer
+from jsonl_writer import JsonlWriter, committed_segments
+
+
+def _write_run(path, records, max_records=2):
+    with JsonlWriter(path, max_records=max_records) as writer:
+        for record in records:
+            writer.write(record)
+    return writer
+
+
+def _read(path):
+    records = []
+    for segment in committed_segments(path):
+        with open(segment, encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_a_run_publishes_its_segments_through_the_manifest(tmp_path):
+    path = str(tmp_path / 'products.jsonl')
+
+    writer = _write_run(path, [{'n': n} for n in range(5)])
+
+    assert committed_segments(path) == writer.committed_paths
+    assert [os.path.basename(segment) for segment in writer.committed_paths] == [
+        f'products.{writer.run_id}.{index:05d}.jsonl' for index in range(3)]
+    assert _read(path) == [{'n': n} for n in range(5)]
+    assert sorted(os.listdir(tmp_path)) == sorted(['products.manifest.json'] + [
+        os.path.basename(segment) for segment in writer.committed_paths])
+
+
+def test_a_new_run_replaces_the_previous_one(tmp_path):
+    path = str(tmp_path / 'products.jsonl')
+    first = _write_run(path, [{'n': n} for n in range(5)])
+
+    second = _write_run(path, [{'n': 'new'}])
+
+    assert _read(path) == [{'n': 'new'}]
+    assert not any(os.path.exists(segment) for segment in first.committed_paths)
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_an_empty_or_failed_run_keeps_the_previous_one(tmp_path, capsys):
+    path = str(tmp_path / 'products.jsonl')
+    _write_run(path, [{'n': n} for n in range(3)])
+
+    _write_run(path, [])
+    with pytest.raises(RuntimeError):
+        with JsonlWriter(path, max_records=2) as writer:
+            writer.write({'n': 'partial'})
+            raise RuntimeError("scraper failed")
+
+    assert _read(path) == [{'n': n} for n in range(3)]
+    # The failed run's records are kept, unpublished, until the next successful run
+    assert os.path.exists(writer.segment_paths[0])
+    assert writer.segment_paths[0] in capsys.readouterr().out
+    _write_run(path, [{'n': 'next'}])
+    assert not os.path.exists(writer.segment_paths[0])
+
+
+def test_a_crash_before_the_manifest_swap_publishes_nothing(tmp_path, monkeypatch):
+    path = str(tmp_path / 'products.jsonl')
+    _write_run(path, [{'n': n} for n in range(3)])
+    real_replace = os.replace
+
+    def crash_on_manifest(src, dst):
+        if dst.endswith('.manifest.json'):
+            raise OSError("simulated crash")
+        real_replace(src, dst)
+    monkeypatch.setattr(jsonl_writer.os, 'replace', crash_on_manifest)
+    with pytest.raises(OSError):
+        _write_run(path, [{'n': n} for n in range(10, 15)])
+    monkeypatch.undo()
+
+    # Readers still see the whole previous run, none of the new segments
+    assert _read(path) == [{'n': n} for n in range(3)]
+    writer = _write_run(path, [{'n': 'next'}])
+    assert sorted(os.listdir(tmp_path)) == sorted(['products.manifest.json', os.path.basename(writer.committed_paths[0])])
+
+
+def test_leftovers_of_the_older_format_are_removed_but_not_other_stems(tmp_path):
+    path = str(tmp_path / 'products.jsonl')
+    leftovers = ['products.00000.jsonl', '.products.0123abcd.00000.jsonl.staged', '.products.0123abcd.00001.jsonl.part']
+    others = ['products.v2.00000.jsonl', '.products.v2.0123abcd.00000.jsonl.part', 'products_extra.00000.jsonl']
+    for name in leftovers + others:
+        (tmp_path / name).write_text('{"n": "old"}\n', encoding='utf-8')
+
+    writer = _write_run(path, [{'n': 1}])
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        others + ['products.manifest.json', os.path.basename(writer.committed_paths[0])])
@@ -0,0 +1,86 @@
+import pytest
+
+import rate_controller
+from rate_controller import AdaptiveRateController, SharedRateState
+
+SETTINGS = {'initial_rate': 1.0, 'min_rate': 0.1, 'max_rate': 2.0, 'additive_increase': 0.1,
+            'multiplicative_decrease': 0.5, 'jitter': 0.0}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(rate_controller.time, 'sleep', delays.append)
+    return delays
+
+
+def test_success_increases_and_throttling_halves_the_rate():
+    controller = AdaptiveRateController('amazon', **SETTINGS)
+
+    controller.record(200, 0.5)
+    assert controller.rate == pytest.approx(1.1)
+    controller.record(429, 0.5)
+    assert controller.rate == pytest.approx(0.55)
+    controller.record(404, 0.5)
+    assert controller.rate == pytest.approx(0.55)
+    assert controller.snapshot()['throttled'] == 1 and controller.snapshot()['failures'] == 2
+
+
+def test_slow_success_is_not_rewarded():
+    controller = AdaptiveRateController('amazon', slow_latency_factor=3.0, **SETTINGS)
+    controller.record(200, 0.5)
+    controller.record(200, 5.0)
+    assert controller.rate == pytest.approx(1.1)
+
+
+def test_requests_are_spaced_by_the_rate(sleeps):
+    controller = AdaptiveRateController('amazon', **SETTINGS)
+    controller.wait()
+    controller.wait()
+    assert sleeps == [pytest.approx(1.0, abs=0.05)]
+
+
+def test_retry_after_delays_the_next_request(sleeps):
+    controller = AdaptiveRateController('amazon', **SETTINGS)
+    controller.record(503, 0.5, retry_after='10')
+    controller.wait()
+    assert sleeps == [pytest.approx(10.0, abs=0.05)]
+
+
+def test_workers_sharing_the_state_share_one_rate_and_one_schedule(tmp_path, sleeps):
+    # One SharedRateState per process, on the same database file
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    first = AdaptiveRateController('amazon', state=SharedRateState(db_path), **SETTINGS)
+    second = AdaptiveRateController('amazon', state=SharedRateState(db_path), **SETTINGS)
+
+    first.record(200, 0.5)
+    second.record(200, 0.5)
+    assert second.rate == pytest.approx(1.2)
+    first.record(429, 0.5)
+    assert first.rate == pytest.approx(0.6)
+
+    first.wait()
+    second.wait()
+    # The second worker waits for the slot after the first one's request, at the shared rate
+    assert sleeps == [pytest.approx(1 / 0.6, abs=0.05)]
+
+
+def test_stored_rate_is_kept_within_the_settings(tmp_path, sleeps):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    AdaptiveRateController('amazon', state=SharedRateState(db_path),
+                           **{**SETTINGS, 'initial_rate': 5.0, 'max_rate': 10.0}).record(200, 0.5)
+
+    controller = AdaptiveRateController('amazon', state=SharedRateState(db_path), **SETTINGS)
+    controller.wait()
+    assert controller.rate == SETTINGS['max_rate']
+
+
+def test_share_rate_state_switches_existing_controllers(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_controller, '_controllers', {})
+    monkeypatch.setattr(rate_controller, '_shared_state', None)
+    before = rate_controller.get_rate_controller('amazon', **SETTINGS)
+
+    rate_controller.share_rate_state(str(tmp_path / 'jobs.sqlite3'))
+
+    after = rate_controller.get_rate_controller('ebay', **SETTINGS)
+    assert isinstance(before.state, SharedRateState) and after.state is before.state
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+
+import pytest
+
+import reddit
+from jsonl_writer import committed_segments
+from reddit import RateLimiter, fetch_comments_concurrently, iter_comments_concurrently, scrape_subreddit
+
+
+class FakeComment:
+    def __init__(self, post_id, index):
+        self.id = f"{post_id}_c{index}"
+        self.author = "someone"
+        self.score = index
+        self.created_utc = 1700000000 + index
+        self.body = f"comment {index} on {post_id}"
+        self.parent_id = f"t3_{post_id}"
+
+
+class FakeComments:
+    def __init__(self, comments):
+        self._comments = comments
+
+    def replace_more(self, limit=0):
+        pass
+
+    def list(self):
+        return list(self._comments)
+
+
+class FakeSubmission:
+    def __init__(self, post_id, comment_count=3):
+        self.id = post_id
+        self.title = f"Post {post_id}"
+        self.author = "poster"
+        self.score = 10
+        self.url = f"https://reddit.example/{post_id}"
+        self.num_comments = comment_count
+        self.created_utc = 1700000000
+        self.selftext = "text"
+        self.subreddit = "homesecurity"
+        self.comments = FakeComments([FakeComment(post_id, i) for i in range(comment_count)])
+
+
+class FakeSubreddit:
+    def __init__(self, post_ids):
+        self.post_ids = post_ids
+
+    def top(self, limit=None):
+        return [FakeSubmission(post_id) for post_id in self.post_ids[:limit]]
+
+
+class FakeReddit:
+    """Local stand-in for praw.Reddit; `failing` post IDs raise like a PRAW auth or rate error"""
+    def __init__(self, post_ids=(), failing=(), delay=0.0):
+        self.post_ids = list(post_ids)
+        self.failing = set(failing)
+        self.delay = delay
+        self.fetched = []
+
+    def subreddit(self, name):
+        return FakeSubreddit(self.post_ids)
+
+    def submission(self, id):
+        if self.delay:
+            # Later posts finish first, so results complete out of order
+            time.sleep(self.delay * (len(self.post_ids) - self.post_ids.index(id)))
+        self.fetched.append(id)
+        if id in self.failing:
+            raise RuntimeError(f"received 401 HTTP response for {id}")
+        return FakeSubmission(id)
+
+
+def _read_output(output_filename):
+    records = []
+    for path in committed_segments(output_filename):
+        with open(path, encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_rate_limiter_spaces_request_starts(monkeypatch):
+    delays = []
+    monkeypatch.setattr(reddit.time, 'sleep', delays.append)
+    limiter = RateLimiter(requests_per_minute=600)
+
+    for _ in range(3):
+        limiter.wait()
+
+    assert delays == [pytest.approx(0.1, abs=0.02), pytest.approx(0.2, abs=0.02)]
+
+
+def test_rate_limiter_budget_is_shared_by_threads():
+    limiter = RateLimiter(requests_per_minute=1200)
+    starts, lock = [], threading.Lock()
+
+    def worker():
+        for _ in range(2):
+            limiter.wait()
+            with lock:
+                starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    starts.sort()
+    assert len(starts) == 8
+    assert starts[-1] - starts[0] >= 7 * 0.05 - 0.01
+
+
+def test_concurrent_fetch_keeps_post_order_with_one_client_per_thread():
+    post_ids = [f"p{i}" for i in range(6)]
+    clients = []
+
+    def client_factory():
+        clients.append(FakeReddit(post_ids, delay=0.005))
+        return clients[-1]
+
+    results = fetch_comments_concurrently(post_ids, comment_limit=2, max_workers=3, requests_per_minute=0,
+                                          client_factory=client_factory)
+
+    assert [[comment['comment_id'] for comment in comments] for comments in results] == \
+        [[f"{post_id}_c0", f"{post_id}_c1"] for post_id in post_ids]
+    assert 1 <= len(clients) <= 3
+    assert sorted(post_id for client in clients for post_id in client.fetched) == post_ids
+
+
+def test_concurrent_fetch_raises_a_post_failure_instead_of_returning_no_comments():
+    post_ids = [f"p{i}" for i in range(4)]
+    comments = iter_comments_concurrently(post_ids, max_workers=2, requests_per_minute=0,
+                                          client_factory=lambda: FakeReddit(post_ids, failing={'p1'}))
+
+    assert len(next(comments)) == 3
+    with pytest.raises(RuntimeError, match="401"):
+        next(comments)
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_sequential_and_concurrent_paths_write_the_same_threads(tmp_path, max_workers):
+    post_ids = ['a1', 'b2', 'c3', 'd4']
+    listing_client = FakeReddit(post_ids)
+
+    scrape_subreddit('homesecurity', sort='top', post_limit=4, comment_limit=2,
+                     output_filename=str(tmp_path / 'homesecurity.jsonl'), max_workers=max_workers,
+                     requests_per_minute=0, reddit_client=listing_client, client_factory=lambda: FakeReddit(post_ids))
+
+    records = _read_output(str(tmp_path / 'homesecurity.jsonl'))
+    assert [record['id'] for record in records] == post_ids
+    assert all(len(record['comments']) == 2 for record in records)
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_sequential_and_concurrent_paths_both_fail_on_a_post_error(tmp_path, max_workers):
+    post_ids = ['a1', 'b2', 'c3']
+
+    def client_factory():
+        return FakeReddit(post_ids, failing={'b2'})
+
+    with pytest.raises(RuntimeError, match="401"):
+        scrape_subreddit('homesecurity', sort='top', post_limit=3, comment_limit=2,
+                         output_filename=str(tmp_path / 'homesecurity.jsonl'), max_workers=max_workers,
+                         requests_per_minute=0, reddit_client=client_factory(), client_factory=client_factory)
+
+    # The run failed: no thread is published with silently missing comments
+    assert _read_output(str(tmp_path / 'homesecurity.jsonl')) == []
@@ -1,5 +1,5 @@
 import re
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterable
 from datetime import datetime, timezone
 import pandas as pd
 import logging
@@ -13,6 +13,7 @@ from sentiment_analyzer import SentimentAnalyzer # For document-level sentiment
 from entity_extractor import EntityExtractor
 
 from aspect_sentiment_analyzer import AspectSentimentAnalyzer
+from side_store import split_side_fields
 # Import libraries for corpus-level features (TF-IDF/LDA)
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
@@ -62,6 +63,19 @@ def safe_utc_isoformat(timestamp_str_or_float: Optional[Any]) -> Optional[str]:
     return None
 
 
+def iso_to_epoch(iso_str: Optional[str]) -> Optional[int]:
+    """Converts an ISO 8601 string (as written by safe_utc_isoformat) to Unix seconds, so dates can be range-filtered."""
+    if not iso_str: return None
+    try:
+        dt = datetime.fromisoformat(str(iso_str).replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+    except ValueError:
+        logger.debug(f"Could not convert '{iso_str}' to a Unix timestamp.")
+        return None
+
+
 def parse_price(price_str: Optional[str]) -> Optional[float]:
     """Safely parses a price string into a float."""
     if not price_str or not isinstance(price_str, str): return None
@@ -235,18 +249,20 @@ class DataProcessor:
     # They should call self.analyze_text_item for each review/post/comment
     # They now accept the absa_method parameter and pass it down
 
-    def process_amazon_json(self, data: List[Dict[str, Any]], absa_method: str = 'rule_based') -> List[Dict[str, Any]]:
+    def process_amazon_json(self, data: Iterable[Dict[str, Any]], absa_method: str = 'rule_based') -> List[Dict[str, Any]]:
         """
         Processes Amazon product data including reviews.
+        Accepts a list or any iterable of product items, such as a JSONL stream.
         Calls analyze_text_item for each review.
         Accepts and passes down the absa_method.
         """
         processed_reviews = []
-        if not isinstance(data, list):
-             logger.error("Invalid input data format for process_amazon_json: Expected a list.")
+        if isinstance(data, (dict, str)) or not isinstance(data, Iterable):
+             logger.error("Invalid input data format for process_amazon_json: Expected a list or an iterable of items.")
              return []
 
-        logger.info(f"Starting processing of {len(data)} Amazon product items.")
+        # data may be a lazy stream (e.g. JSONL records), so its length is not always known
+        logger.info(f"Starting processing of {len(data) if isinstance(data, list) else 'streamed'} Amazon product items.")
         for i, item in enumerate(data):
             if not isinstance(item, dict):
                 logger.warning(f"Skipping Amazon item {i} due to invalid format (not a dictionary).")
@@ -308,6 +324,7 @@ class DataProcessor:
                     'review_comment_orig': review_comment,
                     'review_rating': review_rating_from_title,
                     'review_created_iso': review_iso_date,
+                    'created_epoch': iso_to_epoch(review_iso_date), # Numeric date shared by all sources (range filters)
                     'product_rating_overall': product_meta.get('product_rating_overall'),
                     'product_review_count': product_meta.get('product_review_count'),
                  }
@@ -328,18 +345,18 @@ class DataProcessor:
         return processed_reviews
 
 
-    def process_reddit_thread_list(self, thread_list: List[Dict[str, Any]], absa_method: str = 'rule_based') -> List[Dict[str, Any]]:
+    def process_reddit_thread_list(self, thread_list: Iterable[Dict[str, Any]], absa_method: str = 'rule_based') -> List[Dict[str, Any]]:
         """
-        Processes a list of Reddit threads (post + comments).
+        Processes a list (or any iterable, such as a JSONL stream) of Reddit threads (post + comments).
         Calls analyze_text_item for each post and comment.
         Accepts and passes down the absa_method.
         """
         processed_reddit_items = []
-        if not isinstance(thread_list, list):
-             logger.error("Invalid input data format for process_reddit_thread_list: Expected a list.")
+        if isinstance(thread_list, (dict, str)) or not isinstance(thread_list, Iterable):
+             logger.error("Invalid input data format for process_reddit_thread_list: Expected a list or an iterable of threads.")
              return []
 
-        logger.info(f"Starting processing of {len(thread_list)} Reddit threads.")
+        logger.info(f"Starting processing of {len(thread_list) if isinstance(thread_list, list) else 'streamed'} Reddit threads.")
 
         for i, thread_data in enumerate(thread_list):
             if not isinstance(thread_data, dict):
@@ -377,6 +394,7 @@ class DataProcessor:
                      'num_comments': post_num_comments,
                      'subreddit': post_subreddit,
                      'created_iso': post_created_iso,
+                     'created_epoch': iso_to_epoch(post_created_iso),
                  }
                 post_doc_meta = {k: v for k, v in post_doc_meta.items() if v is not None}
 
@@ -430,6 +448,7 @@ class DataProcessor:
                     'parent_id': comment_parent_id,
                     'permalink': f"https://www.reddit.com/comments/{post_id}/_/{comment_id}/" if post_id and comment_id else None,
                     'created_iso': comment_created_iso,
+                    'created_epoch': iso_to_epoch(comment_created_iso),
                  }
                 comment_doc_meta = {k: v for k, v in comment_doc_meta.items() if v is not None}
 
@@ -600,6 +619,9 @@ class DataProcessor:
     ) -> Dict[str, List[Any]]:
         """
         Formats a list of processed analysis results into ChromaDB format.
+        Large raw texts and product attributes are kept out of the metadata and
+        returned separately for the side store (see side_store.py); the
+        metadata only keeps a 'product_id' reference.
 
         Args:
             processed_items: A flat list where each item is the dictionary
@@ -607,11 +629,14 @@ class DataProcessor:
                              with corpus features.
 
         Returns:
-            A dictionary {'ids': [], 'documents': [], 'metadatas': []} ready for ChromaDB.
+            A dictionary {'ids': [], 'documents': [], 'metadatas': []} ready for ChromaDB,
+            plus 'side_texts' (rows keyed by doc_id) and 'products' (rows keyed by product_id).
         """
         chroma_ids = []
         chroma_documents = []
         chroma_metadatas = []
+        side_texts = []
+        products = {}
         logger.info(f"Preparing {len(processed_items)} processed items for ChromaDB format.")
 
         for i, analysis_result in enumerate(processed_items):
@@ -657,10 +682,15 @@ class DataProcessor:
                 'lda_dominant_topic_words': analysis_result.get('lda_dominant_topic_words', []), # Top words of dominant topic (list of strings)
 
                 # Original metadata passed during analysis (flattened into the metadata dict)
+                # Raw texts and product attributes are split off into the side store
                 **doc_meta, # Includes original IDs, dates, authors, scores, URLs etc.
-                 # Add original text for context if needed, but be mindful of size limits in metadata
-                'original_text': analysis_result.get('original_text', ''), # Keep original text for display/context
+                'original_text': analysis_result.get('original_text', ''),
             }
+            chroma_meta, text_row, product_row = split_side_fields(str(chroma_id), chroma_meta)
+            if text_row:
+                side_texts.append(text_row)
+            if product_row:
+                products[product_row['product_id']] = product_row
 
             # Clean None values and convert lists/dicts to JSON strings for ChromaDB
             final_chroma_meta = {}
@@ -689,8 +719,9 @@ class DataProcessor:
             chroma_metadatas.append(final_chroma_meta)
 
 
-        logger.info(f"Formatted {len(chroma_ids)} documents for ChromaDB.")
-        return {'ids': chroma_ids, 'documents': chroma_documents, 'metadatas': chroma_metadatas}
+        logger.info(f"Formatted {len(chroma_ids)} documents for ChromaDB ({len(products)} distinct products).")
+        return {'ids': chroma_ids, 'documents': chroma_documents, 'metadatas': chroma_metadatas,
+                'side_texts': side_texts, 'products': list(products.values())}
 
     # Keep save_processed_data_to_csv method, it's useful for inspection
     def save_processed_data_to_csv(self, processed_items: List[Dict[str, Any]], filename: str = "processed_analysis_results.csv"):
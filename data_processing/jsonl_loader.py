@@ -0,0 +1,88 @@
+import fnmatch
+import glob
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+# '{stem}.{run_id}.{index:05d}.jsonl' (a scraper run's segment) or '{stem}.{index:05d}.jsonl' (older writer format)
+_SEGMENT_NAME = re.compile(r"(?P<stem>.+?)\.(?P<run_id>[0-9a-f]{8}\.)?\d{5}\.jsonl")
+
+
+def find_jsonl_segments(directory: str, pattern: str = "*.jsonl") -> List[str]:
+    """
+    Lists the committed JSONL segments written by the scrapers (see
+    data_collection/jsonl_writer.py): the segments listed in each
+    '{stem}.manifest.json', which a run replaces in one step when it succeeds.
+    Segments of unfinished or failed runs are not in a manifest and are
+    skipped, as are in-progress '.part' files (hidden, different suffix).
+    JSONL files of stems without a manifest (written before manifests
+    existed, or by hand) are read as they are.
+
+    Returns:
+        Sorted list of file paths, so segments of one stem are read in order.
+    """
+    paths = []
+    manifest_stems = set()
+    for manifest_file in glob.glob(os.path.join(glob.escape(directory), "*.manifest.json")):
+        manifest_stems.add(os.path.basename(manifest_file)[:-len(".manifest.json")])
+        try:
+            with open(manifest_file, "r", encoding="utf-8") as f:
+                segment_names = json.load(f)["segments"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not read the JSONL manifest {manifest_file}: {e}. Skipping its segments.")
+            continue
+        paths.extend(os.path.join(directory, name) for name in segment_names if fnmatch.fnmatch(name, pattern))
+
+    for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+        name = os.path.basename(path)
+        match = _SEGMENT_NAME.fullmatch(name)
+        if match and match.group("run_id"):
+            continue # Listed in a manifest above, or left by a run that did not finish
+        stem = match.group("stem") if match else name[:-len(".jsonl")] if name.endswith(".jsonl") else name
+        if stem not in manifest_stems:
+            paths.append(path)
+    return sorted(paths)
+
+
+def iter_jsonl_records(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Streams records from JSONL files one line at a time, without loading
+    whole files into memory. Blank and malformed lines are skipped.
+    """
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed JSONL line {line_number} in {path}: {e}")
+                        continue
+                    if isinstance(record, dict):
+                        yield record
+                    else:
+                        logger.warning(f"Skipping non-object JSONL line {line_number} in {path}.")
+        except FileNotFoundError:
+            logger.error(f"JSONL file not found: {path}. Skipping.")
+
+
+def iter_platform_products(paths: Iterable[str], platform: str = "amazon") -> Iterator[Dict[str, Any]]:
+    """Yields the product records of one platform from scraper JSONL streams."""
+    for record in iter_jsonl_records(paths):
+        if record.get("platform") == platform:
+            yield record
+
+
+def iter_reddit_threads(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Yields Reddit threads (post + comments) from scraper JSONL streams."""
+    for record in iter_jsonl_records(paths):
+        if "platform" not in record and "subreddit" in record and "comments" in record:
+            yield record
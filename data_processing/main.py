@@ -1,6 +1,9 @@
 import logging
 import nltk
 from data_processor import DataProcessor 
+from jsonl_loader import find_jsonl_segments, iter_platform_products, iter_reddit_threads
+from side_store import write_side_store
+import itertools
 import json
 import os
 import pandas as pd
@@ -31,6 +34,9 @@ AMAZON_JSON_FILENAMES = [
     "all_products_Ring_Pan-Tilt_Indoor_Cam.json",
 ]
 REDDIT_JSON_FILENAME = "homesecurity_top_10posts.json"
+# JSONL segments streamed by the scrapers (all_products_*.jsonl, *posts.jsonl) are
+# picked up from this directory and consumed record by record
+JSONL_DIRECTORY = JSON_DIRECTORY
 
 # Define global product keywords relevant to your domain
 # These help the EntityExtractor identify mentions even without specific product context
@@ -44,6 +50,8 @@ GLOBAL_PRODUCT_KEYWORDS = [
 OUTPUT_DIR = "processed_output"
 PROCESSED_CSV_FILENAME = os.path.join(OUTPUT_DIR, "analysis_results_combined.csv")
 CHROMA_PREPARED_CSV_FILENAME = os.path.join(OUTPUT_DIR, "chroma_prepared_final.csv")
+# Raw texts and product attributes, looked up by the backend only for the documents it formats
+SIDE_STORE_FILENAME = os.path.join(OUTPUT_DIR, "side_store.sqlite3")
 
 # --- Main Execution Logic ---
 if __name__ == "__main__":
@@ -111,18 +119,26 @@ if __name__ == "__main__":
         reddit_thread_list = []
 
 
+    # 2b. Discover streamed JSONL segments; they are read lazily during processing
+    jsonl_paths = find_jsonl_segments(JSONL_DIRECTORY)
+    logger.info(f"Found {len(jsonl_paths)} JSONL segments in '{JSONL_DIRECTORY}'.")
+
     # 3. Instantiate the DataProcessor
     # Pass global keywords that are generally relevant to the domain (home security, smart home)
     processor = DataProcessor(global_product_keywords=GLOBAL_PRODUCT_KEYWORDS)
 
     # 4. Process Amazon Data -> Returns list of analysis results per review
     # The processor handles linking product meta and passing product title as contextual keyword internally now
-    processed_amazon_reviews = processor.process_amazon_json(all_amazon_product_data)
+    processed_amazon_reviews = processor.process_amazon_json(
+        itertools.chain(all_amazon_product_data, iter_platform_products(jsonl_paths, "amazon"))
+    )
     logger.info(f"Analysis complete for {len(processed_amazon_reviews)} Amazon reviews.")
 
 
     # 5. Process Reddit Data -> Returns list of analysis results per post/comment
-    processed_reddit_items = processor.process_reddit_thread_list(reddit_thread_list)
+    processed_reddit_items = processor.process_reddit_thread_list(
+        itertools.chain(reddit_thread_list, iter_reddit_threads(jsonl_paths))
+    )
     logger.info(f"Analysis complete for {len(processed_reddit_items)} Reddit posts and comments.")
 
     # 6. Combine processed items from all sources
@@ -173,6 +189,8 @@ if __name__ == "__main__":
 
             df_chroma.to_csv(CHROMA_PREPARED_CSV_FILENAME, index=False, quoting=1)
             logger.info(f"Saved ChromaDB formatted data to {CHROMA_PREPARED_CSV_FILENAME}")
+
+            write_side_store(SIDE_STORE_FILENAME, chroma_ready_data['side_texts'], chroma_ready_data['products'])
         except Exception as e:
             logger.error(f"Failed to save ChromaDB formatted data to CSV {CHROMA_PREPARED_CSV_FILENAME}: {e}")
             logger.warning("Saving raw processed items to CSV as a fallback.")
@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Large raw-text fields kept out of the vector-store metadata, keyed by doc_id
+SIDE_TEXT_FIELDS = ['original_text', 'review_title_orig', 'review_comment_orig', 'title_orig', 'post_title_orig']
+# Product attributes stored once per product instead of on every review
+PRODUCT_FIELDS = ['product_asin', 'product_title', 'product_url', 'product_rating_overall', 'product_review_count']
+# Metadata key that links a document to its row in the products table
+PRODUCT_ID_KEY = 'product_id'
+
+SCHEMA = f"""
+CREATE TABLE doc_texts (
+    doc_id TEXT PRIMARY KEY,
+    {', '.join(f'{field} TEXT' for field in SIDE_TEXT_FIELDS)}
+);
+CREATE TABLE products (
+    product_id TEXT PRIMARY KEY,
+    product_asin TEXT,
+    product_title TEXT,
+    product_url TEXT,
+    product_rating_overall REAL,
+    product_review_count INTEGER
+);
+"""
+
+
+def product_key(product_fields: Dict[str, Any]) -> Optional[str]:
+    """Stable product identifier: the ASIN when known, otherwise a hash of the URL or title."""
+    if product_fields.get('product_asin'):
+        return str(product_fields['product_asin'])
+    for field in ('product_url', 'product_title'):
+        if product_fields.get(field):
+            return f"{field.split('_')[1]}_{hashlib.sha1(str(product_fields[field]).encode('utf-8')).hexdigest()[:16]}"
+    return None
+
+
+def split_side_fields(doc_id: str, meta: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Splits one document's metadata into the slim vector-store metadata, its
+    side-text row and its product row.
+
+    Returns:
+        (slim_meta, text_row or None, product_row or None). slim_meta carries
+        'product_id' instead of the product attributes.
+    """
+    slim_meta = {k: v for k, v in meta.items() if k not in SIDE_TEXT_FIELDS and k not in PRODUCT_FIELDS}
+
+    texts = {field: meta[field] for field in SIDE_TEXT_FIELDS if meta.get(field)}
+    text_row = {'doc_id': doc_id, **texts} if texts else None
+
+    product_fields = {field: meta.get(field) for field in PRODUCT_FIELDS if meta.get(field) is not None}
+    product_row = None
+    product_id = product_key(product_fields) if product_fields else None
+    if product_id:
+        slim_meta[PRODUCT_ID_KEY] = product_id
+        product_row = {PRODUCT_ID_KEY: product_id, **product_fields}
+    return slim_meta, text_row, product_row
+
+
+def write_side_store(db_path: str, text_rows: Iterable[Dict[str, Any]], product_rows: Iterable[Dict[str, Any]]):
+    """
+    Writes the side store (SQLite) from scratch. The new file is built next to
+    the old one and swapped in atomically, so readers never see a partial store.
+    The loader's document snippets are carried over from the old file.
+    """
+    output_dir = os.path.dirname(db_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        snippet_count = _copy_snippets(conn, db_path)
+        text_columns = ['doc_id'] + SIDE_TEXT_FIELDS
+        conn.executemany(
+            f"INSERT OR REPLACE INTO doc_texts ({', '.join(text_columns)}) VALUES ({', '.join('?' * len(text_columns))})",
+            ([row.get(column) for column in text_columns] for row in text_rows)
+        )
+        product_columns = [PRODUCT_ID_KEY] + PRODUCT_FIELDS
+        conn.executemany(
+            f"INSERT OR REPLACE INTO products ({', '.join(product_columns)}) VALUES ({', '.join('?' * len(product_columns))})",
+            ([row.get(column) for column in product_columns] for row in product_rows)
+        )
+        conn.commit()
+        text_count = conn.execute("SELECT COUNT(*) FROM doc_texts").fetchone()[0]
+        product_count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    logger.info(f"Saved side store to {db_path}: {text_count} document texts, {product_count} products.")
+    if snippet_count:
+        logger.info(f"Kept {snippet_count} document snippets of the previous store (they match the loaded collection); "
+                    "backend/RAG/rag_data_loader.py re-renders them when it loads the new CSV.")
+
+
+def _copy_snippets(conn: sqlite3.Connection, previous_path: str) -> int:
+    """
+    Copies the doc_snippets table that the loader adds to the side store
+    (backend/RAG/side_store.py) from the previous store file, if any, so
+    rewriting the store does not drop it. Returns the number of snippets copied.
+    """
+    if not os.path.exists(previous_path):
+        return 0
+    conn.execute("ATTACH DATABASE ? AS previous", (previous_path,))
+    try:
+        row = conn.execute("SELECT sql FROM previous.sqlite_master WHERE type = 'table' AND name = 'doc_snippets'").fetchone()
+        if row is None:
+            return 0
+        conn.execute(row[0])
+        conn.execute("INSERT INTO main.doc_snippets SELECT * FROM previous.doc_snippets")
+        conn.commit()
+        return conn.execute("SELECT COUNT(*) FROM main.doc_snippets").fetchone()[0]
+    finally:
+        conn.execute("DETACH DATABASE previous")
+
+
+def migrate_prepared_csv(csv_path: str, db_path: str, id_column: str = "chroma_id") -> List[str]:
+    """
+    Converts a ChromaDB-prepared CSV written before the side store existed:
+    moves its side-text and product columns to the side store and rewrites
+    the CSV with slim metadata plus a product_id column.
+
+    Returns:
+        The columns removed from the CSV.
+    """
+    import pandas as pd
+
+    data = pd.read_csv(csv_path, header=0, keep_default_na=False, dtype=str)
+    moved_columns = [col for col in SIDE_TEXT_FIELDS + PRODUCT_FIELDS if col in data.columns]
+    if not moved_columns:
+        logger.info(f"{csv_path} has no side-store columns. Nothing to migrate.")
+        return []
+
+    text_rows, products = [], {}
+    product_ids = []
+    for record in data.to_dict(orient='records'):
+        meta = {col: record[col] for col in moved_columns if record[col] != ''}
+        for numeric_field, cast in (('product_rating_overall', float), ('product_review_count', int)):
+            if numeric_field in meta:
+                try:
+                    meta[numeric_field] = cast(float(meta[numeric_field]))
+                except ValueError:
+                    del meta[numeric_field]
+        slim_meta, text_row, product_row = split_side_fields(record[id_column], meta)
+        if text_row:
+            text_rows.append(text_row)
+        if product_row:
+            products[product_row[PRODUCT_ID_KEY]] = product_row
+        product_ids.append(slim_meta.get(PRODUCT_ID_KEY, ''))
+
+    write_side_store(db_path, text_rows, products.values())
+    data = data.drop(columns=moved_columns)
+    data[PRODUCT_ID_KEY] = product_ids
+    data.to_csv(csv_path, index=False, quoting=1)
+    logger.info(f"Rewrote {csv_path} without columns: {', '.join(moved_columns)}")
+    return moved_columns
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Move side-store columns out of an existing ChromaDB-prepared CSV.")
+    parser.add_argument("csv_path", nargs="?", default=os.path.join("processed_output", "chroma_prepared_final.csv"))
+    parser.add_argument("--db", default=os.path.join("processed_output", "side_store.sqlite3"))
+    args = parser.parse_args()
+    migrate_prepared_csv(args.csv_path, args.db)
@@ -0,0 +1,26 @@
+import json
+
+from jsonl_loader import find_jsonl_segments, iter_jsonl_records
+
+
+def _write(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+
+
+def test_only_the_segments_listed_in_a_manifest_are_read(tmp_path):
+    # 'products': a published run, an older run not yet cleaned up, and a failed run
+    _write(tmp_path / 'products.aaaaaaaa.00000.jsonl', [{'n': 1}])
+    _write(tmp_path / 'products.aaaaaaaa.00001.jsonl', [{'n': 2}])
+    _write(tmp_path / 'products.bbbbbbbb.00000.jsonl', [{'n': 'old'}])
+    _write(tmp_path / 'products.cccccccc.00000.jsonl', [{'n': 'failed'}])
+    _write(tmp_path / 'products.00000.jsonl', [{'n': 'older format'}])
+    (tmp_path / 'products.manifest.json').write_text(json.dumps(
+        {'segments': ['products.aaaaaaaa.00000.jsonl', 'products.aaaaaaaa.00001.jsonl']}), encoding='utf-8')
+    # Stems without a manifest are read as they are
+    _write(tmp_path / 'threads.00000.jsonl', [{'n': 'legacy'}])
+    _write(tmp_path / 'hand_made.jsonl', [{'n': 'manual'}])
+    _write(tmp_path / 'unfinished.dddddddd.00000.jsonl', [{'n': 'never published'}])
+
+    paths = find_jsonl_segments(str(tmp_path))
+
+    assert [record['n'] for record in iter_jsonl_records(paths)] == ['manual', 1, 2, 'legacy']